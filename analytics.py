@@ -0,0 +1,318 @@
+"""Rollups of the collected responses, maintained as rows are persisted.
+
+Every batch the persistence queue writes to the response store is also folded
+into a few small SQLite tables, so the analytics dashboard (dashboard.py)
+never has to download the response sheet:
+
+  pin_scores    per pin code and score bucket: count
+  daily_scores  per day and pin code: count, sum and sum of squares of the score
+  answer_counts per answer (e.g. 'Respiratory Illnesses' = 'Asthma'): count and score sum
+
+Their size grows with pin codes x buckets, days x pin codes and distinct
+answers, not with the number of responses, so queries stay in the
+milliseconds at millions of responses. Wrap a store in RollupStore to keep the
+rollups current, or fold in existing responses with `python analytics.py
+backfill responses.csv`. The queue delivers at least once, so a batch that is
+retried after the store accepted it is counted twice.
+
+    rollups = Rollups('analytics.db')
+    store = RollupStore(create_store('sqlite'), rollups)
+    rollups.pin_distribution('02108')
+    rollups.trend(period='week')
+"""
+import argparse
+import json
+import logging
+import math
+import sqlite3
+import sys
+import threading
+from collections import Counter, defaultdict
+
+from storage import ResponseStore
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_PATH = 'analytics.db'
+# Width of a score histogram bucket, in risk score points
+BUCKET_WIDTH = 1.0
+
+# Answers counted per value; multi-select answers are stored joined with ', '
+ANSWER_FIELDS = (
+    'Respiratory Illnesses', 'Air Quality', 'Exposed to Smoke', 'Mold Concerns', 'Pollution Nearby',
+    'Green Space Visits', 'Air Purification', 'Neighborhood Noise', 'Artificial Light', 'Gender',
+)
+MULTI_SELECT_FIELDS = ('Respiratory Illnesses',)
+
+# SQLite date expressions for the start of each trend period
+PERIODS = {
+    'day': 'day',
+    'week': "date(day, '-6 days', 'weekday 1')",
+    'month': "substr(day, 1, 7) || '-01'",
+}
+
+
+def _answer_values(record, field):
+    value = record.get(field, '')
+    # Exports read with pandas hold blank cells as NaN
+    if value is None or value == '' or (isinstance(value, float) and math.isnan(value)):
+        return []
+    if field in MULTI_SELECT_FIELDS:
+        if isinstance(value, (list, tuple)):
+            return list(value)
+        return [v for v in str(value).split(', ') if v]
+    return [str(value)]
+
+
+class Rollups:
+    def __init__(self, path=ANALYTICS_PATH, bucket_width=BUCKET_WIDTH):
+        self.path = path
+        self.bucket_width = bucket_width
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(
+            'CREATE TABLE IF NOT EXISTS pin_scores ('
+            ' pin_code TEXT, bucket INTEGER, count INTEGER NOT NULL,'
+            ' PRIMARY KEY (pin_code, bucket)) WITHOUT ROWID;'
+            'CREATE TABLE IF NOT EXISTS daily_scores ('
+            ' day TEXT, pin_code TEXT, count INTEGER NOT NULL, sum REAL NOT NULL, sum_squares REAL NOT NULL,'
+            ' PRIMARY KEY (day, pin_code)) WITHOUT ROWID;'
+            'CREATE INDEX IF NOT EXISTS daily_scores_pin_code ON daily_scores (pin_code, day);'
+            'CREATE TABLE IF NOT EXISTS answer_counts ('
+            ' field TEXT, value TEXT, count INTEGER NOT NULL, score_sum REAL NOT NULL,'
+            ' PRIMARY KEY (field, value)) WITHOUT ROWID;'
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);'
+        )
+        stored = self._db.execute("SELECT value FROM meta WHERE key = 'bucket_width'").fetchone()
+        if stored is None:
+            with self._db:
+                self._db.execute("INSERT INTO meta VALUES ('bucket_width', ?)", (json.dumps(bucket_width),))
+        elif json.loads(stored[0]) != bucket_width:
+            raise ValueError(f"{path} was built with bucket_width={json.loads(stored[0])}, not {bucket_width}")
+        self.counters = {'rows': 0, 'batches': 0, 'skipped': 0, 'errors': 0, 'last_error': None}
+
+    def add(self, records):
+        """Fold a batch of response dicts into the rollups, in one transaction."""
+        buckets = Counter()
+        daily = defaultdict(lambda: [0, 0.0, 0.0])
+        answers = defaultdict(lambda: [0, 0.0])
+        skipped = 0
+        for record in records:
+            try:
+                score = float(record['Risk Score'])
+            except (KeyError, TypeError, ValueError):
+                skipped += 1
+                continue
+            if math.isnan(score):
+                skipped += 1
+                continue
+            # Sheets exports drop the leading zero of 02108
+            pin_code = str(record.get('Pin Code', '')).zfill(5)
+            buckets[pin_code, math.floor(score / self.bucket_width)] += 1
+            entry = daily[str(record.get('Timestamp') or '')[:10], pin_code]
+            entry[0] += 1
+            entry[1] += score
+            entry[2] += score * score
+            for field in ANSWER_FIELDS:
+                for value in _answer_values(record, field):
+                    entry = answers[field, value]
+                    entry[0] += 1
+                    entry[1] += score
+
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT INTO pin_scores VALUES (?, ?, ?)'
+                ' ON CONFLICT DO UPDATE SET count = count + excluded.count',
+                [(pin_code, bucket, count) for (pin_code, bucket), count in buckets.items()],
+            )
+            self._db.executemany(
+                'INSERT INTO daily_scores VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT DO UPDATE SET count = count + excluded.count, sum = sum + excluded.sum,'
+                ' sum_squares = sum_squares + excluded.sum_squares',
+                [(day, pin_code, *entry) for (day, pin_code), entry in daily.items()],
+            )
+            self._db.executemany(
+                'INSERT INTO answer_counts VALUES (?, ?, ?, ?)'
+                ' ON CONFLICT DO UPDATE SET count = count + excluded.count, score_sum = score_sum + excluded.score_sum',
+                [(field, value, *entry) for (field, value), entry in answers.items()],
+            )
+            self.counters['rows'] += len(records) - skipped
+            self.counters['batches'] += 1
+            self.counters['skipped'] += skipped
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def total(self):
+        return self._query('SELECT COALESCE(SUM(count), 0) FROM pin_scores')[0][0]
+
+    def pin_codes(self):
+        """Response count and mean score per pin code, most responses first."""
+        rows = self._query(
+            'SELECT pin_code, SUM(count), SUM(sum) FROM daily_scores GROUP BY pin_code ORDER BY 2 DESC, 1'
+        )
+        return [{'pin_code': pin_code, 'count': count, 'mean': total / count} for pin_code, count, total in rows]
+
+    def pin_distribution(self, pin_code=None):
+        """Score histogram and summary for one pin code, or for all responses."""
+        where, params = ('WHERE pin_code = ?', (pin_code,)) if pin_code is not None else ('', ())
+        histogram = self._query(f'SELECT bucket, SUM(count) FROM pin_scores {where} GROUP BY bucket ORDER BY bucket',
+                                params)
+        count, total, squares = self._query(
+            f'SELECT COALESCE(SUM(count), 0), SUM(sum), SUM(sum_squares) FROM daily_scores {where}', params
+        )[0]
+        summary = {'pin_code': pin_code, 'count': count, 'mean': None, 'std': None,
+                   'histogram': [{'low': bucket * self.bucket_width, 'high': (bucket + 1) * self.bucket_width,
+                                  'count': n} for bucket, n in histogram]}
+        if count:
+            mean = total / count
+            summary['mean'] = mean
+            summary['std'] = math.sqrt(max(squares / count - mean * mean, 0.0))
+            for q in (0.5, 0.9):
+                summary[f'p{int(q * 100)}'] = self._quantile(histogram, count, q)
+        return summary
+
+    def _quantile(self, histogram, count, q):
+        # Linear within the bucket holding the q-th response
+        rank = q * count
+        seen = 0
+        for bucket, n in histogram:
+            if seen + n >= rank:
+                return (bucket + (rank - seen) / n) * self.bucket_width
+            seen += n
+        return (histogram[-1][0] + 1) * self.bucket_width
+
+    def trend(self, pin_code=None, period='day', since=None, until=None):
+        """Response count and mean score per day, week (from Monday) or month, oldest first."""
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period {period!r} (expected one of {', '.join(PERIODS)})")
+        clauses, params = [], []
+        if pin_code is not None:
+            clauses.append('pin_code = ?')
+            params.append(pin_code)
+        if since is not None:
+            clauses.append('day >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('day < ?')
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._query(
+            f'SELECT {PERIODS[period]} AS start, SUM(count), SUM(sum) FROM daily_scores {where}'
+            ' GROUP BY start ORDER BY start', params
+        )
+        return [{'period': start, 'count': count, 'mean': total / count} for start, count, total in rows]
+
+    def answers(self, field=None):
+        """Count and mean score per answer value, by field, most common first."""
+        where, params = ('WHERE field = ?', (field,)) if field is not None else ('', ())
+        rows = self._query(f'SELECT field, value, count, score_sum FROM answer_counts {where}'
+                           ' ORDER BY field, count DESC, value', params)
+        result = defaultdict(list)
+        for name, value, count, score_sum in rows:
+            result[name].append({'value': value, 'count': count, 'mean': score_sum / count})
+        return dict(result)
+
+    def stats(self):
+        return dict(self.counters, total=self.total())
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.executescript('DELETE FROM pin_scores; DELETE FROM daily_scores; DELETE FROM answer_counts;')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class RollupStore(ResponseStore):
+    """A response store that also folds every appended batch into rollups."""
+
+    def __init__(self, store, rollups):
+        self.store = store
+        self.rollups = rollups
+
+    def append(self, rows):
+        self.store.append(rows)
+        # Only rows the store accepted are counted; a rollup failure must not make the queue resend them
+        try:
+            self.rollups.add(rows)
+        except Exception as e:
+            self.rollups.counters['errors'] += 1
+            self.rollups.counters['last_error'] = str(e)
+            logger.warning('Updating the analytics rollups failed for %d rows: %s', len(rows), e)
+
+    def records(self, pin_code=None, since=None, until=None):
+        return self.store.records(pin_code, since, until)
+
+    def count(self):
+        return self.store.count()
+
+    def close(self):
+        self.store.close()
+        self.rollups.close()
+
+
+def backfill(rollups, chunks):
+    """Fold existing responses (an iterable of DataFrames) into the rollups; returns the row count."""
+    rows = 0
+    for frame in chunks:
+        records = frame.to_dict('records')
+        rollups.add(records)
+        rows += len(records)
+    return rows
+
+
+def _sqlite_chunks(path, chunk_size):
+    import pandas as pd
+
+    db = sqlite3.connect(path)
+    try:
+        cursor = db.execute('SELECT data FROM responses ORDER BY id')
+        while True:
+            batch = cursor.fetchmany(chunk_size)
+            if not batch:
+                return
+            yield pd.DataFrame([json.loads(data) for data, in batch])
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=ANALYTICS_PATH, help='Rollup database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    fill = commands.add_parser('backfill', help='Rebuild the rollups from a response export or SQLite store')
+    fill.add_argument('source', help='.csv/.xlsx/.parquet export of the response sheet, or a responses .db')
+    fill.add_argument('--chunk-size', type=int, default=50000)
+    report = commands.add_parser('report', help='Print the rollups as JSON')
+    report.add_argument('--pin-code')
+    report.add_argument('--period', choices=list(PERIODS), default='week')
+    args = parser.parse_args(argv)
+
+    rollups = Rollups(args.db)
+    try:
+        if args.command == 'backfill':
+            if args.source.endswith('.db'):
+                chunks = _sqlite_chunks(args.source, args.chunk_size)
+            else:
+                from batch_score import read_chunks
+                chunks = read_chunks(args.source, args.chunk_size)
+            rollups.clear()
+            rows = backfill(rollups, chunks)
+            print(f"Folded {rows} responses into {args.db}", file=sys.stderr)
+        else:
+            print(json.dumps({
+                'distribution': rollups.pin_distribution(args.pin_code),
+                'trend': rollups.trend(args.pin_code, args.period),
+                'answers': rollups.answers(),
+            }, indent=2))
+    finally:
+        rollups.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
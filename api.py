@@ -0,0 +1,300 @@
+"""Headless HTTP/JSON scoring API, next to the Streamlit UI.
+
+Uses the same feature store, model registry, weather client and response
+storage as app.py, configured from the same .streamlit/secrets.toml.
+
+    python api.py --port 8080
+
+    POST /score        {"pin_code": "02108", "answers": {"Age": 34, ...}}
+                       or {"latitude": 42.357, "longitude": -71.064, "answers": {...}}
+    POST /score/batch  {"requests": [{"pin_code": ..., "answers": ...}, ...]}
+    POST /scenarios    {"pin_codes": ["02108"], "axes": {"Traffic Density": [-0.2, 0, 0.2], ...},
+                        "temperature": 293, "humidity": 60, "relative": true}
+    GET  /health
+    GET  /metrics
+    GET  /metrics/prometheus   per-stage latency histograms ([tracing] enabled = true)
+
+Answer keys are the response sheet columns (risk_pipeline.ANSWER_FIELDS);
+missing answers are stored empty, and unknown or invalid ones get a 400. A
+response carries the risk score, the live temperature and humidity, and the
+static factor breakdown. A location is scored as the zip code with the
+nearest centroid, up to feature_store.MAX_DISTANCE_KM away. A weather service
+error gets a 502, or a 503 when the service cannot be reached.
+
+POST /scenarios scores every combination of the axis values (see
+scenarios.py) and returns the scores as nested lists, one level per axis after
+the zip. Without temperature and humidity the static factors are used.
+
+A POST /score with an Idempotency-Key header is idempotent: repeating it with
+the same key and body within the cache TTL returns the first result with
+"repeated": true, and stores nothing again.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import tomllib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from aiohttp import web
+
+from analytics import ANALYTICS_PATH, Rollups, RollupStore
+from feature_store import ZIP_FEATURES_PATH, FeatureStore
+from idempotency import IdempotencyCache
+from model_registry import ModelRegistry
+from numpy_model import ARTIFACT_PATH
+from persistence_queue import PersistenceQueue
+from risk_pipeline import PipelineError, RiskPipeline, clean_answers
+from scenarios import ScenarioEngine
+from shared_cache import create_score_cache, create_shared_cache
+from sheets_client import SheetsConnection
+from storage import create_store
+from tracing import tracer
+from weather import WEATHER_API_URL, WeatherClient, WeatherError
+from weather_prefetch import WeatherPrefetcher
+
+logger = logging.getLogger(__name__)
+
+SECRETS_PATH = os.path.join('.streamlit', 'secrets.toml')
+SPREADSHEET_ID = '1M3_j3bBKjIXEY1MAtg9NHLcHBXftfrpLTt7vGhjUHrQ'
+# Separate from the app's queue, so two processes never flush the same rows
+API_QUEUE_PATH = 'pending_responses_api.db'
+MAX_BATCH = 1000
+# Scores per POST /scenarios response; the JSON grows ~20 bytes per score
+MAX_SCENARIO_SCORES = 200_000
+
+PIPELINE_KEY = web.AppKey('pipeline', RiskPipeline)
+COMPONENTS_KEY = web.AppKey('components', dict)
+EXECUTOR_KEY = web.AppKey('executor', ThreadPoolExecutor)
+
+
+def load_secrets(path=SECRETS_PATH):
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+
+def build_components(secrets):
+    """The shared services, built from the app's secrets."""
+    feature_store = FeatureStore.load(secrets.get('zip_features_path', ZIP_FEATURES_PATH))
+    # Build the nearest-zip index now rather than on the first location request
+    feature_store.spatial_index
+    backend = secrets.get('model_backend', 'numpy')
+    if 'model_version' in secrets:
+        registry = ModelRegistry.for_version(secrets['model_version'], backend=backend)
+    else:
+        registry = ModelRegistry(backend=backend, artifact_path=secrets.get('model_artifact', ARTIFACT_PATH))
+    # Weather and scores shared with the app and other API replicas, see shared_cache.py
+    shared_cache = create_shared_cache(secrets.get('shared_cache', {}))
+    weather_config = secrets['openweathermap']
+    weather_client = WeatherClient(weather_config['api_key'], weather_config.get('api_url', WEATHER_API_URL),
+                                   shared_cache=shared_cache, **secrets.get('weather', {}))
+    prefetcher = WeatherPrefetcher(weather_client, feature_store.locations(),
+                                   **secrets.get('weather_prefetch', {})).start()
+
+    storage_options = dict(secrets.get('storage', {}))
+    backend = storage_options.pop('backend', 'sheets')
+    connection = SheetsConnection(secrets['gcp_service_account']) if backend == 'sheets' else None
+    store = create_store(backend, connection=connection, spreadsheet_id=SPREADSHEET_ID, **storage_options)
+    # The same rollups as the app, so dashboard.py sees responses from both
+    analytics_config = secrets.get('analytics', {})
+    rollups = None
+    if analytics_config.get('enabled', True):
+        rollups = Rollups(analytics_config.get('path', ANALYTICS_PATH))
+        store = RollupStore(store, rollups)
+    queue_options = dict(secrets.get('persistence', {}), path=secrets.get('api_queue_path', API_QUEUE_PATH))
+    queue = PersistenceQueue(store, **queue_options).start()
+    return {
+        'feature_store': feature_store,
+        'model_registry': registry,
+        'weather_client': weather_client,
+        'weather_prefetcher': prefetcher,
+        'sheets_connection': connection,
+        'persistence_queue': queue,
+        'analytics': rollups,
+        'idempotency_cache': IdempotencyCache(**secrets.get('idempotency', {})),
+        'shared_cache': shared_cache,
+        'score_cache': create_score_cache(shared_cache, secrets.get('shared_cache', {})),
+        'scenario_engine': ScenarioEngine(feature_store, registry.get, **secrets.get('scenarios', {})),
+    }
+
+
+def build_pipeline(components):
+    return RiskPipeline(
+        components['feature_store'],
+        components['model_registry'].get,
+        components['weather_prefetcher'].lookup,
+        persist=components['persistence_queue'].put,
+        idempotency=components['idempotency_cache'],
+        score_cache=components.get('score_cache'),
+    )
+
+
+def _error(exc_class, message):
+    return exc_class(text=json.dumps({'error': message}), content_type='application/json')
+
+
+def _public(result):
+    return {k: v for k, v in result.items() if k not in ('record', 'persist_error')}
+
+
+def _submission(body, pipeline):
+    if not isinstance(body, dict):
+        raise _error(web.HTTPBadRequest, 'expected an object')
+    answers = body.get('answers') or {}
+    if not isinstance(answers, dict):
+        raise _error(web.HTTPBadRequest, 'answers must be an object')
+    try:
+        answers = clean_answers(answers)
+    except PipelineError as e:
+        raise _error(web.HTTPBadRequest, str(e))
+    if isinstance(body.get('pin_code'), str):
+        return body['pin_code'], answers
+    latitude, longitude = body.get('latitude'), body.get('longitude')
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (latitude, longitude)):
+        raise _error(web.HTTPBadRequest, 'expected {"pin_code": str} or {"latitude": num, "longitude": num}')
+    if not (math.isfinite(latitude) and -90 <= latitude <= 90):
+        raise _error(web.HTTPBadRequest, 'latitude must be between -90 and 90')
+    if not (math.isfinite(longitude) and -180 <= longitude <= 180):
+        raise _error(web.HTTPBadRequest, 'longitude must be between -180 and 180')
+    try:
+        return pipeline.resolve_location(latitude, longitude), answers
+    except PipelineError as e:
+        raise _error(web.HTTPUnprocessableEntity, str(e))
+
+
+async def _json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise _error(web.HTTPBadRequest, 'invalid JSON')
+
+
+async def _run(request, func, *args):
+    # The pipeline blocks on weather misses and SQLite, so keep it off the event loop
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(request.app[EXECUTOR_KEY], func, *args)
+    except PipelineError as e:
+        raise _error(web.HTTPUnprocessableEntity, str(e))
+    except WeatherError as e:
+        raise _error(web.HTTPBadGateway, f'weather service error: {e}')
+    except requests.RequestException as e:
+        raise _error(web.HTTPServiceUnavailable, f'weather service unavailable: {e}')
+
+
+async def score(request):
+    pin_code, answers = _submission(await _json_body(request), request.app[PIPELINE_KEY])
+    result = await _run(request, request.app[PIPELINE_KEY].assess, pin_code, answers,
+                        request.headers.get('Idempotency-Key'))
+    return web.json_response(_public(result))
+
+
+async def score_batch(request):
+    body = await _json_body(request)
+    items = body.get('requests') if isinstance(body, dict) else None
+    if not isinstance(items, list) or len(items) > MAX_BATCH:
+        raise _error(web.HTTPBadRequest, f'expected {{"requests": [...]}} with at most {MAX_BATCH} items')
+    submissions = [_submission(item, request.app[PIPELINE_KEY]) for item in items]
+    results = await _run(request, request.app[PIPELINE_KEY].assess_many, submissions)
+    return web.json_response({'results': [_public(r) for r in results]})
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _scenario_surface(engine, body):
+    if not isinstance(body, dict):
+        raise _error(web.HTTPBadRequest, 'expected an object')
+    pin_codes = body.get('pin_codes', [body['pin_code']] if 'pin_code' in body else None)
+    axes = body.get('axes')
+    # Flat lists of numbers only: nested lists would be flattened later and slip past the limit below
+    if (not isinstance(pin_codes, list) or not all(isinstance(p, str) for p in pin_codes)
+            or not isinstance(axes, dict)
+            or not all(isinstance(v, list) and all(_is_number(x) for x in v) for v in axes.values())):
+        raise _error(web.HTTPBadRequest, 'expected {"pin_codes": [str], "axes": {name: [num, ...]}}')
+    relative = body.get('relative', True)
+    if not isinstance(relative, bool):
+        raise _error(web.HTTPBadRequest, 'relative must be true or false')
+    scores = len(pin_codes)
+    for values in axes.values():
+        scores *= len(values)
+    if scores > MAX_SCENARIO_SCORES:
+        raise _error(web.HTTPBadRequest, f'{scores} scenarios requested; the limit is {MAX_SCENARIO_SCORES}')
+    try:
+        return engine.surface(pin_codes, axes, body.get('temperature'), body.get('humidity'),
+                              relative).to_dict()
+    except (KeyError, TypeError, ValueError) as e:
+        raise _error(web.HTTPUnprocessableEntity, str(e.args[0] if isinstance(e, KeyError) else e))
+
+
+async def scenarios(request):
+    engine = request.app[COMPONENTS_KEY].get('scenario_engine')
+    if engine is None:
+        raise _error(web.HTTPNotFound, 'scenarios are not enabled')
+    body = await _json_body(request)
+    return web.json_response(await _run(request, _scenario_surface, engine, body))
+
+
+async def health(request):
+    return web.json_response({'status': 'ok'})
+
+
+async def metrics(request):
+    stats = {}
+    for name, component in request.app[COMPONENTS_KEY].items():
+        if hasattr(component, 'stats'):
+            stats[name] = component.stats() if callable(component.stats) else component.stats
+    return web.json_response(stats)
+
+
+async def prometheus_metrics(request):
+    return web.Response(text=tracer.prometheus(), content_type='text/plain', charset='utf-8')
+
+
+def create_app(pipeline, components=None, workers=32):
+    app = web.Application(client_max_size=4 * 2**20)
+    app[PIPELINE_KEY] = pipeline
+    app[COMPONENTS_KEY] = components or {}
+    app[EXECUTOR_KEY] = ThreadPoolExecutor(workers, thread_name_prefix='api-pipeline')
+    app.router.add_post('/score', score)
+    app.router.add_post('/score/batch', score_batch)
+    app.router.add_post('/scenarios', scenarios)
+    app.router.add_get('/health', health)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/metrics/prometheus', prometheus_metrics)
+
+    async def shutdown(app):
+        app[EXECUTOR_KEY].shutdown(wait=True)
+        for component in app[COMPONENTS_KEY].values():
+            if hasattr(component, 'stop'):
+                component.stop()
+
+    app.on_shutdown.append(shutdown)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--secrets', default=SECRETS_PATH, help='Streamlit secrets file to read the config from')
+    parser.add_argument('--workers', type=int, default=32, help='Threads running the scoring pipeline')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    secrets = load_secrets(args.secrets)
+    if secrets.get('tracing', {}).get('enabled'):
+        tracer.enable()
+    components = build_components(secrets)
+    web.run_app(create_app(build_pipeline(components), components, args.workers),
+                host=args.host, port=args.port, access_log=None)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
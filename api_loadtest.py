@@ -0,0 +1,166 @@
+"""Load test of the HTTP scoring API against local stand-ins.
+
+Starts the API in a child process, with StubWeatherServer in place of
+OpenWeatherMap and an in-memory FakeSheet behind the persistence queue,
+then drives POST /score (or /score/batch) from many concurrent connections
+and reports throughput and latency percentiles.
+
+    python api_loadtest.py --requests 20000 --concurrency 64
+    python api_loadtest.py --batch-size 50 --min-rps 2000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SAMPLE_ANSWERS = {
+    'Age': 42, 'Gender': 'Female', 'Years Residence': 6, 'Respiratory Illnesses': ['Asthma'],
+    'Healthcare Visits': 1, 'Air Quality': 'Moderate', 'Exposed to Smoke': 'No', 'Mold Concerns': 'No',
+    'Pollution Nearby': 'Yes', 'Green Space Visits': '1-2 times per week', 'Air Purification': 'No',
+    'Neighborhood Noise': 'Yes', 'Artificial Light': 'No',
+}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _serve(port, weather_latency, sheet_latency, queue_path, workers):
+    from aiohttp import web
+
+    import api
+    from feature_store import FeatureStore
+    from model_registry import ModelRegistry
+    from persistence_queue import PersistenceQueue
+    from storage import create_store
+    from stubs import FakeSheet, StubWeatherServer
+    from weather import WeatherClient
+    from weather_prefetch import WeatherPrefetcher
+
+    weather_server = StubWeatherServer(latency=weather_latency).start()
+    feature_store = FeatureStore.load()
+    weather_client = WeatherClient('load-test', api_url=weather_server.url)
+    components = {
+        'feature_store': feature_store,
+        'model_registry': ModelRegistry(),
+        'weather_client': weather_client,
+        'weather_prefetcher': WeatherPrefetcher(weather_client, feature_store.locations()).start(),
+        'persistence_queue': PersistenceQueue(create_store('sheets', sheet=FakeSheet(latency=sheet_latency)),
+                                              path=queue_path).start(),
+    }
+    web.run_app(api.create_app(api.build_pipeline(components), components, workers),
+                host='127.0.0.1', port=port, access_log=None, print=None)
+
+
+async def _drive(url, total, concurrency, batch_size, zips):
+    import aiohttp
+
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    def body():
+        if batch_size:
+            return {'requests': [{'pin_code': random.choice(zips), 'answers': SAMPLE_ANSWERS}
+                                 for _ in range(batch_size)]}
+        return {'pin_code': random.choice(zips), 'answers': SAMPLE_ANSWERS}
+
+    async def worker(session):
+        nonlocal errors
+        for _ in counter:
+            payload = json.dumps(body())
+            start = time.perf_counter()
+            async with session.post(url, data=payload, headers={'Content-Type': 'application/json'}) as response:
+                await response.read()
+                if response.status != 200:
+                    errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return np.asarray(latencies) * 1000.0, errors, elapsed
+
+
+async def _wait_ready(base_url, timeout=30):
+    import aiohttp
+
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f'{base_url}/health') as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError('API did not become ready')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000, help='HTTP requests to send')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=0, help='Use /score/batch with this many submissions each')
+    parser.add_argument('--weather-latency', type=float, default=0.05, help='Seconds per stub weather call')
+    parser.add_argument('--sheet-latency', type=float, default=0.2, help='Seconds per fake sheet call')
+    parser.add_argument('--workers', type=int, default=32, help='API pipeline threads')
+    parser.add_argument('--min-rps', type=float, help='Exit non-zero below this many scored submissions/s')
+    args = parser.parse_args(argv)
+
+    from feature_store import FeatureStore
+    zips = list(FeatureStore.load().zips)
+
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    with tempfile.TemporaryDirectory() as tmp:
+        server = multiprocessing.Process(
+            target=_serve, daemon=True,
+            args=(port, args.weather_latency, args.sheet_latency, os.path.join(tmp, 'queue.db'), args.workers),
+        )
+        server.start()
+        try:
+            asyncio.run(_wait_ready(base_url))
+            path = '/score/batch' if args.batch_size else '/score'
+            # Warm up connections and the weather cache before measuring
+            asyncio.run(_drive(base_url + path, min(500, args.requests), args.concurrency, args.batch_size, zips))
+            latencies, errors, elapsed = asyncio.run(
+                _drive(base_url + path, args.requests, args.concurrency, args.batch_size, zips))
+        finally:
+            server.terminate()
+            server.join()
+
+    submissions = args.requests * (args.batch_size or 1)
+    rps = submissions / elapsed
+    print(json.dumps({
+        'endpoint': path,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'batch_size': args.batch_size or 1,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(args.requests / elapsed, 1),
+        'submissions_per_second': round(rps, 1),
+        'latency_ms': {f'p{p}': round(float(np.percentile(latencies, p)), 3) for p in (50, 95, 99)},
+    }, indent=2))
+    if args.min_rps is not None and rps < args.min_rps:
+        print(f'FAIL: {rps:.0f} submissions/s is below --min-rps {args.min_rps:g}', file=sys.stderr)
+        return 1
+    return 0 if not errors else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,11 @@
+import time
+
 import streamlit as st
-import numpy as np
-import pickle
-from tensorflow.keras.models import load_model
-import gspread
-from google.oauth2.service_account import Credentials
-from datetime import datetime
-import requests
+
+from startup import Startup
+from tracing import tracer
+
+script_started = time.perf_counter()
 
 # Define the scope
 scope = [
@@ -13,76 +13,169 @@ scope = [
     'https://www.googleapis.com/auth/drive'
 ]
 
-# Load credentials from the Streamlit secrets
-credentials = Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"],
-    scopes=scope
-)
-
-# Authorize the client
-client = gspread.authorize(credentials)
-
-# Open the Google Sheet
+# The Google Sheet
 spreadsheet_id = '1M3_j3bBKjIXEY1MAtg9NHLcHBXftfrpLTt7vGhjUHrQ'
-sheet = client.open_by_key(spreadsheet_id).sheet1
-
-# Define OpenWeatherMap API details
-OPENWEATHERMAP_API_KEY = st.secrets["openweathermap"]["api_key"]
-WEATHER_API_URL = "https://api.openweathermap.org/data/2.5/weather"
-
-# Load the pre-trained model and scaler
-try:
-    model = load_model('risk_score_model.h5')
-    with open('scaler.pkl', 'rb') as f:
-        scaler = pickle.load(f)
-except Exception as e:
-    st.write(f"Error loading model or scaler: {e}")
-    
-def get_weather_data(lat, lon):
-    params = {
-        'lat': lat,
-        'lon': lon,
-        'appid': OPENWEATHERMAP_API_KEY
-    }
-    response = requests.get(WEATHER_API_URL, params=params)
-    data = response.json()
-    if response.status_code == 200:
-        return data
-    else:
-        st.write(f"Error fetching weather data: {data.get('message', 'Unknown error')}")
-        return None
 
-# Predefined environmental factors for 10 Boston pin codes (dummy data)
-pin_code_data = {
-    '02108': [80, 70, 40, 60, 50, 90, 55, 65, 70, 85, 75, 60],
-    '02109': [85, 75, 45, 65, 55, 85, 50, 60, 65, 80, 70, 55],
-    '02110': [90, 80, 50, 70, 60, 80, 45, 55, 60, 75, 65, 50],
-    '02111': [75, 65, 35, 55, 45, 95, 60, 70, 75, 90, 80, 65],
-    '02112': [82, 72, 42, 62, 52, 87, 57, 67, 72, 87, 77, 62],
-    '02113': [88, 78, 48, 68, 58, 83, 53, 63, 68, 83, 73, 58],
-    '02114': [78, 68, 38, 58, 48, 93, 63, 73, 78, 93, 83, 68],
-    '02115': [92, 82, 52, 72, 62, 77, 47, 57, 62, 77, 67, 52],
-    '02116': [90, 95, 30, 89, 20, 84, 10,  5, 30, 97, 91, 18],  # low risk example
-    '02117': [18, 14, 70, 30, 90, 23, 87, 79, 90, 26,  5, 98]  # high risk example
-}
-
-boston_zip_coords = {
-    "02108": {"latitude": 42.3571, "longitude": -71.0636},
-    "02109": {"latitude": 42.3611, "longitude": -71.0552},
-    "02110": {"latitude": 42.3576, "longitude": -71.0533},
-    "02111": {"latitude": 42.3497, "longitude": -71.0603},
-    "02112": {"latitude": 42.3601, "longitude": -71.0589}, 
-    "02113": {"latitude": 42.3663, "longitude": -71.0544},
-    "02114": {"latitude": 42.3614, "longitude": -71.0677},
-    "02115": {"latitude": 42.3433, "longitude": -71.0927},
-    "02116": {"latitude": 42.3496, "longitude": -71.0776},
-    "02117": {"latitude": 42.3610, "longitude": -71.0580}   
-}
+# Per-stage latency tracing, off by default. Enable with [tracing] enabled = true in secrets;
+# add port to also serve the histograms in the Prometheus text format at :port/metrics.
+tracing_config = st.secrets.get("tracing", {})
+if tracing_config.get("enabled"):
+    tracer.enable()
+    if "port" in tracing_config:
+        tracer.serve(tracing_config["port"], tracing_config.get("host", "127.0.0.1"))
+
+# The services below are built once per process by background threads (see startup.py), so the
+# landing page renders without waiting for NumPy, TensorFlow, gspread or the model. Each builder
+# imports what it needs and asks the startup for the services it depends on.
+
+# Credentials, the gspread client and the worksheet handle are created on first use
+# and shared by all sessions; the access token is refreshed ahead of expiry.
+def build_sheets_connection(startup):
+    from sheets_client import SheetsConnection
+    return SheetsConnection(startup.config["gcp_service_account"], scopes=scope)
+
+# Where responses are stored: the Google Sheet by default, or a local SQLite database
+# with [storage] backend = "sqlite" (and optionally path) in secrets.
+# Every stored batch also updates the rollups behind dashboard.py; configure them with
+# [analytics] path, or turn them off with [analytics] enabled = false.
+def build_response_store(startup):
+    from storage import create_store
+    options = dict(startup.config.get("storage", {}))
+    backend = options.pop("backend", "sheets")
+    connection = startup.result("sheets_connection") if backend == "sheets" else None
+    store = create_store(backend, connection=connection, spreadsheet_id=spreadsheet_id, **options)
+    analytics_config = startup.config.get("analytics", {})
+    if not analytics_config.get("enabled", True):
+        return store
+    from analytics import ANALYTICS_PATH, Rollups, RollupStore
+    return RollupStore(store, Rollups(analytics_config.get("path", ANALYTICS_PATH)))
+
+# Responses are queued locally and written to the store in bulk by a background thread.
+# Tune with a [persistence] section in secrets: path, batch_size, flush_interval, max_backoff.
+def build_persistence_queue(startup):
+    from persistence_queue import PersistenceQueue
+    return PersistenceQueue(startup.result("response_store"), **startup.config.get("persistence", {})).start()
+
+# Environmental factors and centroids per pin code, loaded once into a read-only table
+def build_feature_store(startup):
+    from feature_store import ZIP_FEATURES_PATH, FeatureStore
+    return FeatureStore.load(startup.config.get("zip_features_path", ZIP_FEATURES_PATH))
+
+# Load the pre-trained model and scaler once per process, shared by all sessions.
+# The NumPy predictor is the default; set model_backend = "keras" in secrets to serve through TensorFlow.
+# Set model_version = "<version>" (or "latest") to serve a version trained by train.py, or
+# model_artifact = "<path>" to serve a quantized/pruned artifact written by optimize.py.
+def build_model_registry(startup):
+    from model_registry import ModelRegistry
+    backend = startup.config.get("model_backend", "numpy")
+    if "model_version" in startup.config:
+        return ModelRegistry.for_version(startup.config["model_version"], backend=backend)
+    return ModelRegistry('risk_score_model.h5', 'scaler.pkl', backend=backend,
+                         artifact_path=startup.config.get("model_artifact", 'risk_score_model.npz'))
+
+# Predictions from all sessions are micro-batched into one vectorized call.
+# Tune with a [scoring] section in secrets: max_batch_size, max_wait_ms, max_queue_depth.
+def build_scoring_service(startup):
+    from scoring_service import ScoringService
+    return ScoringService(startup.result("model_registry").get, **startup.config.get("scoring", {}))
+
+# With several replicas, a [shared_cache] section in secrets (backend = "redis" with url, or
+# "mmap" with path) lets them share fetched weather and computed scores; see shared_cache.py.
+def build_shared_cache(startup):
+    from shared_cache import create_shared_cache
+    return create_shared_cache(startup.config.get("shared_cache", {}))
+
+def build_score_cache(startup):
+    from shared_cache import create_score_cache
+    return create_score_cache(startup.result("shared_cache"), startup.config.get("shared_cache", {}))
+
+# Weather lookups are cached and shared across sessions.
+# Tune with a [weather] section in secrets: ttl, stale_ttl, precision, read_timeout, shared_ttl, ...
+def build_weather_client(startup):
+    from weather import WEATHER_API_URL, WeatherClient
+    config = startup.config["openweathermap"]
+    return WeatherClient(config["api_key"], config.get("api_url", WEATHER_API_URL),
+                         shared_cache=startup.result("shared_cache"), **startup.config.get("weather", {}))
+
+# Weather for every known pin code is refreshed in the background, so a click normally
+# reads a prefetched snapshot. Tune with a [weather_prefetch] section: interval, max_workers, retry_delay, max_backoff.
+def build_weather_prefetcher(startup):
+    from weather_prefetch import WeatherPrefetcher
+    return WeatherPrefetcher(startup.result("weather_client"), startup.result("feature_store").locations(),
+                             **startup.config.get("weather_prefetch", {})).start()
+
+# Repeated submissions (reruns, double clicks) from a session return the first result instead of
+# being scored and stored again. Tune with an [idempotency] section in secrets: ttl, max_entries.
+def build_idempotency_cache(startup):
+    from idempotency import IdempotencyCache
+    return IdempotencyCache(**startup.config.get("idempotency", {}))
+
+# Built in the background once the first page is out (see the end of this script); set
+# [startup] background = false to build everything before the first page instead. Services
+# that failed to build are reported above the Calculate button and built again on a later
+# run, at most every [startup] retry_interval seconds (default 30).
+@st.cache_resource
+def get_startup():
+    config = st.secrets.to_dict()
+    startup = Startup(config, background=config.get("startup", {}).get("background", True))
+    startup.add("feature_store", build_feature_store)
+    startup.add("model_registry", build_model_registry)
+    startup.add("scoring_service", build_scoring_service)
+    startup.add("shared_cache", build_shared_cache)
+    startup.add("score_cache", build_score_cache)
+    startup.add("weather_client", build_weather_client)
+    startup.add("weather_prefetcher", build_weather_prefetcher)
+    startup.add("sheets_connection", build_sheets_connection)
+    startup.add("response_store", build_response_store)
+    startup.add("persistence_queue", build_persistence_queue)
+    startup.add("idempotency_cache", build_idempotency_cache)
+    return startup if startup.background else startup.start()
+
+startup = get_startup()
+startup.retry_failed(startup.config.get("startup", {}).get("retry_interval", 30))
+
+def get_feature_store():
+    return startup.result("feature_store")
+
+def get_model_registry():
+    return startup.result("model_registry")
+
+def get_scoring_service():
+    return startup.result("scoring_service")
+
+def get_weather_client():
+    return startup.result("weather_client")
+
+def get_weather_prefetcher():
+    return startup.result("weather_prefetcher")
+
+def get_persistence_queue():
+    return startup.result("persistence_queue")
+
+def get_idempotency_cache():
+    return startup.result("idempotency_cache")
+
+def get_score_cache():
+    return startup.result("score_cache")
+
+def get_weather_data(lat, lon, pin_code=None):
+    try:
+        if pin_code is not None:
+            return get_weather_prefetcher().lookup(pin_code, lat, lon)
+        return get_weather_client().get(lat, lon)
+    except Exception as e:
+        st.write(f"Error fetching weather data: {e}")
+        return None
 
 # Page navigation handling
 if 'page' not in st.session_state:
     st.session_state.page = 'landing'
 
+# Identifies this browser session's submissions, see build_idempotency_cache
+if 'session_id' not in st.session_state:
+    import uuid
+    st.session_state.session_id = uuid.uuid4().hex
+
 if st.session_state.page == 'landing':
     st.title('Welcome to the Boston Health Risk Score Predictor')
     st.write("""
@@ -106,12 +199,14 @@ if st.session_state.page == 'landing':
         st.session_state.page = 'main'
 
 elif st.session_state.page == 'main':
+    feature_store = get_feature_store()
+
     # Streamlit interface
     st.title('Boston Health Risk Score Predictor')
 
     # Pin code selection
     st.subheader('Enter your Boston pin code:')
-    pin_code = st.selectbox('Select your pin code:', list(pin_code_data.keys()))
+    pin_code = st.selectbox('Select your pin code:', list(feature_store.zips))
 
     # Demographic Information
     st.subheader('Demographic Information')
@@ -195,43 +290,29 @@ elif st.session_state.page == 'main':
     environmental_issue = st.text_area('16. In your opinion, what is the most significant environmental issue affecting your health?', key='environmental_issue')
     additional_comments = st.text_area('17. Any additional comments or concerns regarding your health and environment?', key='additional_comments')
 
+    # Readiness of the services behind the button; a click waits for any still loading
+    services = startup.status()['services']
+    for name, service in services.items():
+        if service['state'] == 'failed':
+            st.write(f"Error loading {name.replace('_', ' ')}: {service['error']}")
+    loading = [name.replace('_', ' ') for name, service in services.items() if service['state'] in ('pending', 'loading')]
+    if loading:
+        st.caption(f"Still loading: {', '.join(loading)}")
+
     # Calculate the risk score
     if st.button('Calculate Risk Score'):
         try:
-            lat = boston_zip_coords[pin_code]["latitude"]
-            lon = boston_zip_coords[pin_code]["longitude"]
-            
-            weather_data = get_weather_data(lat , lon)
-            
-            temperature = weather_data['main']['temp']
-            humidity = weather_data['main']['humidity']
-            
-            # Get the environmental factors based on pin code
-            env_factors = pin_code_data[pin_code]
-            
-            env_factors[4] = temperature - 250
-            env_factors[1] = humidity
-
-            # Standardize the environmental factors
-            env_factors_scaled = scaler.transform([env_factors])
-
-            # Predict the base risk score
-            base_risk_score = model.predict(env_factors_scaled)[0][0]
-
-            # Convert to native Python float
-            final_risk_score = float(base_risk_score)
-
-            # Collect all the inputs into a dictionary
-            data = {
-                'Timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'Pin Code': pin_code,
-                'Age': int(age),
+            from risk_pipeline import RiskPipeline
+
+            # Collect all the answers into a dictionary
+            answers = {
+                'Age': age,
                 'Gender': gender,
-                'Years Residence': int(years_residence),
-                'Respiratory Illnesses': ', '.join(respiratory_illnesses),
+                'Years Residence': years_residence,
+                'Respiratory Illnesses': respiratory_illnesses,
                 'Other Respiratory Illness': other_respiratory_illness,
                 'Chronic Conditions': chronic_conditions,
-                'Healthcare Visits': int(healthcare_visits),
+                'Healthcare Visits': healthcare_visits,
                 'Air Quality': air_quality,
                 'Exposed to Smoke': exposed_to_smoke,
                 'Smoke Frequency': smoke_frequency,
@@ -248,45 +329,57 @@ elif st.session_state.page == 'main':
                 'Light Description': light_description,
                 'Environmental Issue': environmental_issue,
                 'Additional Comments': additional_comments,
-                'CURRENT TEMPERATURE (degrees C)': temperature-273,
-                'CURRENT HUMIDITY (%)': humidity,
-                'Risk Score': final_risk_score
             }
 
-            # Convert any NumPy data types to native Python types
-            for key, value in data.items():
-                if isinstance(value, np.generic):
-                    data[key] = value.item()
-
-            # Append data to Google Sheet
-            try:
-                # Check if the sheet is empty
-                if len(sheet.get_all_records()) == 0:
-                    # Write the header row
-                    sheet.append_row(list(data.keys()))
-
-                # Append the data
-                sheet.append_row(list(data.values()))
-            except Exception as e:
-                st.write(f"Error saving data to Google Sheet: {e}")
-                
+            # Weather lookup, scoring (micro-batched across sessions) and queueing the response
+            scoring_service = get_scoring_service()
+            risk_pipeline = RiskPipeline(
+                feature_store,
+                get_model_registry().get,
+                lambda pin, lat, lon: get_weather_data(lat, lon, pin),
+                persist=get_persistence_queue().put,
+                score=lambda pin, temperature, humidity: scoring_service.score(
+                    feature_store.features(pin, temperature, humidity), timeout=10),
+                idempotency=get_idempotency_cache(),
+                score_cache=get_score_cache(),
+            )
+            result = risk_pipeline.assess(pin_code, answers, st.session_state.session_id)
+            final_risk_score = result['risk_score']
+
+            if result['persist_error']:
+                st.write(f"Error saving data to Google Sheet: {result['persist_error']}")
+            if result['repeated']:
+                st.caption("You already submitted these answers; showing your earlier result.")
+
             # Display the environmental factors
-            temperature_C = round(temperature - 273.15, 2)
             st.write("### Environmental Factors")
-            st.write(f"- Current Temperature: {temperature_C} °C")
-            st.write(f"- Current Humidity: {humidity}%")
-            st.write(f"- Air Quality: {env_factors[0]}")
-            st.write(f"- Noise Pollution: {env_factors[2]}")
-            st.write(f"- Green Spaces: {env_factors[3]}")
-            st.write(f"- Housing Quality: {env_factors[5]}")
-            st.write(f"- Light Pollution: {env_factors[6]}")
-            st.write(f"- Traffic Density: {env_factors[7]}")
-            st.write(f"- Industrial Activity: {env_factors[8]}")
-            st.write(f"- Socioeconomic Factors: {env_factors[9]}")
-            st.write(f"- Waste Management: {env_factors[10]}")
-            st.write(f"- Radiation: {env_factors[11]}")
+            st.write(f"- Current Temperature: {result['temperature_c']} °C")
+            st.write(f"- Current Humidity: {result['humidity']}%")
+            weather_age = get_weather_prefetcher().age(pin_code)
+            if weather_age is not None:
+                st.caption(f"Weather data last updated {int(weather_age // 60)} min {int(weather_age % 60)} s ago")
+            for name, value in result['factors'].items():
+                st.write(f"- {name}: {value:g}")
 
             # Display the final risk score
             st.subheader(f'Your Health Risk Score: {final_risk_score:.2f}')
+
+            # Display what moved the score away from an average respondent's
+            if result['contributions']:
+                st.write("### What Drives Your Score")
+                for name, value in list(result['contributions'].items())[:5]:
+                    st.write(f"- {name}: {value:+.2f}")
+                st.caption(f"Relative to a score of {result['base_score']:.2f} for an average respondent")
         except Exception as e:
             st.write(f"Error during prediction: {e}")
+
+    # Latency of each pipeline stage across all sessions, when tracing is enabled
+    if tracer.enabled:
+        with st.expander("Debug: pipeline stage timings"):
+            st.table([{'stage': name, **summary} for name, summary in tracer.snapshot().items()])
+            st.json(startup.status())
+
+# Time to the first rendered page, see startup.status()
+startup.painted()
+# On a single CPU, builder threads started before this point would compete with the page
+startup.start()
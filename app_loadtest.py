@@ -0,0 +1,358 @@
+"""Load test of the Streamlit app with simulated concurrent sessions.
+
+Runs `streamlit run app.py` in a child process, with StubWeatherServer in
+place of OpenWeatherMap and a FakeSheet behind the Sheets connection, both
+with configurable latency and error rates. Each simulated session speaks the
+browser's websocket protocol: it opens the landing page, goes to the form,
+then repeatedly picks a pin code and clicks Calculate Risk Score, pausing for
+a random think time in between. Every click carries a different comment, so
+none is answered from the idempotency cache. A click counts as served once
+its script run finishes and shows a score.
+
+The test steps through increasing session counts (a fresh server for each)
+and reports, per step, the throughput, the click latency percentiles, the
+error rate and the server's resident memory per session. The knee is the
+largest step before throughput stops growing by --min-gain or p95 latency
+exceeds --max-p95, i.e. roughly how many concurrent sessions one replica
+serves. --cpus pins the server to that many CPUs to size a replica.
+
+    python app_loadtest.py
+    python app_loadtest.py --sessions 1,4,16,64 --duration 30 --think-time 2
+    python app_loadtest.py --weather-latency 0.2 --weather-error-rate 0.05 --sheet-error-rate 0.1
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from api_loadtest import _free_port
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+GO_TO_APP = 'Go to App'
+CALCULATE = 'Calculate Risk Score'
+PIN_CODE = 'Select your pin code:'
+COMMENTS = '17. Any additional comments or concerns regarding your health and environment?'
+SCORE_HEADING = 'Your Health Risk Score'
+ERROR_PREFIXES = ('Error during prediction', 'Error fetching weather data', 'Error loading')
+
+
+def _write_secrets(path, tmp, weather_url, args):
+    storage = ('backend = "sqlite"\n'
+               f'path = "{os.path.join(tmp, "responses.db")}"\n') if args.storage == 'sqlite' else 'backend = "sheets"\n'
+    with open(path, 'w') as f:
+        f.write(
+            'gcp_service_account = {}\n'
+            '[openweathermap]\n'
+            'api_key = "load-test"\n'
+            f'api_url = "{weather_url}"\n'
+            '[weather]\n'
+            f'ttl = {args.weather_ttl}\n'
+            '[weather_prefetch]\n'
+            f'interval = {args.weather_ttl}\n'
+            '[storage]\n'
+            f'{storage}'
+            '[persistence]\n'
+            f'path = "{os.path.join(tmp, "queue.db")}"\n'
+            '[analytics]\n'
+            f'path = "{os.path.join(tmp, "analytics.db")}"\n'
+        )
+
+
+def _serve(port, secrets_path, sheet_latency, sheet_error_rate, cpus):
+    # The server process: the app, with the Sheets connection swapped for an in-memory sheet
+    if cpus:
+        os.sched_setaffinity(0, range(cpus))
+    import sheets_client
+    from stubs import FakeSheet, FakeSheetsConnection
+
+    sheet = FakeSheet(latency=sheet_latency, error_rate=sheet_error_rate)
+    sheets_client.SheetsConnection = lambda *args, **kwargs: FakeSheetsConnection(sheet)
+
+    from streamlit.web import cli
+
+    # Keep Streamlit's banner out of the JSON report on stdout
+    sys.stdout = sys.stderr
+    sys.argv = ['streamlit', 'run', APP_PATH, '--server.headless', 'true', '--server.port', str(port),
+                '--server.address', '127.0.0.1', '--server.fileWatcherType', 'none',
+                '--browser.gatherUsageStats', 'false', '--logger.level', 'error',
+                '--secrets.files', secrets_path]
+    cli.main()
+
+
+def _rss_bytes(pid):
+    # Resident memory of a process (Linux); None elsewhere
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+
+
+class Session:
+    """One simulated browser tab."""
+
+    def __init__(self, http, url):
+        self.http = http
+        self.url = url
+        self.ws = None
+        self.widgets = {}  # label -> widget id
+        self.pin_codes = []
+        self.clicks = 0
+
+    async def connect(self):
+        self.ws = await self.http.ws_connect(self.url, protocols=['streamlit'], max_msg_size=0)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self, widgets=()):
+        """Run the script with the given widget states; returns (texts shown, error or None)."""
+        import aiohttp
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        message.rerun_script.query_string = ''
+        message.rerun_script.page_script_hash = ''
+        for widget in widgets:
+            message.rerun_script.widget_states.widgets.append(widget)
+        await self.ws.send_bytes(message.SerializeToString())
+
+        texts = []
+        while True:
+            received = await self.ws.receive()
+            if received.type != aiohttp.WSMsgType.BINARY:
+                raise ConnectionError(f'websocket closed ({received.type.name})')
+            forward = ForwardMsg()
+            forward.ParseFromString(received.data)
+            kind = forward.WhichOneof('type')
+            if kind == 'script_finished':
+                break
+            if kind != 'delta' or forward.delta.WhichOneof('type') != 'new_element':
+                continue
+            element = forward.delta.new_element
+            element_type = element.WhichOneof('type')
+            widget = getattr(element, element_type)
+            if getattr(widget, 'id', None) and getattr(widget, 'label', None):
+                self.widgets[widget.label] = widget.id
+            if element_type == 'selectbox' and widget.label == PIN_CODE:
+                self.pin_codes = list(widget.options)
+            elif element_type == 'exception':
+                return texts, element.exception.message
+            elif element_type in ('markdown', 'heading'):
+                texts.append(widget.body)
+        error = next((text for text in texts if text.startswith(ERROR_PREFIXES)), None)
+        return texts, error
+
+    def click(self, label, values=None):
+        """Widget states for clicking a button, with string widgets (by label) set to `values`."""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        widgets = [WidgetState(id=self.widgets[label], trigger_value=True)]
+        for widget_label, value in (values or {}).items():
+            widgets.append(WidgetState(id=self.widgets[widget_label], string_value=value))
+        return widgets
+
+    async def open_form(self):
+        await self.rerun()
+        await self.rerun(self.click(GO_TO_APP))
+        # The click switches the page for the next run
+        await self.rerun()
+
+    async def calculate(self):
+        self.clicks += 1
+        values = {PIN_CODE: random.choice(self.pin_codes), COMMENTS: f'load test click {self.clicks}'}
+        return await self.rerun(self.click(CALCULATE, values))
+
+
+async def _run_step(url, sessions, duration, think_time, server_pid):
+    import aiohttp
+
+    latencies = []
+    errors = {}
+    deadline = None
+    started = asyncio.Event()
+    connected = []
+    failed = []
+
+    async def user(http):
+        session = Session(http, url)
+        try:
+            await session.connect()
+            await session.open_form()
+        except Exception as e:
+            failed.append(session)
+            errors[f'open: {e}'[:80]] = errors.get(f'open: {e}'[:80], 0) + 1
+            return
+        connected.append(session)
+        await started.wait()
+        # Spread the first clicks over one think time, like users arriving at different moments
+        await asyncio.sleep(random.uniform(0, think_time))
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                texts, error = await session.calculate()
+                if error is None and not any(text.startswith(SCORE_HEADING) for text in texts):
+                    error = 'no score shown'
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+            latencies.append((time.perf_counter() - start, error))
+            if error is not None:
+                errors[error[:80]] = errors.get(error[:80], 0) + 1
+            await asyncio.sleep(random.expovariate(1 / think_time) if think_time else 0)
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as http:
+        idle_rss = _rss_bytes(server_pid)
+        tasks = [asyncio.ensure_future(user(http)) for _ in range(sessions)]
+        # Everyone is connected and on the form before the clock starts
+        while len(connected) + len(failed) < sessions:
+            await asyncio.sleep(0.05)
+        deadline = time.monotonic() + duration
+        started.set()
+        start = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        # With every session still open, so their state is counted
+        loaded_rss = _rss_bytes(server_pid)
+        for session in connected:
+            await session.close()
+
+    served = np.array([seconds for seconds, error in latencies if error is None]) * 1000.0
+    step = {
+        'sessions': sessions,
+        'connected': len(connected),
+        'clicks': len(latencies),
+        'errors': len(latencies) - len(served),
+        'error_rate': round((len(latencies) - len(served)) / max(len(latencies), 1), 4),
+        'throughput_per_second': round(len(served) / elapsed, 2),
+        'latency_ms': {f'p{p}': round(float(np.percentile(served, p)), 1) if len(served) else None
+                       for p in (50, 95, 99)},
+        'rss_mb': None if loaded_rss is None else round(loaded_rss / 2**20, 1),
+        'rss_per_session_kb': None,
+        'error_kinds': errors,
+    }
+    if idle_rss is not None and loaded_rss is not None and connected:
+        step['rss_per_session_kb'] = round((loaded_rss - idle_rss) / len(connected) / 1024, 1)
+    return step
+
+
+async def _wait_ready(base_url, timeout=60):
+    import aiohttp
+
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as http:
+        while time.monotonic() < deadline:
+            try:
+                async with http.get(f'{base_url}/_stcore/health') as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError('Streamlit server did not become ready')
+
+
+async def _warm_up(url):
+    # Builds the services (startup.py) and fills the weather cache before anything is measured
+    import aiohttp
+
+    async with aiohttp.ClientSession() as http:
+        session = Session(http, url)
+        await session.connect()
+        try:
+            await session.open_form()
+            for _ in range(3):
+                await session.calculate()
+        finally:
+            await session.close()
+
+
+def find_knee(steps, min_gain=0.1, max_p95_ms=None):
+    """The last step before throughput gains fall under min_gain or p95 latency exceeds max_p95_ms."""
+    knee = None
+    for i, step in enumerate(steps):
+        p95 = step['latency_ms']['p95']
+        if max_p95_ms is not None and (p95 is None or p95 > max_p95_ms):
+            break
+        if i and step['throughput_per_second'] < steps[i - 1]['throughput_per_second'] * (1 + min_gain):
+            break
+        knee = step
+    return knee
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', default='1,2,4,8,16,32', help='Comma-separated concurrent session counts')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to measure at each step')
+    parser.add_argument('--think-time', type=float, default=1.0, help='Mean seconds between a session\'s clicks')
+    parser.add_argument('--weather-latency', type=float, default=0.05, help='Seconds per stub weather call')
+    parser.add_argument('--weather-error-rate', type=float, default=0.0)
+    parser.add_argument('--weather-ttl', type=float, default=600, help='Weather cache TTL and prefetch interval')
+    parser.add_argument('--sheet-latency', type=float, default=0.2, help='Seconds per fake sheet call')
+    parser.add_argument('--sheet-error-rate', type=float, default=0.0)
+    parser.add_argument('--storage', choices=['sheets', 'sqlite'], default='sheets')
+    parser.add_argument('--cpus', type=int, help='Pin the server to this many CPUs (the replica size)')
+    parser.add_argument('--min-gain', type=float, default=0.1,
+                        help='Throughput growth per step below which the app counts as saturated')
+    parser.add_argument('--max-p95', type=float, help='p95 click latency (ms) beyond which a step fails')
+    parser.add_argument('--out', help='Also write the JSON report here')
+    args = parser.parse_args(argv)
+    session_counts = [int(n) for n in args.sessions.split(',')]
+
+    from stubs import StubWeatherServer
+
+    steps = []
+    with StubWeatherServer(latency=args.weather_latency, error_rate=args.weather_error_rate) as weather, \
+            tempfile.TemporaryDirectory() as tmp:
+        for sessions in session_counts:
+            # A fresh server per step, so memory and queues start from the same point
+            step_dir = tempfile.mkdtemp(dir=tmp)
+            secrets_path = os.path.join(step_dir, 'secrets.toml')
+            _write_secrets(secrets_path, step_dir, weather.url, args)
+            port = _free_port()
+            server = multiprocessing.Process(
+                target=_serve, daemon=True,
+                args=(port, secrets_path, args.sheet_latency, args.sheet_error_rate, args.cpus),
+            )
+            server.start()
+            try:
+                asyncio.run(_wait_ready(f'http://127.0.0.1:{port}'))
+                url = f'ws://127.0.0.1:{port}/_stcore/stream'
+                asyncio.run(_warm_up(url))
+                step = asyncio.run(_run_step(url, sessions, args.duration, args.think_time, server.pid))
+            finally:
+                server.terminate()
+                server.join()
+            steps.append(step)
+            print(f"{sessions:>5} sessions: {step['throughput_per_second']:>7.2f} clicks/s  "
+                  f"p50 {step['latency_ms']['p50']} ms  p95 {step['latency_ms']['p95']} ms  "
+                  f"p99 {step['latency_ms']['p99']} ms  errors {step['error_rate']:.1%}  "
+                  f"{step['rss_per_session_kb']} KB/session", file=sys.stderr)
+
+    knee = find_knee(steps, args.min_gain, args.max_p95)
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k != 'out'},
+        'cpus': args.cpus or len(os.sched_getaffinity(0)),
+        'steps': steps,
+        'knee_sessions': None if knee is None else knee['sessions'],
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
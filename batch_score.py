@@ -0,0 +1,270 @@
+"""Offline bulk scoring of survey exports, feature tables and the pin code table.
+
+Rows are assembled exactly like the Calculate Risk Score handler in app.py:
+env factors, then the live temperature/humidity overrides, then the model.
+Each input row is scored from one of:
+
+  * the 12 factor columns of dataset.xlsx (FEATURE_NAMES), or
+  * a 'Pin Code' column looked up in the zip feature table, with the temperature and
+    humidity recorded by the app ('CURRENT TEMPERATURE (degrees C)',
+    'CURRENT HUMIDITY (%)') when the export has them, or
+  * 'Latitude' and 'Longitude' columns, resolved in bulk to the zip with the
+    nearest centroid (added as 'Pin Code' and 'Distance (km)'); with
+    --interpolate K, the factors are instead blended over the K nearest zips by
+    inverse distance and added as factor columns.
+
+--temperature (Kelvin) and --humidity override every row. With --explain, each
+row also gets one '<factor> Contribution' column per model input and a
+'Base Score' column; the contributions add up to the score minus the base
+score (see explain.py; NumPy backend only).
+
+    python batch_score.py dataset.xlsx scores.csv
+    python batch_score.py responses.parquet scores.parquet --workers 4
+    python batch_score.py --pin-code-table pin_scores.csv --temperature 293 --humidity 60
+    python batch_score.py responses.csv explained.csv --explain
+    python batch_score.py points.parquet scores.parquet --interpolate 4 --temperature 293 --humidity 60
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from explain import explainer_for
+from feature_store import (LATITUDE_COLUMN, LONGITUDE_COLUMN, MAX_DISTANCE_KM, PIN_CODE_COLUMN, ZIP_FEATURES_PATH,
+                           FeatureStore)
+from features import FEATURE_NAMES, assemble_features
+from model_registry import MODEL_PATH, SCALER_PATH, ModelRegistry, version_paths
+from numpy_model import ARTIFACT_PATH
+
+TEMPERATURE_C_COLUMN = 'CURRENT TEMPERATURE (degrees C)'
+HUMIDITY_COLUMN = 'CURRENT HUMIDITY (%)'
+# The app stores temperature as Kelvin - 273
+KELVIN_OFFSET = 273
+CONTRIBUTION_COLUMNS = [f'{name} Contribution' for name in FEATURE_NAMES]
+BASE_SCORE_COLUMN = 'Base Score'
+DISTANCE_COLUMN = 'Distance (km)'
+
+# Model and zip feature table used by _score_chunk, set once per process
+_model = None
+_store = None
+
+
+def read_chunks(path, chunk_size):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype={PIN_CODE_COLUMN: str})
+    elif ext == '.parquet':
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif ext in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = list(next(rows))
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == chunk_size:
+                    yield pd.DataFrame(chunk, columns=header)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame(chunk, columns=header)
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f"Unsupported input format {ext!r} (expected .csv, .parquet or .xlsx)")
+
+
+def pin_code_table(store):
+    return pd.DataFrame({PIN_CODE_COLUMN: list(store.zips)})
+
+
+def locate_frame(frame, store, interpolate=0, max_distance_km=MAX_DISTANCE_KM):
+    """Add the nearest pin code (and with interpolate=k, blended factors) to rows given by location."""
+    if (any(name not in frame.columns for name in (LATITUDE_COLUMN, LONGITUDE_COLUMN))
+            or PIN_CODE_COLUMN in frame.columns or all(name in frame.columns for name in FEATURE_NAMES)):
+        return frame
+    latitudes = pd.to_numeric(frame[LATITUDE_COLUMN], errors='coerce').to_numpy(dtype=np.float64)
+    longitudes = pd.to_numeric(frame[LONGITUDE_COLUMN], errors='coerce').to_numpy(dtype=np.float64)
+    valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+    if not valid.all():
+        raise ValueError(f"{(~valid).sum()} rows have no valid {LATITUDE_COLUMN}/{LONGITUDE_COLUMN}")
+    pin_codes, distances = store.nearest_zip(latitudes, longitudes)
+    far = distances > max_distance_km
+    if far.any():
+        raise ValueError(f"{far.sum()} rows are more than {max_distance_km:g} km from every zip centroid, "
+                         f"e.g. ({latitudes[far][0]}, {longitudes[far][0]})")
+    frame = frame.assign(**{PIN_CODE_COLUMN: pin_codes, DISTANCE_COLUMN: distances})
+    if interpolate:
+        factors = store.interpolated_factors(latitudes, longitudes, k=interpolate)
+        frame[FEATURE_NAMES] = factors
+    return frame
+
+
+def _pin_code_inputs(frame, store, temperature, humidity):
+    pin_codes = frame[PIN_CODE_COLUMN].astype(str).str.zfill(5)
+    unknown = sorted(set(pin_codes) - store.index.keys())
+    if unknown:
+        raise ValueError(f"Unknown pin codes: {', '.join(unknown[:10])}")
+    if temperature is None and TEMPERATURE_C_COLUMN in frame.columns:
+        temperature = pd.to_numeric(frame[TEMPERATURE_C_COLUMN], errors='coerce').to_numpy() + KELVIN_OFFSET
+    if humidity is None and HUMIDITY_COLUMN in frame.columns:
+        humidity = pd.to_numeric(frame[HUMIDITY_COLUMN], errors='coerce').to_numpy()
+    return pin_codes, temperature, humidity
+
+
+def score_frame(frame, model, store, temperature=None, humidity=None):
+    if all(name in frame.columns for name in FEATURE_NAMES):
+        env_factors = frame[FEATURE_NAMES].to_numpy(dtype=np.float64)
+        return model.predict(assemble_features(env_factors, temperature, humidity))
+    if PIN_CODE_COLUMN in frame.columns:
+        return store.score(model, *_pin_code_inputs(frame, store, temperature, humidity))
+    raise ValueError(f"Input needs either the columns {FEATURE_NAMES}, a {PIN_CODE_COLUMN!r} column "
+                     f"or {LATITUDE_COLUMN!r} and {LONGITUDE_COLUMN!r} columns")
+
+
+def explain_frame(frame, explainer, store, temperature=None, humidity=None):
+    """Per-feature contributions for the rows score_frame scores, one row each."""
+    if all(name in frame.columns for name in FEATURE_NAMES):
+        env_factors = frame[FEATURE_NAMES].to_numpy(dtype=np.float64)
+        return explainer.explain(assemble_features(env_factors, temperature, humidity))
+    # Pin codes reuse the cached per-zip contributions; only the weather leg is computed per row
+    return explainer.explain_zips(store, *_pin_code_inputs(frame, store, temperature, humidity))
+
+
+def _init_worker(model_path, scaler_path, backend, features_path, artifact_path=ARTIFACT_PATH):
+    global _model, _store
+    _model = ModelRegistry(model_path, scaler_path, backend=backend, artifact_path=artifact_path).get()
+    _store = FeatureStore.load(features_path)
+
+
+def _score_chunk(frame, temperature, humidity, score_column, explain=False, interpolate=0,
+                 max_distance_km=MAX_DISTANCE_KM):
+    frame = locate_frame(frame.copy(), _store, interpolate, max_distance_km)
+    frame[score_column] = score_frame(frame, _model, _store, temperature, humidity)
+    if explain:
+        explainer = explainer_for(_model)
+        if explainer is None:
+            raise ValueError("--explain needs the numpy backend")
+        contributions = explain_frame(frame, explainer, _store, temperature, humidity)
+        frame[CONTRIBUTION_COLUMNS] = contributions
+        frame[BASE_SCORE_COLUMN] = explainer.base_score
+    return frame
+
+
+class ChunkWriter:
+    def __init__(self, path):
+        self.path = path
+        self.ext = os.path.splitext(path)[1].lower()
+        if self.ext not in ('.csv', '.parquet'):
+            raise ValueError(f"Unsupported output format {self.ext!r} (expected .csv or .parquet)")
+        self._parquet = None
+        self._first = True
+
+    def write(self, frame):
+        if self.ext == '.csv':
+            frame.to_csv(self.path, mode='w' if self._first else 'a', header=self._first, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table.cast(self._parquet.schema))
+        self._first = False
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def score_file(chunks, output, workers=1, temperature=None, humidity=None, score_column='Predicted Risk Score',
+               model_path=MODEL_PATH, scaler_path=SCALER_PATH, backend='numpy', features_path=ZIP_FEATURES_PATH,
+               artifact_path=ARTIFACT_PATH, explain=False, interpolate=0, max_distance_km=MAX_DISTANCE_KM):
+    writer = ChunkWriter(output)
+    rows = 0
+    start = time.perf_counter()
+    try:
+        if workers <= 1:
+            _init_worker(model_path, scaler_path, backend, features_path, artifact_path)
+            for frame in chunks:
+                scored = _score_chunk(frame, temperature, humidity, score_column, explain, interpolate,
+                                      max_distance_km)
+                writer.write(scored)
+                rows += len(scored)
+        else:
+            # Keep a bounded number of chunks in flight so large inputs still stream
+            with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                     initargs=(model_path, scaler_path, backend, features_path,
+                                               artifact_path)) as pool:
+                pending = deque()
+                for frame in chunks:
+                    pending.append(pool.submit(_score_chunk, frame, temperature, humidity, score_column, explain,
+                                               interpolate, max_distance_km))
+                    if len(pending) >= 2 * workers:
+                        scored = pending.popleft().result()
+                        writer.write(scored)
+                        rows += len(scored)
+                while pending:
+                    scored = pending.popleft().result()
+                    writer.write(scored)
+                    rows += len(scored)
+    finally:
+        writer.close()
+    return rows, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', nargs='?', help='.xlsx, .csv or .parquet file to score')
+    parser.add_argument('output', help='.csv or .parquet file to write')
+    parser.add_argument('--pin-code-table', action='store_true', help='Score every pin code in the feature table')
+    parser.add_argument('--temperature', type=float, help='Temperature in Kelvin applied to every row')
+    parser.add_argument('--humidity', type=float, help='Humidity (%%) applied to every row')
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--workers', type=int, default=1, help='Score chunks in this many processes')
+    parser.add_argument('--score-column', default='Predicted Risk Score')
+    parser.add_argument('--backend', choices=['numpy', 'keras'], default='numpy')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--scaler', default=SCALER_PATH)
+    parser.add_argument('--artifact', default=ARTIFACT_PATH, help='NumPy artifact, e.g. one written by optimize.py')
+    parser.add_argument('--model-version', help='Score with a version trained by train.py ("latest" for the newest)')
+    parser.add_argument('--features', default=ZIP_FEATURES_PATH, help='Per-zip feature table')
+    parser.add_argument('--explain', action='store_true', help='Add per-factor contribution columns')
+    parser.add_argument('--interpolate', type=int, default=0, metavar='K',
+                        help='For lat/lon rows, blend the factors of the K nearest zips instead of using the nearest')
+    parser.add_argument('--max-distance', type=float, default=MAX_DISTANCE_KM,
+                        help='Reject lat/lon rows further than this many km from every zip centroid')
+    args = parser.parse_args(argv)
+
+    if args.pin_code_table == bool(args.input):
+        parser.error('give either an input file or --pin-code-table')
+    if args.pin_code_table:
+        chunks = [pin_code_table(FeatureStore.load(args.features))]
+    else:
+        chunks = read_chunks(args.input, args.chunk_size)
+
+    model_path, scaler_path, artifact_path = args.model, args.scaler, args.artifact
+    if args.model_version:
+        model_path, scaler_path, artifact_path = version_paths(args.model_version)
+
+    rows, seconds = score_file(chunks, args.output, args.workers, args.temperature, args.humidity,
+                               args.score_column, model_path, scaler_path, args.backend, args.features,
+                               artifact_path, args.explain, args.interpolate, args.max_distance)
+    print(f"Scored {rows} rows in {seconds:.2f}s ({rows / max(seconds, 1e-9):,.0f} rows/s) -> {args.output}",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,397 @@
+"""Reproducible benchmarks for the startup, scoring and persistence paths.
+
+Every case runs against local stand-ins (StubWeatherServer, FakeSheet) with
+seeded inputs, and the results are written as JSON together with the commit
+and environment, so runs can be compared across commits:
+
+    python benchmarks.py --out bench/$(git rev-parse --short HEAD).json
+    python benchmarks.py --cases predict_single,predict_batch --keras
+    python benchmarks.py --compare bench/old.json bench/new.json
+
+Cases:
+  cold_import      import time of the serving modules (fresh interpreter each run)
+  model_load       ModelRegistry load incl. warm-up (fresh interpreter each run)
+  predict_single   model.predict on one row
+  predict_batch    model.predict at several batch sizes (per-row cost too)
+  calculate        the Calculate Risk Score handler: weather, micro-batched
+                   scoring and the persistence queue, with a cached and an
+                   uncached weather lookup
+  persistence      one submission written to a sheet of growing size: the
+                   original get_all_records + append_row, GoogleSheetsStore,
+                   and the local persistence queue
+  shared_cache     upstream weather requests for one prefetch round across 1-4
+                   replicas with no shared tier, StubRedisServer and an mmap file,
+                   and the cost of a local, Redis and mmap hit
+  startup          first run of app.py in a fresh process (streamlit AppTest):
+                   time to the rendered landing page and until every service
+                   is ready, with services built in the background or up front,
+                   next to AppTest's own cost for a two-element script
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+SEED = 12345
+BATCH_SIZES = (1, 8, 64, 512, 4096)
+SHEET_SIZES = (0, 1000, 10000, 50000)
+REPLICA_COUNTS = (1, 2, 4)
+IMPORT_TARGETS = {
+    'numpy_model': 'import numpy_model',
+    'serving_modules': 'import feature_store, model_registry, risk_pipeline, scoring_service, weather',
+    'tensorflow': 'import tensorflow.keras.models',
+}
+SAMPLE_ANSWERS = {'Age': 42, 'Gender': 'Female', 'Years Residence': 6, 'Respiratory Illnesses': ['Asthma']}
+
+
+def summarize(samples):
+    """Timing statistics in milliseconds for a list of durations in seconds."""
+    ms = np.asarray(samples) * 1000.0
+    return {
+        'runs': len(ms),
+        'min_ms': round(float(ms.min()), 4),
+        'median_ms': round(float(np.median(ms)), 4),
+        'mean_ms': round(float(ms.mean()), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+    }
+
+
+def measure(func, repeat, warmup=3):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def _in_subprocess(code, repeat):
+    # The child prints the seconds it measured, so interpreter start-up is not counted
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        samples.append(float(output.stdout.strip().splitlines()[-1]))
+    return summarize(samples)
+
+
+def _models(args):
+    from model_registry import ModelRegistry
+
+    models = {'numpy': ModelRegistry(backend='numpy').get()}
+    if args.keras:
+        models['keras'] = ModelRegistry(backend='keras').get()
+    return models
+
+
+def _rows(n, n_features=12):
+    return np.random.default_rng(SEED).uniform(0, 100, size=(n, n_features))
+
+
+def bench_cold_import(args):
+    results = {}
+    for name, statement in IMPORT_TARGETS.items():
+        if name == 'tensorflow' and not args.keras:
+            continue
+        code = f'import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)'
+        results[name] = _in_subprocess(code, args.process_repeat)
+    return results
+
+
+def bench_model_load(args):
+    results = {}
+    for backend in ('numpy', 'keras') if args.keras else ('numpy',):
+        code = ('import time; from model_registry import ModelRegistry; start = time.perf_counter(); '
+                f'ModelRegistry(backend={backend!r}); print(time.perf_counter() - start)')
+        results[backend] = _in_subprocess(code, args.process_repeat)
+    return results
+
+
+def bench_predict_single(args):
+    row = _rows(1)
+    return {backend: measure(lambda: model.predict(row), args.repeat) for backend, model in _models(args).items()}
+
+
+def bench_predict_batch(args):
+    results = {}
+    for backend, model in _models(args).items():
+        results[backend] = {}
+        for size in BATCH_SIZES:
+            rows = _rows(size)
+            stats = measure(lambda: model.predict(rows), max(args.repeat // 10, 5) if size > 512 else args.repeat)
+            stats['per_row_us'] = round(stats['median_ms'] * 1000.0 / size, 4)
+            results[backend][str(size)] = stats
+    return results
+
+
+def bench_calculate(args):
+    from feature_store import FeatureStore
+    from model_registry import ModelRegistry
+    from persistence_queue import PersistenceQueue
+    from risk_pipeline import RiskPipeline
+    from scoring_service import ScoringService
+    from storage import create_store
+    from stubs import FakeSheet, StubWeatherServer
+    from weather import WeatherClient
+
+    feature_store = FeatureStore.load()
+    registry = ModelRegistry()
+    pin_codes = list(feature_store.zips)
+    rng = np.random.default_rng(SEED)
+    results = {}
+    with StubWeatherServer() as server, tempfile.TemporaryDirectory() as tmp:
+        client = WeatherClient('benchmark', api_url=server.url)
+        scoring = ScoringService(registry.get)
+        queue = PersistenceQueue(create_store('sheets', sheet=FakeSheet()), path=os.path.join(tmp, 'queue.db')).start()
+        weather = {
+            'cached_weather': lambda pin, lat, lon: client.get(lat, lon),
+            'uncached_weather': lambda pin, lat, lon: client.fetch(lat, lon),
+        }
+        try:
+            for name, get_weather in weather.items():
+                # Same wiring as the handler in app.py
+                pipeline = RiskPipeline(
+                    feature_store, registry.get, get_weather, persist=queue.put,
+                    score=lambda pin, temperature, humidity: scoring.score(
+                        feature_store.features(pin, temperature, humidity), timeout=10),
+                )
+                results[name] = measure(lambda: pipeline.assess(pin_codes[rng.integers(len(pin_codes))],
+                                                                SAMPLE_ANSWERS), args.repeat)
+        finally:
+            queue.stop()
+            scoring.close()
+            client.close()
+    return results
+
+
+def _sheet_rows(n):
+    from risk_pipeline import build_record
+
+    record = build_record('02108', SAMPLE_ANSWERS, 293.15, 60, 50.0, timestamp=datetime(2024, 1, 1))
+    return [list(record.keys())] + [list(record.values()) for _ in range(n)] if n else [], record
+
+
+def bench_persistence(args):
+    from persistence_queue import PersistenceQueue
+    from storage import GoogleSheetsStore
+    from stubs import FakeSheet
+
+    def original(sheet, record):
+        # The handler as it was: download every record to see whether the header is missing
+        if len(sheet.get_all_records()) == 0:
+            sheet.append_row(list(record.keys()))
+        sheet.append_row(list(record.values()))
+
+    results = {'get_all_records': {}, 'sheets_store': {}, 'queue_put': {}}
+    for size in SHEET_SIZES:
+        rows, record = _sheet_rows(size)
+        repeat = max(args.repeat // 10, 5) if size >= 10000 else args.repeat
+        # Each method gets a fresh sheet, and the appends it makes are negligible next to its size
+        sheet = FakeSheet([list(r) for r in rows])
+        results['get_all_records'][str(size)] = measure(lambda: original(sheet, record), repeat)
+        store = GoogleSheetsStore(sheet=FakeSheet([list(r) for r in rows]))
+        results['sheets_store'][str(size)] = measure(lambda: store.append([record]), repeat)
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = PersistenceQueue(store, path=os.path.join(tmp, 'queue.db'))
+            results['queue_put'][str(size)] = measure(lambda: queue.put(record), repeat)
+            queue.stop(flush=False)
+    return results
+
+
+def bench_shared_cache(args):
+    from feature_store import FeatureStore
+    from shared_cache import MmapBackend, RedisBackend, TieredCache
+    from stubs import StubRedisServer, StubWeatherServer
+    from weather import WeatherClient
+
+    locations = list(FeatureStore.load().locations().values())
+    results = {'upstream_requests': {}}
+    with StubWeatherServer() as server, StubRedisServer() as redis, tempfile.TemporaryDirectory() as tmp:
+        backends = {
+            'none': lambda: None,
+            'redis': lambda: RedisBackend(redis.url),
+            'mmap': lambda: MmapBackend(os.path.join(tmp, 'cache.mmap')),
+        }
+        for name, backend in backends.items():
+            results['upstream_requests'][name] = {}
+            for replicas in REPLICA_COUNTS:
+                redis.data.clear()
+                if os.path.exists(os.path.join(tmp, 'cache.mmap')):
+                    os.remove(os.path.join(tmp, 'cache.mmap'))
+                # One prefetch round per replica, each with its own process-local state
+                before = server.requests
+                for _ in range(replicas):
+                    client = WeatherClient('benchmark', api_url=server.url, shared_cache=TieredCache(backend()))
+                    for lat, lon in locations:
+                        client.fetch(lat, lon)
+                    client.close()
+                results['upstream_requests'][name][str(replicas)] = server.requests - before
+
+        value = {'main': {'temp': 293.15, 'humidity': 60}, 'coord': {'lat': 42.36, 'lon': -71.06}}
+        for name in ('local', 'redis', 'mmap'):
+            writer = TieredCache(None if name == 'local' else backends[name]())
+            writer.set('weather:42.36:-71.06', value, 600)
+            # A replica whose LRU holds nothing, so every lookup reads the shared tier
+            reader = writer if name == 'local' else TieredCache(backends[name](), max_entries=0)
+            results[f'{name}_hit'] = measure(lambda: reader.get('weather:42.36:-71.06'), args.repeat)
+    return results
+
+
+def _startup_run(background, backend, floor=False):
+    # Runs in a fresh interpreter; prints the timings of app.py's first run as JSON
+    from streamlit.testing.v1 import AppTest
+
+    import startup
+    from stubs import StubWeatherServer
+
+    with StubWeatherServer() as server, tempfile.TemporaryDirectory() as tmp:
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+        if floor:
+            # What AppTest itself costs: a script that renders two elements and nothing else
+            script = os.path.join(tmp, 'floor.py')
+            with open(script, 'w') as f:
+                f.write("import streamlit as st\nst.title('Welcome')\nst.write('Hello')\n")
+        app = AppTest.from_file(script, default_timeout=120)
+        app.secrets['openweathermap'] = {'api_key': 'benchmark', 'api_url': server.url}
+        app.secrets['gcp_service_account'] = {}
+        app.secrets['storage'] = {'backend': 'sqlite', 'path': os.path.join(tmp, 'responses.db')}
+        app.secrets['persistence'] = {'path': os.path.join(tmp, 'queue.db')}
+        app.secrets['analytics'] = {'path': os.path.join(tmp, 'analytics.db')}
+        app.secrets['startup'] = {'background': background}
+        app.secrets['model_backend'] = backend
+        start = time.perf_counter()
+        app.run()
+        painted = time.perf_counter() - start
+        services = startup.current()
+        if services is not None:
+            for name in services.status()['services']:
+                services.result(name)
+        ready = time.perf_counter() - start
+    print(json.dumps({'paint': painted, 'ready': ready}))
+
+
+def _startup_samples(args, call):
+    samples = {'paint': [], 'ready': []}
+    for _ in range(args.process_repeat):
+        output = subprocess.run([sys.executable, '-c', f'import benchmarks; benchmarks.{call}'],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        run = json.loads(output.stdout.strip().splitlines()[-1])
+        for key in samples:
+            samples[key].append(run[key])
+    return samples
+
+
+def bench_startup(args):
+    # AppTest's own run costs ~270 ms on one CPU; subtract apptest_floor to get the app's share
+    results = {'apptest_floor': summarize(_startup_samples(args, '_startup_run(True, "numpy", floor=True)')['paint'])}
+    for backend in ('numpy', 'keras') if args.keras else ('numpy',):
+        for background in (False, True):
+            samples = _startup_samples(args, f'_startup_run({background}, {backend!r})')
+            mode = 'background' if background else 'eager'
+            results[f'{backend}_{mode}'] = {
+                'first_paint': summarize(samples['paint']),
+                'all_ready': summarize(samples['ready']),
+            }
+    return results
+
+
+CASES = {
+    'cold_import': bench_cold_import,
+    'model_load': bench_model_load,
+    'predict_single': bench_predict_single,
+    'predict_batch': bench_predict_batch,
+    'calculate': bench_calculate,
+    'persistence': bench_persistence,
+    'shared_cache': bench_shared_cache,
+    'startup': bench_startup,
+}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def _flatten(results, prefix=''):
+    # {'predict_batch': {'numpy': {'64': {...}}}} -> {'predict_batch.numpy.64': {...}}
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict) and 'median_ms' in value:
+            flat[prefix + key] = value
+        elif isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+    return flat
+
+
+def compare(old_path, new_path):
+    """Print the median of every benchmark in both files, with new/old ratios."""
+    with open(old_path) as f:
+        old = _flatten(json.load(f)['results'])
+    with open(new_path) as f:
+        new = _flatten(json.load(f)['results'])
+    width = max(map(len, new), default=10)
+    print(f'{"benchmark":<{width}}  {"old ms":>10}  {"new ms":>10}  {"ratio":>7}')
+    for name in sorted(set(old) & set(new)):
+        before, after = old[name]['median_ms'], new[name]['median_ms']
+        ratio = after / before if before else float('inf')
+        print(f'{name:<{width}}  {before:>10.4f}  {after:>10.4f}  {ratio:>6.2f}x')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', default=','.join(CASES), help='Comma-separated subset of: ' + ', '.join(CASES))
+    parser.add_argument('--repeat', type=int, default=200, help='Timed runs per in-process measurement')
+    parser.add_argument('--process-repeat', type=int, default=5, help='Fresh interpreters per import/load case')
+    parser.add_argument('--keras', action='store_true', help='Also benchmark the TensorFlow backend')
+    parser.add_argument('--out', help='Write the JSON results here instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two result files and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    cases = [name.strip() for name in args.cases.split(',') if name.strip()]
+    unknown = [name for name in cases if name not in CASES]
+    if unknown:
+        parser.error(f'unknown cases: {", ".join(unknown)}')
+
+    results = {}
+    for name in cases:
+        start = time.perf_counter()
+        results[name] = CASES[name](args)
+        print(f'{name}: {time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+    output = json.dumps({'environment': environment(), 'results': results}, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
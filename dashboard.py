@@ -0,0 +1,52 @@
+import pandas as pd
+import streamlit as st
+
+from analytics import ANALYTICS_PATH, PERIODS, Rollups
+
+# Aggregates of the collected responses, read from the rollups the app maintains as it
+# persists them (see analytics.py). Run with: streamlit run dashboard.py
+# The database is taken from [analytics] path in secrets, as in app.py.
+
+@st.cache_resource
+def get_rollups():
+    return Rollups(st.secrets.get("analytics", {}).get("path", ANALYTICS_PATH))
+
+rollups = get_rollups()
+
+st.title('Boston Health Risk Score: Responses')
+
+pin_codes = rollups.pin_codes()
+st.metric('Responses', f"{sum(p['count'] for p in pin_codes):,}")
+if not pin_codes:
+    st.write("No responses yet. Existing responses can be loaded with `python analytics.py backfill <export>`.")
+    st.stop()
+
+# Score distribution, for all responses or one pin code
+st.subheader('Risk Score Distribution')
+choice = st.selectbox('Pin code:', ['All'] + [p['pin_code'] for p in pin_codes])
+distribution = rollups.pin_distribution(None if choice == 'All' else choice)
+columns = st.columns(4)
+columns[0].metric('Responses', f"{distribution['count']:,}")
+columns[1].metric('Mean', f"{distribution['mean']:.2f}")
+columns[2].metric('Median', f"{distribution['p50']:.2f}")
+columns[3].metric('Std dev', f"{distribution['std']:.2f}")
+histogram = pd.DataFrame(distribution['histogram'])
+st.bar_chart(histogram.set_index(histogram['low'].map('{:g}'.format))['count'])
+
+# Responses and mean score over time
+st.subheader('Trends')
+period = st.radio('Per:', list(PERIODS), index=1, horizontal=True)
+trend = pd.DataFrame(rollups.trend(None if choice == 'All' else choice, period))
+if not trend.empty:
+    trend = trend.set_index('period')
+    st.line_chart(trend['mean'])
+    st.bar_chart(trend['count'])
+
+# Counts and mean score per answer
+st.subheader('Responses by Answer')
+for field, values in rollups.answers().items():
+    st.write(f"**{field}**")
+    st.dataframe(pd.DataFrame(values).set_index('value'))
+
+st.subheader('Responses by Pin Code')
+st.dataframe(pd.DataFrame(pin_codes).set_index('pin_code'))
@@ -0,0 +1,111 @@
+"""Remove responses that were stored more than once.
+
+Before submissions were idempotent (see idempotency.py), a rerun or a double
+click could store the same response twice. A row is a duplicate when every
+column except the timestamp (pin code, answers, weather and score) equals an
+earlier row's and it was stored within --window seconds of it; scores come
+from live weather, so genuine resubmissions minutes apart rarely match.
+
+    python dedupe_responses.py responses.db --dry-run
+    python dedupe_responses.py responses.db
+    python dedupe_responses.py responses.csv --out responses.deduped.csv
+
+A SQLite store is cleaned in place. A sheet export is written to --out
+without its duplicates, for re-import. Rebuild the analytics rollups
+afterwards with `python analytics.py backfill`.
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+from collections import deque
+from datetime import datetime
+
+from migrate_responses import read_export
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _content_hash(record):
+    content = {key: value for key, value in record.items() if key != 'Timestamp'}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).digest()
+
+
+def _seconds(timestamp):
+    try:
+        return datetime.strptime(str(timestamp), TIMESTAMP_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+def find_duplicates(rows, window=600):
+    """Ids of duplicate rows among (id, record) pairs in timestamp order."""
+    last_seen = {}  # content hash -> time of its latest copy
+    recent = deque()  # (time, hash) in order, to forget hashes older than the window
+    for row_id, record in rows:
+        seen_at = _seconds(record.get('Timestamp'))
+        if seen_at is None:
+            continue
+        digest = _content_hash(record)
+        while recent and recent[0][0] < seen_at - window:
+            old_at, old_digest = recent.popleft()
+            if last_seen.get(old_digest) == old_at:
+                del last_seen[old_digest]
+        previous = last_seen.get(digest)
+        if previous is not None and seen_at - previous <= window:
+            yield row_id
+        # Measure the window from the latest copy, so a burst of repeats goes as one
+        last_seen[digest] = seen_at
+        recent.append((seen_at, digest))
+
+
+def dedupe_sqlite(path, window=600, dry_run=False, batch_size=5000):
+    db = sqlite3.connect(path)
+    try:
+        rows = ((row_id, json.loads(data))
+                for row_id, data in db.execute('SELECT id, data FROM responses ORDER BY timestamp, id'))
+        duplicates = list(find_duplicates(rows, window))
+        if not dry_run:
+            with db:
+                for start in range(0, len(duplicates), batch_size):
+                    batch = duplicates[start:start + batch_size]
+                    db.execute(f"DELETE FROM responses WHERE id IN ({','.join('?' * len(batch))})", batch)
+        return len(duplicates)
+    finally:
+        db.close()
+
+
+def dedupe_export(path, out, window=600, dry_run=False):
+    frame = read_export(path)
+    duplicates = set(find_duplicates(enumerate(frame.to_dict('records')), window))
+    if not dry_run:
+        kept = frame.drop(index=sorted(duplicates))
+        if out.endswith(('.xlsx', '.xlsm')):
+            kept.to_excel(out, index=False)
+        else:
+            kept.to_csv(out, index=False)
+    return len(duplicates)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help='SQLite response store (.db), or a CSV/xlsx export of the response sheet')
+    parser.add_argument('--out', help='Where to write the deduplicated export')
+    parser.add_argument('--window', type=float, default=600,
+                        help='Seconds within which an identical row counts as a duplicate')
+    parser.add_argument('--dry-run', action='store_true', help='Only count the duplicates')
+    args = parser.parse_args(argv)
+
+    if args.source.endswith('.db'):
+        removed = dedupe_sqlite(args.source, args.window, args.dry_run)
+    else:
+        if not args.out and not args.dry_run:
+            parser.error('--out is required for an export')
+        removed = dedupe_export(args.source, args.out, args.window, args.dry_run)
+    print(f"{'Found' if args.dry_run else 'Removed'} {removed} duplicate responses in {args.source}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Per-factor contributions to a risk score (integrated gradients).
+
+Contributions are measured from a baseline row, by default the training mean
+the scaler was fitted on (an "average respondent"), and add up to
+score(row) - score(baseline) up to the error of a `steps`-point Riemann sum.
+Gradients come from a hand-written backward pass through the NumPy model, so
+no TensorFlow is needed.
+
+For zip codes the integration path has two legs: baseline -> the zip's static
+factors, computed once per zip and model and cached, then static -> live
+weather, where only temperature and humidity move. The second leg is the only
+per-request work; the two legs together still add up to the score.
+
+    explainer = explainer_for(model)
+    contributions = explainer.explain_zips(store, '02108', temperature, humidity)
+"""
+import threading
+import weakref
+
+import numpy as np
+
+from features import assemble_features
+from numpy_model import NumpyRiskModel
+
+DEFAULT_STEPS = 64
+
+_explainers = weakref.WeakKeyDictionary()
+_explainers_lock = threading.Lock()
+
+
+def explainer_for(model):
+    """The shared Explainer of a model, or None when the model is not a NumpyRiskModel."""
+    if not isinstance(model, NumpyRiskModel):
+        return None
+    with _explainers_lock:
+        explainer = _explainers.get(model)
+        if explainer is None:
+            explainer = _explainers[model] = Explainer(model)
+        return explainer
+
+
+def input_gradients(model, features):
+    """d score / d feature for each raw feature row."""
+    h = np.asarray(features, dtype=model.dtype)
+    masks = []
+    for kernel, bias, activation in model.layers:
+        h = h @ kernel
+        h += bias
+        if activation == 'relu':
+            mask = h > 0
+            h *= mask
+            masks.append(mask)
+        else:
+            masks.append(None)
+    grad = np.ones((len(h), 1), dtype=model.dtype)
+    for (kernel, _, _), mask in zip(reversed(model.layers), reversed(masks)):
+        if mask is not None:
+            grad *= mask
+        grad = grad @ kernel.T
+    return grad
+
+
+class Explainer:
+    def __init__(self, model, baseline=None, steps=DEFAULT_STEPS, batch_rows=2048):
+        self.model = model
+        self.baseline = np.asarray(model.mean if baseline is None else baseline, dtype=np.float64)
+        self.steps = steps
+        self.batch_rows = batch_rows
+        self.base_score = float(model.predict(self.baseline[None, :])[0])
+        self._alphas = ((np.arange(steps) + 0.5) / steps)[:, None, None]
+        self._static = (None, None)  # (feature store, contributions of its rows)
+        self._lock = threading.Lock()
+
+    def explain_path(self, start, end):
+        """Integrated gradients along the straight line from `start` to `end` rows."""
+        start = np.atleast_2d(np.asarray(start, dtype=np.float64))
+        end = np.atleast_2d(np.asarray(end, dtype=np.float64))
+        start = np.broadcast_to(start, end.shape)
+        out = np.empty(end.shape)
+        # steps x rows x features points per batch, so bound the rows to keep memory flat
+        for i in range(0, len(end), self.batch_rows):
+            delta = end[i:i + self.batch_rows] - start[i:i + self.batch_rows]
+            points = start[i:i + self.batch_rows] + self._alphas * delta
+            grads = input_gradients(self.model, points.reshape(-1, end.shape[1]))
+            out[i:i + self.batch_rows] = grads.reshape(self.steps, len(delta), -1).mean(axis=0) * delta
+        return out
+
+    def explain(self, features):
+        """Contributions of every feature for raw feature rows, relative to the baseline."""
+        return self.explain_path(self.baseline, features)
+
+    def _static_contributions(self, store):
+        cached_store, contributions = self._static
+        if cached_store is not store:
+            with self._lock:
+                cached_store, contributions = self._static
+                if cached_store is not store:
+                    contributions = self.explain(store.matrix)
+                    contributions.setflags(write=False)
+                    self._static = (store, contributions)
+        return contributions
+
+    def explain_zips(self, store, zip_codes, temperature=None, humidity=None):
+        """Contributions for zip codes with live weather; one row per zip, or one vector for a single zip."""
+        rows = store.rows(zip_codes)
+        static_rows = store.matrix[np.atleast_1d(rows)]
+        live = assemble_features(static_rows, temperature, humidity)
+        contributions = self._static_contributions(store)[np.atleast_1d(rows)] + self.explain_path(static_rows, live)
+        return contributions[0] if np.ndim(rows) == 0 else contributions
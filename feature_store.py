@@ -0,0 +1,135 @@
+"""Immutable, array-backed table of per-zip environmental factors.
+
+zip_features.csv holds one row per zip code: its centroid and the 12 model
+factors in FEATURE_NAMES order. The store keeps them as a read-only NumPy
+matrix with a zip -> row index, so requests can never modify the shared data.
+
+With the NumPy model, the first-layer pre-activations of every zip's static
+factors (the scaled features times the first kernel) are computed once per
+model. A request then only adds the live temperature/humidity deltas times
+their two kernel rows, without copying or rescaling the factor rows.
+
+Points (lat/lon) resolve to the zip with the nearest centroid through a
+spatial index built on first use (see spatial_index.py).
+"""
+import csv
+
+import numpy as np
+
+from features import FEATURE_NAMES, HUMIDITY_INDEX, TEMPERATURE_INDEX, TEMPERATURE_OFFSET, assemble_features
+from numpy_model import NumpyRiskModel
+from tracing import tracer
+
+ZIP_FEATURES_PATH = 'zip_features.csv'
+
+PIN_CODE_COLUMN = 'Pin Code'
+LATITUDE_COLUMN = 'Latitude'
+LONGITUDE_COLUMN = 'Longitude'
+# Points further than this from every zip centroid are outside the covered area
+MAX_DISTANCE_KM = 25.0
+
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+class FeatureStore:
+    def __init__(self, zips, coords, matrix):
+        self.zips = tuple(zips)
+        self.index = {z: i for i, z in enumerate(self.zips)}
+        if len(self.index) != len(self.zips):
+            raise ValueError('Duplicate zip codes in feature table')
+        self.coords = _read_only(np.array(coords, dtype=np.float64).reshape(len(self.zips), 2))
+        self.matrix = _read_only(np.array(matrix, dtype=np.float64).reshape(len(self.zips), len(FEATURE_NAMES)))
+        self._precomputed = (None, None)
+        self._spatial_index = None
+
+    @classmethod
+    def load(cls, path=ZIP_FEATURES_PATH):
+        zips, coords, matrix = [], [], []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                zips.append(row[PIN_CODE_COLUMN].zfill(5))
+                coords.append((float(row[LATITUDE_COLUMN]), float(row[LONGITUDE_COLUMN])))
+                matrix.append([float(row[name]) for name in FEATURE_NAMES])
+        return cls(zips, coords, matrix)
+
+    def __len__(self):
+        return len(self.zips)
+
+    def __contains__(self, zip_code):
+        return zip_code in self.index
+
+    def rows(self, zip_codes):
+        """Row numbers for a zip code or a sequence of them."""
+        if isinstance(zip_codes, str):
+            return self.index[zip_codes]
+        try:
+            return np.fromiter((self.index[z] for z in zip_codes), dtype=np.intp)
+        except KeyError as e:
+            raise KeyError(f"Unknown zip code {e.args[0]!r}") from None
+
+    def env_factors(self, zip_code):
+        # Read-only view of the static factors for one zip
+        return self.matrix[self.index[zip_code]]
+
+    def location(self, zip_code):
+        lat, lon = self.coords[self.index[zip_code]]
+        return float(lat), float(lon)
+
+    def locations(self):
+        return {z: (float(lat), float(lon)) for z, (lat, lon) in zip(self.zips, self.coords)}
+
+    @property
+    def spatial_index(self):
+        if self._spatial_index is None:
+            from spatial_index import SpatialIndex
+            self._spatial_index = SpatialIndex(self.coords)
+        return self._spatial_index
+
+    def nearest_zip(self, latitude, longitude):
+        """The zip code with the nearest centroid and its distance in km; arrays of both for arrays of points."""
+        rows, distances = self.spatial_index.nearest(latitude, longitude)
+        if np.ndim(rows) == 0:
+            return self.zips[rows], distances
+        return np.asarray(self.zips)[rows], distances
+
+    def interpolated_factors(self, latitude, longitude, k=4, power=2.0):
+        """Static factors at points, inverse-distance weighted over the k nearest zips."""
+        return self.spatial_index.interpolate(self.matrix, latitude, longitude, k, power)
+
+    def features(self, zip_codes, temperature=None, humidity=None):
+        """Model input rows for the zip codes, with live temperature (Kelvin) and humidity."""
+        with tracer.span('feature_assembly'):
+            return assemble_features(self.matrix[self.rows(zip_codes)], temperature, humidity)
+
+    def _static_first_layer(self, model):
+        cached_model, pre_activations = self._precomputed
+        if cached_model is not model:
+            with tracer.span('scaling'):
+                pre_activations = _read_only(model.first_layer(self.matrix))
+            self._precomputed = (model, pre_activations)
+        return pre_activations
+
+    def score(self, model, zip_codes, temperature=None, humidity=None):
+        """Risk scores for the zip codes; one per zip, or a float for a single zip code."""
+        rows = self.rows(zip_codes)
+        if not isinstance(model, NumpyRiskModel):
+            scores = model.predict(self.features(zip_codes, temperature, humidity))
+            return float(scores[0]) if np.ndim(rows) == 0 else scores
+
+        kernel = model.layers[0][0]
+        pre_activations = self._static_first_layer(model)
+        with tracer.span('feature_assembly'):
+            hidden = pre_activations[np.atleast_1d(rows)]  # fancy indexing copies
+            static = self.matrix[rows]
+            for value, index, offset in ((temperature, TEMPERATURE_INDEX, TEMPERATURE_OFFSET),
+                                         (humidity, HUMIDITY_INDEX, 0)):
+                if value is None:
+                    continue
+                delta = np.asarray(value, dtype=np.float64) - offset - static[..., index]
+                hidden += np.nan_to_num(np.atleast_1d(delta))[:, None] * kernel[index]
+        with tracer.span('inference'):
+            scores = model.predict_from_first_layer(hidden)
+        return float(scores[0]) if np.ndim(rows) == 0 else scores
@@ -0,0 +1,30 @@
+import numpy as np
+
+# Model input order, as in the columns of dataset.xlsx
+FEATURE_NAMES = [
+    'Air Quality', 'Water Quality', 'Noise Pollution', 'Green Spaces', 'Urban Heat Islands',
+    'Housing Quality', 'Light Pollution', 'Traffic Density', 'Industrial Activity',
+    'Socioeconomic Factors', 'Waste Management', 'Radiation',
+]
+
+# Live weather replaces two of the static factors
+HUMIDITY_INDEX = 1
+TEMPERATURE_INDEX = 4
+# OpenWeatherMap reports Kelvin; the model expects temperature - 250
+TEMPERATURE_OFFSET = 250
+
+def assemble_features(env_factors, temperature=None, humidity=None):
+    """Model input rows: the env factors with live temperature (Kelvin) and humidity swapped in.
+
+    Works on a single row or an (n, 12) matrix; temperature and humidity may be
+    scalars or per-row arrays; None (or NaN for a row) leaves the static value in
+    place. Always returns a new float array, never modifies `env_factors`.
+    """
+    features = np.array(env_factors, dtype=np.float64, ndmin=2)
+    if temperature is not None:
+        column = np.asarray(temperature, dtype=np.float64) - TEMPERATURE_OFFSET
+        features[:, TEMPERATURE_INDEX] = np.where(np.isnan(column), features[:, TEMPERATURE_INDEX], column)
+    if humidity is not None:
+        column = np.asarray(humidity, dtype=np.float64)
+        features[:, HUMIDITY_INDEX] = np.where(np.isnan(column), features[:, HUMIDITY_INDEX], column)
+    return features
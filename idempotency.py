@@ -0,0 +1,83 @@
+"""Idempotent submissions: one result per (session, form contents).
+
+A Streamlit rerun or a double click on Calculate Risk Score submits the same
+answers again. Each submission is keyed by a hash of the session id, the pin
+code and the answers; within `ttl` seconds a repeated key returns the result
+of the first submission instead of fetching weather, scoring and persisting
+again. A repeat that arrives while the first is still running waits for it.
+
+    cache = IdempotencyCache(ttl=600, max_entries=10000)
+    key = submission_key(session_id, pin_code, answers)
+    result, repeated = cache.get_or_compute(key, lambda: pipeline.assess(pin_code, answers))
+
+Rows already stored twice are removed by dedupe_responses.py.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def submission_key(session_id, pin_code, answers):
+    """A stable hash of who submitted what; answer order and list/tuple types do not matter."""
+    payload = json.dumps([session_id, pin_code, answers], sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotencyCache:
+    def __init__(self, ttl=600, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (result, stored_at)
+        self._inflight = {}  # key -> Future of the first submission
+        self.counters = {'hits': 0, 'misses': 0, 'coalesced': 0, 'expired': 0, 'evicted': 0, 'errors': 0}
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        """(result, repeated): the earlier result for `key`, or compute() run once.
+
+        A result for which cacheable(result) is false is returned but not
+        kept, so the next repeat computes again; errors are never kept.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.monotonic() - entry[1] < self.ttl:
+                    self.counters['hits'] += 1
+                    self._entries.move_to_end(key)
+                    return entry[0], True
+                self.counters['expired'] += 1
+                del self._entries[key]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                self.counters['misses'] += 1
+                future = self._inflight[key] = Future()
+            else:
+                self.counters['coalesced'] += 1
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = compute()
+        except Exception as e:
+            with self._lock:
+                self.counters['errors'] += 1
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+            if cacheable is None or cacheable(result):
+                self._entries[key] = (result, time.monotonic())
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.counters['evicted'] += 1
+        future.set_result(result)
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), inflight=len(self._inflight))
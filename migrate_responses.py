@@ -0,0 +1,50 @@
+"""One-time migration of an exported response sheet into the SQLite store.
+
+Export the Google Sheet as CSV or xlsx (File > Download), then:
+
+    python migrate_responses.py responses.csv --db responses.db
+"""
+import argparse
+import sys
+
+import pandas as pd
+
+from storage import SQLITE_PATH, SQLiteStore
+
+
+def read_export(path):
+    if path.endswith(('.xlsx', '.xlsm')):
+        frame = pd.read_excel(path, dtype={'Pin Code': str})
+    else:
+        frame = pd.read_csv(path, dtype={'Pin Code': str}, keep_default_na=False)
+    if 'Pin Code' in frame.columns:
+        # Sheets turns 02108 into 2108
+        frame['Pin Code'] = frame['Pin Code'].astype(str).str.zfill(5)
+    return frame.astype(object).where(frame.notna(), '')
+
+
+def migrate(path, db_path=SQLITE_PATH, batch_size=5000):
+    frame = read_export(path)
+    store = SQLiteStore(db_path)
+    try:
+        if store.count():
+            raise SystemExit(f"{db_path} already holds {store.count()} responses; refusing to migrate twice")
+        records = frame.to_dict('records')
+        for start in range(0, len(records), batch_size):
+            store.append(records[start:start + batch_size])
+        return store.count()
+    finally:
+        store.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('export', help='CSV or xlsx export of the response sheet')
+    parser.add_argument('--db', default=SQLITE_PATH, help='SQLite database to create')
+    args = parser.parse_args(argv)
+    print(f"Migrated {migrate(args.export, args.db)} responses into {args.db}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
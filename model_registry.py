@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+
+from features import FEATURE_NAMES
+from numpy_model import ARTIFACT_PATH, NumpyRiskModel, export_artifact, is_optimized
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = 'risk_score_model.h5'
+SCALER_PATH = 'scaler.pkl'
+
+# Versions written by train.py: models/<version>/ with the three artifact files and metadata.json
+MODELS_DIR = 'models'
+METADATA_FILE = 'metadata.json'
+
+
+class KerasRiskModel:
+    """The original TensorFlow path: scaler.transform followed by model.predict."""
+
+    def __init__(self, model, scaler):
+        self.model = model
+        self.scaler = scaler
+        self.n_features = scaler.n_features_in_
+
+    def predict(self, features):
+        with tracer.span('scaling'):
+            scaled = self.scaler.transform(np.atleast_2d(np.asarray(features, dtype=np.float64)))
+        with tracer.span('inference'):
+            return self.model.predict(scaled, verbose=0)[:, 0]
+
+
+def read_metadata(version, models_dir=MODELS_DIR):
+    with open(os.path.join(models_dir, version, METADATA_FILE)) as f:
+        return json.load(f)
+
+
+def list_versions(models_dir=MODELS_DIR):
+    """Metadata of every trained version, oldest first."""
+    if not os.path.isdir(models_dir):
+        return []
+    versions = [read_metadata(name, models_dir) for name in os.listdir(models_dir)
+                if os.path.exists(os.path.join(models_dir, name, METADATA_FILE))]
+    return sorted(versions, key=lambda metadata: metadata['created_at'])
+
+
+def version_paths(version, models_dir=MODELS_DIR):
+    """(model_path, scaler_path, artifact_path) of a trained version; 'latest' is the newest."""
+    if version == 'latest':
+        versions = list_versions(models_dir)
+        if not versions:
+            raise FileNotFoundError(f"No trained model versions in {models_dir!r}")
+        version = versions[-1]['version']
+    metadata = read_metadata(version, models_dir)
+    if metadata['feature_names'] != FEATURE_NAMES:
+        raise ValueError(f"Model version {version} was trained on features {metadata['feature_names']}, "
+                         f"expected {FEATURE_NAMES}")
+    directory = os.path.join(models_dir, version)
+    return tuple(os.path.join(directory, os.path.basename(path)) for path in (MODEL_PATH, SCALER_PATH, ARTIFACT_PATH))
+
+
+def rss_bytes():
+    # Resident set size of this process (falls back to the peak RSS off Linux)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ModelRegistry:
+    """Process-wide holder for the risk model.
+
+    Loads the model once, runs a warm-up prediction, and reloads it when one of
+    its files changes on disk. A failed reload keeps serving the previous model.
+
+    The default 'numpy' backend serves the exported .npz artifact and re-exports
+    it whenever the .h5 model or the scaler is newer. The 'keras' backend loads
+    the .h5 model through TensorFlow.
+
+    ModelRegistry.for_version() serves a version trained by train.py instead of
+    the files in the working directory.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, scaler_path=SCALER_PATH, backend='numpy',
+                 artifact_path=ARTIFACT_PATH, check_interval=2.0):
+        if backend not in ('numpy', 'keras'):
+            raise ValueError(f"Unknown model backend {backend!r}")
+        self.model_path = model_path
+        self.scaler_path = scaler_path
+        self.artifact_path = artifact_path
+        self.backend = backend
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._model = None
+        self._mtimes = None
+        self._last_check = 0.0
+        self.stats = {
+            'backend': backend,
+            'loads': 0,
+            'reload_errors': 0,
+            'last_error': None,
+            'load_seconds': None,
+            'warmup_seconds': None,
+            'rss_bytes': None,
+            'rss_delta_bytes': None,
+            'loaded_at': None,
+        }
+        with self._lock:
+            self._load()
+
+    @classmethod
+    def for_version(cls, version, backend='numpy', models_dir=MODELS_DIR, **kwargs):
+        model_path, scaler_path, artifact_path = version_paths(version, models_dir)
+        registry = cls(model_path, scaler_path, backend=backend, artifact_path=artifact_path, **kwargs)
+        registry.stats['version'] = os.path.basename(os.path.dirname(model_path))
+        return registry
+
+    def _file_mtimes(self):
+        paths = [self.model_path, self.scaler_path]
+        if self.backend == 'numpy' and os.path.exists(self.artifact_path):
+            paths.append(self.artifact_path)
+        return tuple(os.stat(p).st_mtime_ns for p in paths)
+
+    def _load_numpy(self):
+        source_mtime = max(os.stat(self.model_path).st_mtime_ns, os.stat(self.scaler_path).st_mtime_ns)
+        if not os.path.exists(self.artifact_path):
+            export_artifact(self.model_path, self.scaler_path, self.artifact_path)
+        elif os.stat(self.artifact_path).st_mtime_ns < source_mtime:
+            if is_optimized(self.artifact_path):
+                # Re-exporting would silently replace it with the unoptimized model
+                logger.warning('%s is older than %s; re-run optimize.py to refresh it',
+                               self.artifact_path, self.model_path)
+            else:
+                export_artifact(self.model_path, self.scaler_path, self.artifact_path)
+        return NumpyRiskModel.load(self.artifact_path)
+
+    def _load_keras(self):
+        from tensorflow.keras.models import load_model
+
+        model = load_model(self.model_path)
+        with open(self.scaler_path, 'rb') as f:
+            scaler = pickle.load(f)
+        return KerasRiskModel(model, scaler)
+
+    def _load(self):
+        rss_before = rss_bytes()
+        start = time.perf_counter()
+        model = self._load_numpy() if self.backend == 'numpy' else self._load_keras()
+        loaded = time.perf_counter()
+
+        # Warm-up inference so the first real request doesn't pay for lazy initialisation
+        model.predict(np.zeros((1, model.n_features)))
+        warmed = time.perf_counter()
+
+        rss_after = rss_bytes()
+        self._model = model
+        self._mtimes = self._file_mtimes()
+        self._last_check = time.monotonic()
+        self.stats.update({
+            'loads': self.stats['loads'] + 1,
+            'load_seconds': loaded - start,
+            'warmup_seconds': warmed - loaded,
+            'rss_bytes': rss_after,
+            'rss_delta_bytes': rss_after - rss_before,
+            'loaded_at': time.time(),
+        })
+        logger.info(
+            'Loaded %s model from %s in %.2fs (warm-up %.2fs, RSS %+.1f MB)',
+            self.backend, self.model_path, loaded - start, warmed - loaded,
+            (rss_after - rss_before) / 2**20,
+        )
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            changed = self._file_mtimes() != self._mtimes
+        except OSError:
+            # A file is mid-replace; try again on the next check
+            return
+        if not changed:
+            return
+        try:
+            self._load()
+        except Exception as e:
+            self.stats['reload_errors'] += 1
+            self.stats['last_error'] = str(e)
+            logger.warning('Reload of %s failed, keeping previous model: %s', self.model_path, e)
+
+    def get(self):
+        with self._lock:
+            self._reload_if_changed()
+            return self._model
@@ -0,0 +1,200 @@
+"""Pure-NumPy forward pass for the risk score model.
+
+The exporter reads the dense layers straight out of the Keras .h5 file with
+h5py, plus the StandardScaler parameters, and writes them to one .npz file.
+Serving then needs only NumPy: no TensorFlow import, no scikit-learn unpickle.
+
+    python numpy_model.py export
+    python numpy_model.py verify --data dataset.xlsx
+"""
+import argparse
+import json
+import pickle
+import sys
+
+import numpy as np
+
+from tracing import tracer
+
+MODEL_PATH = 'risk_score_model.h5'
+SCALER_PATH = 'scaler.pkl'
+ARTIFACT_PATH = 'risk_score_model.npz'
+
+ACTIVATIONS = ('linear', 'relu')
+
+
+def _read_dense_layers(model_path):
+    import h5py
+
+    layers = []
+    with h5py.File(model_path, 'r') as f:
+        config = json.loads(f.attrs['model_config'])
+        weights = f['model_weights']
+        for layer in config['config']['layers']:
+            if layer['class_name'] == 'InputLayer':
+                continue
+            if layer['class_name'] != 'Dense':
+                raise ValueError(f"Unsupported layer type {layer['class_name']!r}")
+            name = layer['config']['name']
+            activation = layer['config'].get('activation', 'linear')
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation {activation!r} in layer {name!r}")
+            group = weights[name]
+            kernel_name, bias_name = (n.decode() if isinstance(n, bytes) else n
+                                      for n in group.attrs['weight_names'])
+            layers.append((np.asarray(group[kernel_name]), np.asarray(group[bias_name]), activation))
+    return layers
+
+
+def read_source(model_path=MODEL_PATH, scaler_path=SCALER_PATH):
+    """The dense layers of the .h5 model and the scaler's mean and scale."""
+    layers = _read_dense_layers(model_path)
+    with open(scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+    n_features = layers[0][0].shape[0]
+    mean = scaler.mean_ if getattr(scaler, 'with_mean', True) else np.zeros(n_features)
+    scale = scaler.scale_ if getattr(scaler, 'with_std', True) else np.ones(n_features)
+    return layers, np.asarray(mean, dtype=np.float64), np.asarray(scale, dtype=np.float64)
+
+
+def write_artifact(out_path, layers, mean, scale, **extra):
+    arrays = {
+        'mean': mean,
+        'scale': scale,
+        'activations': np.asarray([activation for _, _, activation in layers]),
+    }
+    for i, (kernel, bias, _) in enumerate(layers):
+        arrays[f'kernel_{i}'] = kernel
+        arrays[f'bias_{i}'] = bias
+    arrays.update(extra)
+    np.savez_compressed(out_path, **arrays)
+    return out_path
+
+
+def export_artifact(model_path=MODEL_PATH, scaler_path=SCALER_PATH, out_path=ARTIFACT_PATH):
+    return write_artifact(out_path, *read_source(model_path, scaler_path))
+
+
+def is_optimized(path):
+    """Whether an artifact was written by optimize.py rather than exported from the .h5 model."""
+    with np.load(path) as data:
+        return 'optimization' in data.files
+
+
+class NumpyRiskModel:
+    """Dense ReLU network with the StandardScaler folded into the first layer.
+
+    `predict` takes raw (unscaled) feature rows and returns one score per row.
+    Weights are folded in float64 and then stored in `dtype` (optimize.py can
+    write float32 artifacts, and int8 kernels with per-column scales).
+    """
+
+    def __init__(self, layers, mean, scale, dtype=np.float64):
+        mean = np.asarray(mean, dtype=np.float64)
+        scale = np.asarray(scale, dtype=np.float64)
+        self.mean = mean
+        self.scale = scale
+        self.n_features = mean.shape[0]
+        self.dtype = np.dtype(dtype)
+
+        # (x - mean) / scale @ W + b  ==  x @ (W / scale) + (b - (mean / scale) @ W)
+        kernel, bias, activation = layers[0]
+        kernel = np.asarray(kernel, dtype=np.float64)
+        folded = [(kernel / scale[:, None], np.asarray(bias, dtype=np.float64) - (mean / scale) @ kernel,
+                   activation)]
+        for kernel, bias, activation in layers[1:]:
+            folded.append((np.asarray(kernel, dtype=np.float64), np.asarray(bias, dtype=np.float64),
+                           activation))
+        self.layers = [(kernel.astype(self.dtype), bias.astype(self.dtype), activation)
+                       for kernel, bias, activation in folded]
+
+    @classmethod
+    def load(cls, path=ARTIFACT_PATH):
+        with np.load(path) as data:
+            activations = [str(a) for a in data['activations']]
+            layers = []
+            for i, activation in enumerate(activations):
+                kernel = data[f'kernel_{i}']
+                if f'kernel_scale_{i}' in data.files:
+                    # int8 kernel with one scale per output column
+                    kernel = kernel.astype(np.float64) * data[f'kernel_scale_{i}']
+                layers.append((kernel, data[f'bias_{i}'], activation))
+            dtype = str(data['dtype']) if 'dtype' in data.files else 'float64'
+            return cls(layers, data['mean'], data['scale'], dtype=dtype)
+
+    def first_layer(self, features):
+        """First-layer pre-activations for raw feature rows."""
+        x = np.asarray(features, dtype=self.dtype)
+        if x.ndim == 1:
+            x = x[None, :]
+        kernel, bias, _ = self.layers[0]
+        x = x @ kernel
+        x += bias
+        return x
+
+    def predict_from_first_layer(self, x):
+        """Finish the forward pass from first-layer pre-activations (modifies `x`)."""
+        for i, (kernel, bias, activation) in enumerate(self.layers):
+            if i:
+                x = x @ kernel
+                x += bias
+            if activation == 'relu':
+                np.maximum(x, 0, out=x)
+        return x[:, 0]
+
+    def predict(self, features):
+        # The scaler is folded into the first layer, so its matmul is the 'scaling' stage
+        with tracer.span('scaling'):
+            x = self.first_layer(features)
+        with tracer.span('inference'):
+            return self.predict_from_first_layer(x)
+
+
+def verify(data_path, model_path=MODEL_PATH, scaler_path=SCALER_PATH, artifact_path=ARTIFACT_PATH,
+           tolerance=1e-6):
+    import pandas as pd
+    from tensorflow.keras.models import load_model
+
+    model = load_model(model_path)
+    with open(scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+    predictor = NumpyRiskModel.load(artifact_path)
+
+    frame = pd.read_excel(data_path) if data_path.endswith('.xlsx') else pd.read_csv(data_path)
+    features = frame.iloc[:, :predictor.n_features].to_numpy(dtype=np.float64)
+
+    expected = model.predict(scaler.transform(features), verbose=0)[:, 0].astype(np.float64)
+    actual = predictor.predict(features)
+    # Keras computes in float32, so compare relative to the float32 resolution of each score
+    diff = np.abs(actual - expected) / np.maximum(np.abs(expected), 1.0)
+    print(f"rows={len(features)} max_abs_diff={np.abs(actual - expected).max():.3e} "
+          f"max_rel_diff={diff.max():.3e} tolerance={tolerance:g}")
+    return bool(diff.max() <= tolerance)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export = sub.add_parser('export', help='Write the .npz artifact from the .h5 model and scaler')
+    export.add_argument('--model', default=MODEL_PATH)
+    export.add_argument('--scaler', default=SCALER_PATH)
+    export.add_argument('--out', default=ARTIFACT_PATH)
+
+    check = sub.add_parser('verify', help='Compare the NumPy predictor against model.predict')
+    check.add_argument('--data', default='dataset.xlsx')
+    check.add_argument('--model', default=MODEL_PATH)
+    check.add_argument('--scaler', default=SCALER_PATH)
+    check.add_argument('--artifact', default=ARTIFACT_PATH)
+    check.add_argument('--tolerance', type=float, default=1e-6)
+
+    args = parser.parse_args(argv)
+    if args.command == 'export':
+        print(export_artifact(args.model, args.scaler, args.out))
+        return 0
+    ok = verify(args.data, args.model, args.scaler, args.artifact, args.tolerance)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
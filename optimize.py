@@ -0,0 +1,256 @@
+"""Quantized and pruned variants of the risk model, gated on score drift.
+
+Builds smaller NumPy artifacts (see numpy_model.py) from risk_score_model.h5
+and scaler.pkl, scores dataset.xlsx with each, and compares against the
+float64 export of the original model, which matches Keras to within float32
+resolution (`numpy_model.py verify`):
+
+  float32       the same weights, computed in float32
+  int8          int8 kernels with one scale per output column, float32 compute
+  pruned        hidden units removed by activation x outgoing-weight magnitude,
+                dead units first, with each following layer refitted by least
+                squares to reproduce the original network on the drift rows;
+                by default each layer loses as many units as --max-drift allows
+  pruned-int8   both
+
+Every variant is reported with its file size, weight memory, per-row latency
+and drift. Without --variant the command exits non-zero if any variant's
+largest absolute score drift is over --max-drift, so a CI step running it
+fails on drift. With --variant and --out, the chosen variant is written only
+if its drift is within --max-drift, and only that variant decides the exit
+status. Serve the result with `model_artifact = "<path>"` in secrets.
+
+    python optimize.py
+    python optimize.py --variant pruned-int8 --out risk_score_model.opt.npz
+    python optimize.py --prune-fraction 0.25 --max-drift 1.0
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from batch_score import read_chunks
+from features import FEATURE_NAMES
+from model_registry import MODEL_PATH, SCALER_PATH
+from numpy_model import NumpyRiskModel, read_source, write_artifact
+from train import measure_latency
+
+VARIANTS = ('float32', 'int8', 'pruned', 'pruned-int8')
+
+
+def quantize_int8(kernel):
+    """Symmetric per-output-column int8 quantization: kernel ~= q * scale."""
+    scale = np.abs(kernel).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.rint(kernel / scale), -127, 127).astype(np.int8)
+    return q, scale
+
+
+def _activate(x, activation):
+    return np.maximum(x, 0) if activation == 'relu' else x
+
+
+def prune_units(layers, mean, scale, features, fractions, ridge=1e-3):
+    """Drop `fractions[i]` of hidden layer i's units, least important first.
+
+    A unit's importance is its mean activation on `features` times the norm of
+    its outgoing weights; units that never activate have none. After each cut
+    the next layer is refitted by least squares so that, on `features`, it
+    reproduces the pre-activations of the original network; the ridge term
+    pulls it towards its current weights, so a lossless cut changes nothing.
+    """
+    layers = [(np.asarray(k, dtype=np.float64), np.asarray(b, dtype=np.float64), a) for k, b, a in layers]
+    x = (np.asarray(features, dtype=np.float64) - mean) / scale
+    targets = []
+    original = x
+    for kernel, bias, activation in layers:
+        targets.append(original @ kernel + bias)
+        original = _activate(targets[-1], activation)
+
+    for i in range(len(layers) - 1):
+        kernel, bias, activation = layers[i]
+        next_kernel, next_bias, next_activation = layers[i + 1]
+        hidden = _activate(x @ kernel + bias, activation)
+        importance = np.abs(hidden).mean(axis=0) * np.linalg.norm(next_kernel, axis=1)
+        n_drop = min(int(round(fractions[i] * kernel.shape[1])), kernel.shape[1] - 1)
+        keep = np.sort(np.argsort(importance, kind='stable')[n_drop:])
+        hidden = hidden[:, keep]
+
+        design = np.hstack([hidden, np.ones((len(hidden), 1))])
+        current = np.vstack([next_kernel[keep], next_bias])
+        gram = design.T @ design
+        penalty = ridge * np.trace(gram) / len(gram) * np.eye(len(gram))
+        solution = np.linalg.solve(gram + penalty, design.T @ targets[i + 1] + penalty @ current)
+        layers[i] = (kernel[:, keep], bias[keep], activation)
+        layers[i + 1] = (solution[:-1], solution[-1], next_activation)
+        x = hidden
+    return layers
+
+
+def _served(layers, int8):
+    # The weights as NumpyRiskModel.load will see them
+    if not int8:
+        return layers
+    return [(q.astype(np.float64) * s, bias, activation)
+            for (q, s), (_, bias, activation) in zip((quantize_int8(k) for k, _, _ in layers), layers)]
+
+
+def _max_drift(layers, mean, scale, features, reference, int8):
+    predictor = NumpyRiskModel(_served(layers, int8), mean, scale, dtype=np.float32)
+    return float(np.abs(predictor.predict(features) - reference).max())
+
+
+def prune_within(layers, mean, scale, features, reference, max_drift, int8=False):
+    """Per-layer shares to prune, as large as the drift budget allows.
+
+    Deeper layers are searched first, since they are usually the most
+    redundant; each layer's share is a binary search over its unit count.
+    """
+    fractions = [0.0] * (len(layers) - 1)
+    for i in reversed(range(len(fractions))):
+        width = layers[i][0].shape[1]
+        low, high = 0, width - 1  # units that can / cannot yet be shown to be removable
+        while low < high:
+            n_drop = (low + high + 1) // 2
+            trial = fractions[:i] + [n_drop / width] + fractions[i + 1:]
+            pruned = prune_units(layers, mean, scale, features, trial)
+            if _max_drift(pruned, mean, scale, features, reference, int8) <= max_drift:
+                low = n_drop
+            else:
+                high = n_drop - 1
+        fractions[i] = low / width
+    return fractions
+
+
+def build_variant(name, layers, mean, scale, features, reference, out_path, prune_fraction=None, max_drift=0.5):
+    """Write one variant; a prune_fraction of None prunes as far as max_drift allows."""
+    extra = {'dtype': np.asarray('float32'), 'optimization': np.asarray(name)}
+    int8 = name.endswith('int8')
+    if name.startswith('pruned'):
+        if prune_fraction is None:
+            fractions = prune_within(layers, mean, scale, features, reference, max_drift, int8)
+        else:
+            fractions = [prune_fraction] * (len(layers) - 1)
+        layers = prune_units(layers, mean, scale, features, fractions)
+    stored = []
+    for i, (kernel, bias, activation) in enumerate(layers):
+        if int8:
+            kernel, extra[f'kernel_scale_{i}'] = quantize_int8(np.asarray(kernel, dtype=np.float64))
+        else:
+            kernel = np.asarray(kernel, dtype=np.float32)
+        stored.append((kernel, np.asarray(bias, dtype=np.float32), activation))
+    return write_artifact(out_path, stored, mean, scale, **extra)
+
+
+def drift(reference, candidate):
+    error = np.abs(candidate - reference)
+    return {
+        'max_abs': float(error.max()),
+        'mean_abs': float(error.mean()),
+        'p99_abs': float(np.percentile(error, 99)),
+    }
+
+
+def describe(predictor, path):
+    kernels = [kernel for kernel, _, _ in predictor.layers]
+    return {
+        'file_bytes': os.path.getsize(path),
+        'weight_bytes': sum(kernel.nbytes + bias.nbytes for kernel, bias, _ in predictor.layers),
+        'parameters': sum(kernel.size + bias.size for kernel, bias, _ in predictor.layers),
+        'hidden': [int(kernel.shape[1]) for kernel in kernels[:-1]],
+        'latency': measure_latency(predictor),
+    }
+
+
+def load_features(path, chunk_size=50000):
+    return pd.concat(read_chunks(path, chunk_size))[FEATURE_NAMES].to_numpy(dtype=np.float64)
+
+
+def optimize(data_path, out_dir, model_path=MODEL_PATH, scaler_path=SCALER_PATH, prune_fraction=None,
+             max_drift=0.5, variants=VARIANTS):
+    """Write the baseline and each variant to out_dir/<name>.npz and report on them."""
+    features = load_features(data_path)
+    layers, mean, scale = read_source(model_path, scaler_path)
+    baseline_path = write_artifact(os.path.join(out_dir, 'baseline.npz'), layers, mean, scale)
+    baseline = NumpyRiskModel.load(baseline_path)
+    reference = baseline.predict(features)
+    report = {'rows': len(features), 'max_drift': max_drift, 'prune_fraction': prune_fraction,
+              'baseline': describe(baseline, baseline_path), 'variants': {}}
+    base = report['baseline']
+    for name in variants:
+        path = build_variant(name, layers, mean, scale, features, reference, os.path.join(out_dir, f'{name}.npz'),
+                             prune_fraction, max_drift)
+        predictor = NumpyRiskModel.load(path)
+        entry = describe(predictor, path)
+        entry['drift'] = drift(reference, predictor.predict(features))
+        entry['passed'] = entry['drift']['max_abs'] <= max_drift
+        entry['savings'] = {
+            'file_size': 1 - entry['file_bytes'] / base['file_bytes'],
+            'weight_memory': 1 - entry['weight_bytes'] / base['weight_bytes'],
+            'single_row_latency': 1 - entry['latency']['single_row_us'] / base['latency']['single_row_us'],
+            'batch_row_latency': 1 - entry['latency']['batch_per_row_us'] / base['latency']['batch_per_row_us'],
+        }
+        report['variants'][name] = entry
+    return report
+
+
+def _print_table(report):
+    rows = [('baseline', report['baseline'], None)]
+    rows += [(name, entry, entry['drift']) for name, entry in report['variants'].items()]
+    print(f"{'variant':<12} {'hidden':<12} {'file B':>8} {'weights B':>10} {'1-row us':>9} {'us/row':>8} "
+          f"{'max drift':>10} {'p99 drift':>10}  gate", file=sys.stderr)
+    for name, entry, entry_drift in rows:
+        gate = '' if entry_drift is None else ('pass' if entry['passed'] else 'FAIL')
+        max_abs = '' if entry_drift is None else f"{entry_drift['max_abs']:.4f}"
+        p99 = '' if entry_drift is None else f"{entry_drift['p99_abs']:.4f}"
+        print(f"{name:<12} {','.join(map(str, entry['hidden'])):<12} {entry['file_bytes']:>8} "
+              f"{entry['weight_bytes']:>10} {entry['latency']['single_row_us']:>9.2f} "
+              f"{entry['latency']['batch_per_row_us']:>8.3f} {max_abs:>10} {p99:>10}  {gate}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='dataset.xlsx', help='Rows to measure drift on (.xlsx, .csv, .parquet)')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--scaler', default=SCALER_PATH)
+    parser.add_argument('--prune-fraction', type=float,
+                        help='Share of each hidden layer\'s units to remove (default: as many as --max-drift allows)')
+    parser.add_argument('--max-drift', type=float, default=0.5,
+                        help='Largest allowed absolute score change on any row')
+    parser.add_argument('--variant', choices=VARIANTS, help='Variant to write to --out')
+    parser.add_argument('--out', help='Artifact path for --variant')
+    parser.add_argument('--report', help='Also write the JSON report here')
+    args = parser.parse_args(argv)
+    if bool(args.variant) != bool(args.out):
+        parser.error('--variant and --out go together')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report = optimize(args.data, tmp, args.model, args.scaler, args.prune_fraction, args.max_drift)
+        _print_table(report)
+        print(json.dumps(report, indent=2))
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(report, f, indent=2)
+        if not args.variant:
+            failed = [name for name, entry in report['variants'].items() if not entry['passed']]
+            if failed:
+                print(f"FAIL: {', '.join(failed)} drift by more than --max-drift {args.max_drift:g}", file=sys.stderr)
+                return 1
+            return 0
+        entry = report['variants'][args.variant]
+        if not entry['passed']:
+            print(f"FAIL: {args.variant} drifts by up to {entry['drift']['max_abs']:.4f} "
+                  f"(--max-drift {args.max_drift:g}); not written", file=sys.stderr)
+            return 1
+        shutil.move(os.path.join(tmp, f'{args.variant}.npz'), args.out)
+        print(f"Wrote {args.variant} artifact to {args.out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Durable write-behind queue for survey responses.
+
+The request path only inserts the row into a local SQLite database (WAL
+mode), which takes microseconds. A background thread hands pending rows to
+the response store (see storage.py) in bulk, and retries with exponential
+back-off when the store is unavailable. Rows are deleted from the queue only
+after the store accepted them, so nothing is lost across restarts (delivery
+is at-least-once).
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+QUEUE_PATH = 'pending_responses.db'
+
+
+class PersistenceQueue:
+    def __init__(self, store, path=QUEUE_PATH, batch_size=500, flush_interval=2.0, max_backoff=300):
+        self.store = store
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._db_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        # NORMAL survives an application crash; only an OS crash can lose the last commits
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS pending ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' header TEXT NOT NULL,'
+            ' row TEXT NOT NULL,'
+            ' queued_at REAL NOT NULL)'
+        )
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.counters = {'queued': 0, 'flushed': 0, 'batches': 0, 'errors': 0, 'last_error': None}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='persistence-flusher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, flush=True):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        if flush:
+            self.flush()
+
+    def put(self, data):
+        with self._db_lock:
+            self._db.execute(
+                'INSERT INTO pending (header, row, queued_at) VALUES (?, ?, ?)',
+                (json.dumps(list(data.keys())), json.dumps(list(data.values())), time.time()),
+            )
+            self.counters['queued'] += 1
+            unsent = self.counters['queued'] - self.counters['flushed']
+        if unsent >= self.batch_size:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._db_lock:
+            return self._db.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+
+    def flush(self):
+        """Send every pending row to the store; returns how many were written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._db_lock:
+                    batch = self._db.execute(
+                        'SELECT id, header, row FROM pending ORDER BY id LIMIT ?', (self.batch_size,)
+                    ).fetchall()
+                if not batch:
+                    return written
+                with tracer.span('persistence_flush'):
+                    self.store.append([dict(zip(json.loads(header), json.loads(row))) for _, header, row in batch])
+                with self._db_lock:
+                    self._db.execute('DELETE FROM pending WHERE id <= ?', (batch[-1][0],))
+                    self.counters['flushed'] += len(batch)
+                    self.counters['batches'] += 1
+                written += len(batch)
+
+    def _run(self):
+        failures = 0
+        while not self._stopped.is_set():
+            delay = self.flush_interval
+            try:
+                self.flush()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                self.counters['errors'] += 1
+                self.counters['last_error'] = str(e)
+                delay = min(self.flush_interval * 2 ** failures, self.max_backoff)
+                logger.warning('Flushing responses failed (%d in a row), retrying in %.1fs: %s',
+                               failures, delay, e)
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+    def stats(self):
+        return dict(self.counters, pending=self.pending())
@@ -0,0 +1,217 @@
+"""The Calculate Risk Score flow, shared by the Streamlit app and the HTTP API.
+
+pin code + survey answers -> weather lookup -> feature assembly -> model ->
+response record -> persistence, returning the score, the factor breakdown and
+each factor's contribution to the score (see explain.py). With an
+IdempotencyCache, a repeated submission from the same session returns the
+first result (marked 'repeated') without running the flow again.
+Each stage is timed by tracing.tracer when tracing is enabled.
+"""
+import math
+from datetime import datetime
+
+import numpy as np
+
+from explain import explainer_for
+from feature_store import MAX_DISTANCE_KM
+from features import FEATURE_NAMES, HUMIDITY_INDEX, TEMPERATURE_INDEX
+from idempotency import submission_key
+from tracing import tracer
+
+# Survey answers, in the column order of the response sheet
+ANSWER_FIELDS = [
+    'Age', 'Gender', 'Years Residence', 'Respiratory Illnesses', 'Other Respiratory Illness',
+    'Chronic Conditions', 'Healthcare Visits', 'Air Quality', 'Exposed to Smoke', 'Smoke Frequency',
+    'Mold Concerns', 'Mold Description', 'Pollution Nearby', 'Pollution Description', 'Green Space Visits',
+    'Air Purification', 'Purification Type', 'Neighborhood Noise', 'Noise Sources', 'Artificial Light',
+    'Light Description', 'Environmental Issue', 'Additional Comments',
+]
+INT_FIELDS = ('Age', 'Years Residence', 'Healthcare Visits')
+
+# Static factors shown with a result; humidity and temperature come from the live weather
+DISPLAY_FACTORS = [(i, name) for i, name in enumerate(FEATURE_NAMES) if i not in (HUMIDITY_INDEX, TEMPERATURE_INDEX)]
+
+# Names of the model inputs in a score explanation
+CONTRIBUTION_NAMES = list(FEATURE_NAMES)
+CONTRIBUTION_NAMES[HUMIDITY_INDEX] = 'Current Humidity'
+CONTRIBUTION_NAMES[TEMPERATURE_INDEX] = 'Current Temperature'
+
+
+class PipelineError(Exception):
+    """The request cannot be scored (unknown pin code, no weather data, invalid answers)."""
+
+
+def clean_answers(answers):
+    """Answers checked against ANSWER_FIELDS, with the integer fields as ints; raises PipelineError."""
+    cleaned = {}
+    for field, value in answers.items():
+        if field not in ANSWER_FIELDS:
+            raise PipelineError(f"Unknown answer field {field!r}")
+        if field in INT_FIELDS:
+            if value in (None, ''):
+                value = 0
+            elif isinstance(value, float) and value.is_integer():
+                value = int(value)
+            elif isinstance(value, str) and value.strip().lstrip('+-').isdigit():
+                value = int(value)
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise PipelineError(f"{field} must be a whole number")
+        elif value is None:
+            value = ''
+        elif isinstance(value, (list, tuple)):
+            if not all(isinstance(item, str) for item in value):
+                raise PipelineError(f"{field} must be a list of strings")
+        elif isinstance(value, float) and not math.isfinite(value):
+            raise PipelineError(f"{field} must be finite")
+        elif not isinstance(value, (str, int, float)):
+            raise PipelineError(f"{field} must be a string, a number or a list of strings")
+        cleaned[field] = value
+    return cleaned
+
+
+def build_record(pin_code, answers, temperature, humidity, risk_score, timestamp=None):
+    """The response row stored for one submission."""
+    record = {
+        'Timestamp': (timestamp or datetime.now()).strftime("%Y-%m-%d %H:%M:%S"),
+        'Pin Code': pin_code,
+    }
+    for field in ANSWER_FIELDS:
+        value = answers.get(field, '')
+        if field in INT_FIELDS:
+            value = int(value or 0)
+        elif isinstance(value, (list, tuple)):
+            value = ', '.join(value)
+        record[field] = value
+    record['CURRENT TEMPERATURE (degrees C)'] = temperature - 273
+    record['CURRENT HUMIDITY (%)'] = humidity
+    record['Risk Score'] = risk_score
+
+    # Convert any NumPy data types to native Python types
+    for key, value in record.items():
+        if isinstance(value, np.generic):
+            record[key] = value.item()
+    return record
+
+
+class RiskPipeline:
+    """Scores submissions and hands the response rows to `persist`.
+
+    get_weather(pin_code, lat, lon) returns an OpenWeatherMap response dict.
+    score(pin_code, temperature, humidity) defaults to scoring straight from
+    the feature store with the model returned by get_model. With a
+    score_cache (shared_cache.ScoreCache), scores are looked up per (model,
+    zip, weather bucket) before scoring.
+    """
+
+    def __init__(self, feature_store, get_model, get_weather, persist=None, score=None, idempotency=None,
+                 score_cache=None):
+        self.feature_store = feature_store
+        self.get_model = get_model
+        self.get_weather = get_weather
+        self.persist = persist
+        self.score = score or self._score
+        self.idempotency = idempotency
+        self.score_cache = score_cache
+        self._vectorized = score is None
+
+    def _score(self, pin_code, temperature, humidity):
+        return self.feature_store.score(self.get_model(), pin_code, temperature, humidity)
+
+    def _cached_score(self, pin_code, temperature, humidity):
+        if self.score_cache is None:
+            return self.score(pin_code, temperature, humidity)
+        return self.score_cache.score(self.get_model(), pin_code, temperature, humidity, self.score)
+
+    def _score_many(self, pin_codes, temperatures, humidities):
+        if self._vectorized:
+            return self.feature_store.score(self.get_model(), pin_codes, temperatures, humidities)
+        return [self.score(p, t, h) for p, t, h in zip(pin_codes, temperatures, humidities)]
+
+    def resolve_location(self, latitude, longitude, max_distance_km=MAX_DISTANCE_KM):
+        """The pin code whose centroid is nearest to a point."""
+        pin_code, distance = self.feature_store.nearest_zip(latitude, longitude)
+        if distance > max_distance_km:
+            raise PipelineError(f"({latitude}, {longitude}) is {distance:.1f} km from the nearest covered zip code")
+        return pin_code
+
+    def _weather(self, pin_code):
+        if pin_code not in self.feature_store:
+            raise PipelineError(f"Unknown pin code {pin_code!r}")
+        lat, lon = self.feature_store.location(pin_code)
+        with tracer.span('weather'):
+            weather_data = self.get_weather(pin_code, lat, lon)
+        if weather_data is None:
+            raise PipelineError(f"No weather data available for {pin_code}")
+        return weather_data['main']['temp'], weather_data['main']['humidity']
+
+    def _explain(self, pin_codes, temperatures, humidities):
+        # (base score, contributions) or (None, None) when the model cannot be explained
+        explainer = explainer_for(self.get_model())
+        if explainer is None:
+            return None, None
+        with tracer.span('explain'):
+            return explainer.base_score, explainer.explain_zips(self.feature_store, pin_codes, temperatures, humidities)
+
+    def _result(self, pin_code, answers, temperature, humidity, risk_score, base_score=None, contributions=None):
+        record = build_record(pin_code, answers, temperature, humidity, float(risk_score))
+        persist_error = None
+        if self.persist is not None:
+            try:
+                with tracer.span('persistence'):
+                    self.persist(record)
+            except Exception as e:
+                persist_error = str(e)
+        env_factors = self.feature_store.env_factors(pin_code)
+        return {
+            'pin_code': pin_code,
+            'risk_score': record['Risk Score'],
+            'temperature_c': round(temperature - 273.15, 2),
+            'humidity': humidity,
+            'factors': {name: float(env_factors[i]) for i, name in DISPLAY_FACTORS},
+            # Largest contributions first; they add up to risk_score - base_score
+            'base_score': base_score,
+            'contributions': None if contributions is None else {
+                CONTRIBUTION_NAMES[i]: float(contributions[i]) for i in np.argsort(-np.abs(contributions), kind='stable')
+            },
+            'record': record,
+            'persist_error': persist_error,
+            'repeated': False,
+        }
+
+    def _assess(self, pin_code, answers):
+        temperature, humidity = self._weather(pin_code)
+        risk_score = self._cached_score(pin_code, temperature, humidity)
+        base_score, contributions = self._explain(pin_code, temperature, humidity)
+        return self._result(pin_code, answers, temperature, humidity, risk_score, base_score, contributions)
+
+    def assess(self, pin_code, answers, session_id=None):
+        """Score one submission; a session_id makes repeats within the cache TTL idempotent."""
+        with tracer.span('calculate'):
+            if self.idempotency is None or session_id is None:
+                return self._assess(pin_code, answers)
+            # A result whose row could not be queued is not kept, so a retry persists it
+            result, repeated = self.idempotency.get_or_compute(
+                submission_key(session_id, pin_code, answers),
+                lambda: self._assess(pin_code, answers),
+                cacheable=lambda result: result['persist_error'] is None,
+            )
+            return dict(result, repeated=True) if repeated else result
+
+    def assess_many(self, submissions):
+        """Score (pin_code, answers) pairs with one vectorized model call."""
+        weather = [self._weather(pin_code) for pin_code, _ in submissions]
+        if not submissions:
+            return []
+        pin_codes = [pin_code for pin_code, _ in submissions]
+        temperatures = np.array([t for t, _ in weather], dtype=np.float64)
+        humidities = np.array([h for _, h in weather], dtype=np.float64)
+        if self.score_cache is None:
+            scores = self._score_many(pin_codes, temperatures, humidities)
+        else:
+            scores = self.score_cache.score_many(self.get_model(), pin_codes, temperatures, humidities,
+                                                 self._score_many)
+        base_score, contributions = self._explain(pin_codes, temperatures, humidities)
+        if contributions is None:
+            contributions = [None] * len(submissions)
+        return [self._result(pin_code, answers, t, h, s, base_score, c)
+                for (pin_code, answers), (t, h), s, c in zip(submissions, weather, scores, contributions)]
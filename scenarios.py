@@ -0,0 +1,248 @@
+"""What-if scenarios: score grids of changes to a zip's factors and weather.
+
+A scenario grid has one axis per changed model input. Factor axes hold
+relative changes (-0.2 = 20% lower) or, with relative=False, points added;
+the 'Temperature' (Kelvin) and 'Humidity' (%) axes hold the values to use.
+Every combination of the axis values is scored, for every requested zip, in
+one forward pass of the model, and comes back as a ResponseSurface: an array
+of scores with one dimension per axis.
+
+With live weather, temperature and humidity take the 'Urban Heat Islands' and
+'Water Quality' slots of the model input (see features.py), so a factor axis
+on those slots changes the weather-derived value.
+
+Surfaces are cached per (model, zips, weather, axes) in an LRU bounded by
+the number of scores held.
+
+    engine = ScenarioEngine(store, registry.get)
+    surface = engine.surface('02108', {'Traffic Density': np.linspace(-0.3, 0, 7),
+                                       'Green Spaces': np.linspace(0, 0.3, 7)}, temperature=293, humidity=60)
+    surface.deltas[0]       # 7 x 7 score changes against no change
+    surface.to_frame()      # one row per (zip, scenario)
+
+    python scenarios.py 02108 --axis "Traffic Density=-0.3:0:7" --axis "Green Spaces=0:0.3:7" --temperature 293
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from features import FEATURE_NAMES, HUMIDITY_INDEX, TEMPERATURE_INDEX, TEMPERATURE_OFFSET, assemble_features
+
+# Weather axes: model input slot and the offset from the reported value
+WEATHER_AXES = {'Temperature': (TEMPERATURE_INDEX, TEMPERATURE_OFFSET), 'Humidity': (HUMIDITY_INDEX, 0)}
+AXIS_NAMES = tuple(FEATURE_NAMES) + tuple(WEATHER_AXES)
+# Largest number of (zip, scenario) scores one request may ask for
+MAX_SCENARIOS = 2_000_000
+
+
+def _slot(name):
+    if name in WEATHER_AXES:
+        return WEATHER_AXES[name][0]
+    if name in FEATURE_NAMES:
+        return FEATURE_NAMES.index(name)
+    raise ValueError(f"Unknown axis {name!r} (expected one of {', '.join(AXIS_NAMES)})")
+
+
+class ResponseSurface:
+    """Scores over a scenario grid: scores[z, i, j, ...] for zip z at axis values i, j, ..."""
+
+    def __init__(self, zip_codes, axes, scores, baseline, relative=True):
+        self.zip_codes = tuple(zip_codes)
+        self.axes = [(name, values) for name, values in axes]
+        self.scores = scores
+        self.baseline = baseline
+        self.relative = relative
+
+    @property
+    def shape(self):
+        return self.scores.shape
+
+    @property
+    def deltas(self):
+        """Score changes against the unchanged inputs."""
+        return self.scores - self.baseline.reshape((-1,) + (1,) * len(self.axes))
+
+    def to_frame(self):
+        import pandas as pd
+
+        grids = np.meshgrid(*(values for _, values in self.axes), indexing='ij')
+        per_zip = grids[0].size if grids else 1
+        frame = {'Pin Code': np.repeat(self.zip_codes, per_zip)}
+        for (name, _), grid in zip(self.axes, grids):
+            frame[name] = np.tile(grid.ravel(), len(self.zip_codes))
+        frame['Score'] = self.scores.ravel()
+        frame['Delta'] = self.deltas.ravel()
+        return pd.DataFrame(frame)
+
+    def to_dict(self):
+        return {
+            'pin_codes': list(self.zip_codes),
+            'relative': self.relative,
+            'axes': {name: values.tolist() for name, values in self.axes},
+            'baseline': self.baseline.tolist(),
+            'scores': self.scores.tolist(),
+        }
+
+
+def scenario_features(base, axes, relative=True):
+    """Model input rows for every grid point: shape (zips, points, features), grid in C order."""
+    base = np.atleast_2d(np.asarray(base, dtype=np.float64))
+    values = [np.asarray(v, dtype=np.float64).ravel() for _, v in axes]
+    points = int(np.prod([len(v) for v in values], dtype=np.int64))
+    features = np.repeat(base[:, None, :], points, axis=1)
+    slots = [_slot(name) for name, _ in axes]
+    if len(set(slots)) != len(slots):
+        raise ValueError('Two axes change the same model input')
+    for axis, ((name, _), slot, grid) in enumerate(zip(axes, slots, values)):
+        # The axis' value at each grid point, without materializing the whole mesh
+        shape = [1] * len(values)
+        shape[axis] = len(grid)
+        column = np.broadcast_to(grid.reshape(shape), [len(v) for v in values]).ravel()
+        if name in WEATHER_AXES:
+            features[:, :, slot] = column - WEATHER_AXES[name][1]
+        elif relative:
+            features[:, :, slot] = base[:, None, slot] * (1.0 + column)
+        else:
+            features[:, :, slot] = base[:, None, slot] + column
+    return features
+
+
+class ScenarioEngine:
+    def __init__(self, feature_store, get_model, max_cached_scores=1_000_000):
+        self.feature_store = feature_store
+        self.get_model = get_model
+        self.max_cached_scores = max_cached_scores
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # key -> (model, surface)
+        self._cached_scores = 0
+        self.counters = {'hits': 0, 'misses': 0, 'evicted': 0, 'scored': 0}
+
+    def _key(self, zip_codes, axes, temperature, humidity, relative):
+        weather = tuple(None if v is None else np.asarray(v, dtype=np.float64).tobytes()
+                        for v in (temperature, humidity))
+        return (zip_codes, tuple((name, values.tobytes()) for name, values in axes), weather, relative)
+
+    def surface(self, zip_codes, axes, temperature=None, humidity=None, relative=True):
+        """Score every combination of the axis values ({name: values}) for one zip or several."""
+        zip_codes = (zip_codes,) if isinstance(zip_codes, str) else tuple(zip_codes)
+        axes = [(name, np.asarray(values, dtype=np.float64).ravel()) for name, values in dict(axes).items()]
+        points = int(np.prod([len(values) for _, values in axes], dtype=np.int64))
+        if points * len(zip_codes) > MAX_SCENARIOS:
+            raise ValueError(f"{points * len(zip_codes):,} scenarios requested; the limit is {MAX_SCENARIOS:,}")
+        for name, _ in axes:
+            _slot(name)
+
+        model = self.get_model()
+        key = self._key(zip_codes, axes, temperature, humidity, relative)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] is model:
+                self.counters['hits'] += 1
+                self._cache.move_to_end(key)
+                return cached[1]
+            self.counters['misses'] += 1
+
+        base = assemble_features(self.feature_store.matrix[self.feature_store.rows(zip_codes)], temperature, humidity)
+        features = scenario_features(base, axes, relative)
+        # One forward pass for the baselines and every scenario
+        scores = model.predict(np.concatenate([base, features.reshape(-1, base.shape[1])]))
+        baseline, scores = scores[:len(base)], scores[len(base):]
+        scores = scores.reshape((len(zip_codes),) + tuple(len(values) for _, values in axes))
+        for array in (baseline, scores, *(values for _, values in axes)):
+            array.setflags(write=False)
+        surface = ResponseSurface(zip_codes, axes, scores, baseline, relative)
+
+        with self._lock:
+            self.counters['scored'] += scores.size
+            if scores.size <= self.max_cached_scores:
+                previous = self._cache.pop(key, None)
+                if previous is not None:
+                    self._cached_scores -= previous[1].scores.size
+                self._cache[key] = (model, surface)
+                self._cached_scores += scores.size
+                while self._cached_scores > self.max_cached_scores:
+                    _, (_, evicted) = self._cache.popitem(last=False)
+                    self._cached_scores -= evicted.scores.size
+                    self.counters['evicted'] += 1
+        return surface
+
+    def sensitivity(self, zip_codes, step=0.2, temperature=None, humidity=None):
+        """Score change per factor for a -step and +step relative change, one factor at a time.
+
+        Returns {factor: (deltas down, deltas up)} with one delta per zip.
+        """
+        surfaces = {name: self.surface(zip_codes, {name: [-step, step]}, temperature, humidity)
+                    for name in FEATURE_NAMES}
+        return {name: (surface.deltas[:, 0], surface.deltas[:, 1]) for name, surface in surfaces.items()}
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._cache), cached_scores=self._cached_scores)
+
+
+def parse_axis(spec):
+    """'Name=start:stop:count' or 'Name=v1,v2,...' -> (name, values)."""
+    name, _, values = spec.partition('=')
+    if not values:
+        raise argparse.ArgumentTypeError(f"expected NAME=start:stop:count or NAME=v1,v2,..., got {spec!r}")
+    try:
+        if ':' in values:
+            start, stop, count = values.split(':')
+            return name.strip(), np.linspace(float(start), float(stop), int(count))
+        return name.strip(), np.array([float(v) for v in values.split(',')])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad axis values in {spec!r}") from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pin_codes', nargs='+', help="Zip codes, or 'all'")
+    parser.add_argument('--axis', action='append', type=parse_axis, default=[], metavar='NAME=START:STOP:COUNT',
+                        help=f"Repeatable; NAME is one of: {', '.join(AXIS_NAMES)}")
+    parser.add_argument('--absolute', action='store_true', help='Factor axes add points instead of relative changes')
+    parser.add_argument('--temperature', type=float, help='Temperature in Kelvin')
+    parser.add_argument('--humidity', type=float, help='Humidity (%%)')
+    parser.add_argument('--sensitivity', type=float, metavar='STEP',
+                        help='Instead of a grid, rank the factors by the effect of a +/-STEP relative change')
+    parser.add_argument('--backend', choices=['numpy', 'keras'], default='numpy')
+    parser.add_argument('--out', help='Write the surface as .csv or .parquet (one row per scenario)')
+    args = parser.parse_args(argv)
+    if not args.axis and args.sensitivity is None:
+        parser.error('give at least one --axis, or --sensitivity')
+
+    from feature_store import FeatureStore
+    from model_registry import ModelRegistry
+
+    store = FeatureStore.load()
+    engine = ScenarioEngine(store, ModelRegistry(backend=args.backend).get)
+    zip_codes = store.zips if args.pin_codes == ['all'] else args.pin_codes
+
+    if args.sensitivity is not None:
+        effects = engine.sensitivity(zip_codes, args.sensitivity, args.temperature, args.humidity)
+        ranked = sorted(effects.items(), key=lambda item: -np.abs(np.concatenate(item[1])).mean())
+        print(json.dumps({name: {'down': down.tolist(), 'up': up.tolist()} for name, (down, up) in ranked}, indent=2))
+        return 0
+
+    start = time.perf_counter()
+    surface = engine.surface(zip_codes, dict(args.axis), args.temperature, args.humidity, not args.absolute)
+    seconds = time.perf_counter() - start
+    print(f"Scored {surface.scores.size:,} scenarios in {seconds:.3f}s "
+          f"({surface.scores.size / max(seconds, 1e-9):,.0f}/s)", file=sys.stderr)
+    if args.out:
+        frame = surface.to_frame()
+        if args.out.endswith('.parquet'):
+            frame.to_parquet(args.out, index=False)
+        else:
+            frame.to_csv(args.out, index=False)
+    else:
+        print(json.dumps(surface.to_dict()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
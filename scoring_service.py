@@ -0,0 +1,128 @@
+"""Micro-batching front end for the risk model.
+
+Sessions submit one feature row each. A single worker thread collects the rows
+that arrive within a few milliseconds of each other and scores them with one
+vectorized `predict` call, then hands each caller its own score.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ScoringQueueFull(Exception):
+    """Raised when the scoring queue is at its configured depth."""
+
+
+class ScoringService:
+    def __init__(self, get_model, max_batch_size=64, max_wait_ms=5.0, max_queue_depth=1024,
+                 latency_window=2048):
+        self.get_model = get_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_depth = max_queue_depth
+        self._queue = queue.Queue(maxsize=max_queue_depth)
+        self._latencies = deque(maxlen=latency_window)
+        self._batch_sizes = deque(maxlen=latency_window)
+        self._stats_lock = threading.Lock()
+        self._counters = {'requests': 0, 'rejected': 0, 'batches': 0, 'rows': 0, 'errors': 0}
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name='scoring-service', daemon=True)
+        self._worker.start()
+
+    def submit(self, features):
+        row = np.asarray(features, dtype=np.float64).reshape(-1)
+        n_features = self.get_model().n_features
+        if row.shape[0] != n_features:
+            # Rejected here, so one bad row cannot fail the other callers in its batch
+            raise ValueError(f"Expected {n_features} features, got {row.shape[0]}")
+        future = Future()
+        try:
+            self._queue.put_nowait((row, future, time.perf_counter()))
+        except queue.Full:
+            with self._stats_lock:
+                self._counters['rejected'] += 1
+            raise ScoringQueueFull(f"Scoring queue is full ({self.max_queue_depth} pending requests)")
+        with self._stats_lock:
+            self._counters['requests'] += 1
+        return future
+
+    def score(self, features, timeout=None):
+        return self.submit(features).result(timeout)
+
+    def score_many(self, rows, timeout=None):
+        futures = [self.submit(row) for row in rows]
+        return [f.result(timeout) for f in futures]
+
+    def _collect(self):
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            futures = [future for _, future, _ in batch]
+            try:
+                scores = self.get_model().predict(np.stack([row for row, _, _ in batch]))
+            except Exception as e:
+                logger.exception('Scoring batch of %d failed', len(batch))
+                with self._stats_lock:
+                    self._counters['errors'] += 1
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            for (_, future, _), score in zip(batch, scores):
+                future.set_result(float(score))
+            with self._stats_lock:
+                self._counters['batches'] += 1
+                self._counters['rows'] += len(batch)
+                self._batch_sizes.append(len(batch))
+                self._latencies.extend(done - queued_at for _, _, queued_at in batch)
+
+    def metrics(self):
+        with self._stats_lock:
+            metrics = dict(self._counters)
+            latencies = np.asarray(self._latencies) * 1000.0
+            batch_sizes = np.asarray(self._batch_sizes)
+        metrics.update({
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'mean_batch_size': float(batch_sizes.mean()) if batch_sizes.size else 0.0,
+        })
+        for p in (50, 95, 99):
+            metrics[f'latency_p{p}_ms'] = float(np.percentile(latencies, p)) if latencies.size else 0.0
+        return metrics
+
+    def close(self):
+        self._stopped.set()
+        self._worker.join()
+        while True:
+            try:
+                _, future, _ = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            future.set_exception(RuntimeError('Scoring service is closed'))
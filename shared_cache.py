@@ -0,0 +1,576 @@
+"""A cache tier shared by app replicas: weather responses and scores.
+
+Each replica keeps its own caches (weather.py, idempotency.py), so N replicas
+behind a load balancer fetch the same weather and score the same inputs N
+times. TieredCache puts a bounded in-process LRU in front of an optional
+shared backend:
+
+  RedisBackend   any server speaking the Redis protocol (GET / MGET / SET PX), for
+                 replicas on several hosts
+  MmapBackend    a fixed-size hash table in a memory-mapped file, for
+                 replicas on one host (e.g. a file under /dev/shm)
+
+A miss in the LRU reads the backend, and a value computed after a miss is
+written to both. get_many() reads all of a batch's LRU misses in one backend
+round trip (MGET). Values are JSON, stored with their expiry time, so a value
+pulled from the backend lives only for the rest of its TTL. Backend errors are
+logged and counted, and then the backend is skipped for `retry_after`
+seconds: the cache only ever saves work and never fails a request.
+
+ScoreCache keeps risk scores per (model, zip, weather bucket) in a
+TieredCache. WeatherClient takes a TieredCache for its upstream fetches.
+Configured from a [shared_cache] section in secrets:
+
+    [shared_cache]
+    backend = "redis"            # "local" (in-process only), "redis" or "mmap"
+    url = "redis://cache:6379/0"
+    # path = "/dev/shm/risk_cache"
+    max_entries = 10000          # in-process LRU bounds
+    max_bytes = 33554432
+    score_ttl = 3600             # 0 caches weather only
+
+Weather responses are kept for [weather] shared_ttl seconds.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urlparse
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'riskcache:'
+
+
+class BackendError(Exception):
+    """The shared backend could not be read or written."""
+
+
+class RedisBackend:
+    """Minimal Redis protocol (RESP) client: GET, MGET, SET with PX, DEL and PING over a small connection pool."""
+
+    def __init__(self, url='redis://127.0.0.1:6379/0', timeout=0.25, pool_size=8):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or 6379)
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._pool = []
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = (sock, sock.makefile('rb'))
+        if self.password:
+            self._call(connection, 'AUTH', self.password)
+        if self.db:
+            self._call(connection, 'SELECT', self.db)
+        return connection
+
+    @staticmethod
+    def _encode(*args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        return b''.join(parts)
+
+    @classmethod
+    def _read_reply(cls, reader):
+        line = reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise BackendError('connection closed')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest
+        if kind == b'-':
+            raise BackendError(rest.decode(errors='replace'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            if len(data) != length + 2:
+                raise BackendError('connection closed')
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            return None if length < 0 else [cls._read_reply(reader) for _ in range(length)]
+        raise BackendError(f'unexpected reply {line[:32]!r}')
+
+    def _call(self, connection, *args):
+        sock, reader = connection
+        sock.sendall(self._encode(*args))
+        return self._read_reply(reader)
+
+    def execute(self, *args):
+        with self._lock:
+            connection = self._pool.pop() if self._pool else None
+        try:
+            if connection is None:
+                connection = self._connect()
+            reply = self._call(connection, *args)
+        except (OSError, BackendError) as e:
+            if connection is not None:
+                connection[0].close()
+            raise BackendError(f'{args[0]} failed: {e}') from e
+        with self._lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(connection)
+                connection = None
+        if connection is not None:
+            connection[0].close()
+        return reply
+
+    def get(self, key):
+        return self.execute('GET', KEY_PREFIX + key)
+
+    def mget(self, keys):
+        if not keys:
+            return []
+        return self.execute('MGET', *(KEY_PREFIX + key for key in keys))
+
+    def set(self, key, payload, ttl):
+        self.execute('SET', KEY_PREFIX + key, payload, 'PX', max(int(ttl * 1000), 1))
+
+    def delete(self, key):
+        self.execute('DEL', KEY_PREFIX + key)
+
+    def ping(self):
+        return self.execute('PING') == b'PONG'
+
+    def stats(self):
+        return {'backend': 'redis', 'address': f'{self.address[0]}:{self.address[1]}', 'connections': len(self._pool)}
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, []
+        for sock, _ in pool:
+            sock.close()
+
+
+class MmapBackend:
+    """Fixed-size hash table in a memory-mapped file, shared by processes on one host.
+
+    Each key may live in one of two slots; a write takes the slot that holds
+    the key, else an empty or expired one, else the one expiring first.
+    Writers serialize on a file lock. Readers take no lock: a slot's sequence
+    number is odd while it is written and a CRC covers its payload, and a read
+    that sees either change is retried.
+    """
+
+    MAGIC = b'RISKMAP2'
+    HEADER = struct.Struct('<8sII')  # magic, slots, slot size
+    SEQUENCE = struct.Struct('<I')  # odd while the slot is written
+    ENTRY = struct.Struct('<QdII')  # key hash, expires at (epoch), length, CRC-32 of the payload
+
+    def __init__(self, path, slots=4096, slot_size=1024):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self._lock = threading.Lock()
+        size = self.HEADER.size + slots * slot_size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, self.HEADER.size, 0)
+            if len(header) == self.HEADER.size and header[:8] == self.MAGIC:
+                _, self.slots, self.slot_size = self.HEADER.unpack(header)
+                size = self.HEADER.size + self.slots * self.slot_size
+            else:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, self.HEADER.pack(self.MAGIC, slots, slot_size), 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._payload_offset = self.SEQUENCE.size + self.ENTRY.size
+        self.capacity = self.slot_size - self._payload_offset
+        self._map = mmap.mmap(self._fd, size)
+        self.counters = {'overwritten': 0, 'too_large': 0, 'torn_reads': 0}
+
+    @staticmethod
+    def _hash(key):
+        # 0 marks an empty slot
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+
+    def _offsets(self, key_hash):
+        first = key_hash % self.slots
+        second = (key_hash >> 32) % self.slots
+        return [self.HEADER.size + slot * self.slot_size for slot in dict.fromkeys((first, second))]
+
+    def _read_slot(self, offset, key_hash):
+        # (key matches, payload if live), or None when the slot changed during the read
+        sequence, = self.SEQUENCE.unpack_from(self._map, offset)
+        if sequence % 2:
+            return None
+        slot_hash, expires_at, length, crc = self.ENTRY.unpack_from(self._map, offset + self.SEQUENCE.size)
+        payload = None
+        if slot_hash == key_hash:
+            start = offset + self._payload_offset
+            payload = self._map[start:start + min(length, self.capacity)]
+            if zlib.crc32(payload) != crc:
+                return None
+        if self.SEQUENCE.unpack_from(self._map, offset)[0] != sequence:
+            return None
+        return slot_hash == key_hash, payload if expires_at > time.time() else None
+
+    def get(self, key):
+        key_hash = self._hash(key)
+        for offset in self._offsets(key_hash):
+            for _ in range(3):
+                read = self._read_slot(offset, key_hash)
+                if read is not None:
+                    break
+            else:
+                self.counters['torn_reads'] += 1
+                continue
+            if read[0]:
+                return read[1]
+        return None
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def _write_slot(self, offset, sequence, key_hash=0, expires_at=0.0, payload=b''):
+        # Caller holds the file lock
+        self.SEQUENCE.pack_into(self._map, offset, sequence + 1)
+        start = offset + self._payload_offset
+        self._map[start:start + len(payload)] = payload
+        self.ENTRY.pack_into(self._map, offset + self.SEQUENCE.size, key_hash, expires_at, len(payload),
+                             zlib.crc32(payload))
+        self.SEQUENCE.pack_into(self._map, offset, sequence + 2)
+
+    def _slots(self, key_hash):
+        return [(offset, *self.SEQUENCE.unpack_from(self._map, offset),
+                 *self.ENTRY.unpack_from(self._map, offset + self.SEQUENCE.size)[:2])
+                for offset in self._offsets(key_hash)]
+
+    def set(self, key, payload, ttl):
+        if len(payload) > self.capacity:
+            self.counters['too_large'] += 1
+            return
+        key_hash = self._hash(key)
+        now = time.time()
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                slots = self._slots(key_hash)  # (offset, sequence, key hash, expires at)
+                own = [s for s in slots if s[2] == key_hash]
+                free = [s for s in slots if s[2] == 0 or s[3] <= now]
+                offset, sequence, _, _ = (own or free or sorted(slots, key=lambda s: s[3]))[0]
+                if not own and not free:
+                    self.counters['overwritten'] += 1
+                self._write_slot(offset, sequence, key_hash, now + ttl, payload)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def delete(self, key):
+        key_hash = self._hash(key)
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                for offset, sequence, slot_hash, _ in self._slots(key_hash):
+                    if slot_hash == key_hash:
+                        self._write_slot(offset, sequence)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def stats(self):
+        return dict(self.counters, backend='mmap', path=self.path, slots=self.slots, slot_size=self.slot_size)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class TieredCache:
+    def __init__(self, backend=None, max_entries=10000, max_bytes=32 * 2**20, retry_after=30.0):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at (monotonic), size)
+        self._bytes = 0
+        self._inflight = {}  # key -> Future of the first computation
+        self._backend_down_until = 0.0
+        self.counters = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'coalesced': 0, 'expired': 0, 'evicted': 0,
+                         'shared_writes': 0, 'backend_errors': 0, 'last_backend_error': None}
+
+    def _store_local(self, key, value, expires_at, size):
+        # Caller holds the lock
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous[2]
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.counters['evicted'] += 1
+
+    def _backend_call(self, method, *args):
+        # None when there is no backend, it failed, or it is backing off after an error
+        if self.backend is None or time.monotonic() < self._backend_down_until:
+            return None
+        try:
+            result = getattr(self.backend, method)(*args)
+        except Exception as e:
+            with self._lock:
+                self.counters['backend_errors'] += 1
+                self.counters['last_backend_error'] = str(e)
+                self._backend_down_until = time.monotonic() + self.retry_after
+            logger.warning('Shared cache %s failed, using the local tier for %.0fs: %s', method, self.retry_after, e)
+            return None
+        if method == 'set':
+            with self._lock:
+                self.counters['shared_writes'] += 1
+        return result
+
+    def _get_local(self, key):
+        # Caller holds the lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            self.counters['expired'] += 1
+            del self._entries[key]
+            self._bytes -= entry[2]
+            return None
+        self.counters['hits'] += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def _get_shared(self, key):
+        return self._load_shared(key, self._backend_call('get', key))
+
+    def _load_shared(self, key, payload):
+        # (value,) for a live backend payload, stored in the LRU as well; None otherwise
+        if payload is None:
+            return None
+        try:
+            expires_at, value = json.loads(payload)
+        except ValueError:
+            return None
+        remaining = expires_at - time.time()
+        if remaining <= 0:
+            return None
+        with self._lock:
+            self.counters['shared_hits'] += 1
+            self._store_local(key, value, time.monotonic() + remaining, len(payload))
+        return (value,)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._get_local(key)
+        if entry is not None:
+            return entry[0]
+        shared = self._get_shared(key)
+        if shared is not None:
+            return shared[0]
+        with self._lock:
+            self.counters['misses'] += 1
+        return default
+
+    def get_many(self, keys, default=None):
+        """Values for several keys, reading the LRU misses from the backend in one call."""
+        values = [default] * len(keys)
+        with self._lock:
+            entries = [self._get_local(key) for key in keys]
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        for i, entry in enumerate(entries):
+            if entry is not None:
+                values[i] = entry[0]
+        if not missing:
+            return values
+        payloads = self._backend_call('mget', [keys[i] for i in missing]) or [None] * len(missing)
+        misses = 0
+        for i, payload in zip(missing, payloads):
+            shared = self._load_shared(keys[i], payload)
+            if shared is None:
+                misses += 1
+            else:
+                values[i] = shared[0]
+        with self._lock:
+            self.counters['misses'] += misses
+        return values
+
+    def set(self, key, value, ttl):
+        payload = json.dumps([time.time() + ttl, value], separators=(',', ':')).encode()
+        with self._lock:
+            self._store_local(key, value, time.monotonic() + ttl, len(payload))
+        self._backend_call('set', key, payload, ttl)
+
+    def get_or_compute(self, key, compute, ttl):
+        """The cached value for `key`, or compute() run once (per process) and cached for ttl seconds."""
+        with self._lock:
+            entry = self._get_local(key)
+            if entry is not None:
+                return entry[0]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.counters['coalesced'] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            shared = self._get_shared(key)
+            if shared is not None:
+                value = shared[0]
+            else:
+                with self._lock:
+                    self.counters['misses'] += 1
+                value = compute()
+                self.set(key, value, ttl)
+        except Exception as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+        future.set_result(value)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+        self._backend_call('delete', key)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters, entries=len(self._entries), bytes=self._bytes, inflight=len(self._inflight),
+                         backend_available=self.backend is not None and time.monotonic() >= self._backend_down_until)
+        if self.backend is not None:
+            stats['shared'] = self.backend.stats()
+        return stats
+
+    def close(self):
+        if self.backend is not None:
+            self.backend.close()
+
+
+# Fingerprints of loaded models, so replicas serving the same model share scores
+_fingerprints = weakref.WeakKeyDictionary()
+_PROBE = np.random.default_rng(0).uniform(0, 100, size=(16, 12))
+
+
+def model_fingerprint(model):
+    """A short hash of the model's scores on fixed probe rows; equal models get equal fingerprints."""
+    fingerprint = _fingerprints.get(model)
+    if fingerprint is None:
+        scores = np.round(np.asarray(model.predict(_PROBE[:, :model.n_features]), dtype=np.float64), 6)
+        fingerprint = _fingerprints[model] = hashlib.blake2b(scores.tobytes(), digest_size=8).hexdigest()
+    return fingerprint
+
+
+class ScoreCache:
+    """Risk scores per (model, zip, weather bucket) in a TieredCache.
+
+    Temperature and humidity are snapped to their bucket before scoring, so a
+    cached score is exactly what scoring would return. The default steps are
+    the precision OpenWeatherMap reports (0.01 K, 1 %), which leaves live
+    weather unchanged.
+    """
+
+    def __init__(self, cache, ttl=3600, temperature_step=0.01, humidity_step=1.0):
+        self.cache = cache
+        self.ttl = ttl
+        self.temperature_step = temperature_step
+        self.humidity_step = humidity_step
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0}
+
+    def bucket(self, temperature, humidity):
+        temperature = np.round(np.asarray(temperature, dtype=np.float64) / self.temperature_step) * self.temperature_step
+        humidity = np.round(np.asarray(humidity, dtype=np.float64) / self.humidity_step) * self.humidity_step
+        return np.round(temperature, 6), np.round(humidity, 6)
+
+    def _key(self, fingerprint, pin_code, temperature, humidity):
+        return f'score:{fingerprint}:{pin_code}:{temperature:.6g}:{humidity:.6g}'
+
+    def score_many(self, model, pin_codes, temperatures, humidities, compute):
+        """Scores for the rows; compute(pin_codes, temperatures, humidities) scores the misses in one call."""
+        fingerprint = model_fingerprint(model)
+        temperatures, humidities = self.bucket(temperatures, humidities)
+        keys = [self._key(fingerprint, p, t, h) for p, t, h in zip(pin_codes, temperatures, humidities)]
+        scores = self.cache.get_many(keys)
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            computed = compute([pin_codes[i] for i in missing], temperatures[missing], humidities[missing])
+            for i, score in zip(missing, computed):
+                scores[i] = float(score)
+                self.cache.set(keys[i], scores[i], self.ttl)
+        with self._lock:
+            self.counters['hits'] += len(keys) - len(missing)
+            self.counters['misses'] += len(missing)
+        return scores
+
+    def score(self, model, pin_code, temperature, humidity, compute):
+        """One score; compute(pin_code, temperature, humidity) runs on a miss, once across concurrent callers."""
+        temperature, humidity = (float(v) for v in self.bucket(temperature, humidity))
+        key = self._key(model_fingerprint(model), pin_code, temperature, humidity)
+        computed = []
+
+        def miss():
+            computed.append(True)
+            return float(compute(pin_code, temperature, humidity))
+
+        score = self.cache.get_or_compute(key, miss, self.ttl)
+        with self._lock:
+            self.counters['misses' if computed else 'hits'] += 1
+        return score
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+def create_backend(config):
+    backend = config.get('backend', 'local')
+    if backend == 'local':
+        return None
+    if backend == 'redis':
+        return RedisBackend(config.get('url', 'redis://127.0.0.1:6379/0'), **config.get('redis', {}))
+    if backend == 'mmap':
+        return MmapBackend(config.get('path', 'shared_cache.mmap'), **config.get('mmap', {}))
+    raise ValueError(f"Unknown shared cache backend {backend!r}")
+
+
+def create_shared_cache(config):
+    """A TieredCache from a [shared_cache] section, or None without one."""
+    if not config or not config.get('enabled', True):
+        return None
+    options = {key: config[key] for key in ('max_entries', 'max_bytes', 'retry_after') if key in config}
+    return TieredCache(create_backend(config), **options)
+
+
+def create_score_cache(cache, config):
+    """The ScoreCache over `cache` (None without a shared cache, or with score_ttl = 0)."""
+    if cache is None or not config.get('score_ttl', 3600):
+        return None
+    options = {key: config[key] for key in ('temperature_step', 'humidity_step') if key in config}
+    return ScoreCache(cache, ttl=config.get('score_ttl', 3600), **options)
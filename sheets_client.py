@@ -0,0 +1,94 @@
+"""Shared, lazily created Google Sheets client.
+
+Credentials, the gspread client and worksheet handles are created on first
+use and reused by every session and rerun. The client runs on one pooled
+AuthorizedSession; its access token is refreshed ahead of expiry rather than
+on the first request that finds it expired. Worksheet handles are cached for
+`worksheet_ttl` seconds and can be dropped with `invalidate`, e.g. after an
+API error.
+"""
+import datetime
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive'
+]
+
+
+class SheetsConnection:
+    def __init__(self, service_account_info, scopes=SCOPES, worksheet_ttl=3600, refresh_margin=300,
+                 pool_size=10, timeout=30):
+        self.service_account_info = dict(service_account_info)
+        self.scopes = list(scopes)
+        self.worksheet_ttl = worksheet_ttl
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._credentials = None
+        self._client = None
+        self._token_request = None
+        self._worksheets = {}  # (spreadsheet_id, index) -> (worksheet, opened_at)
+        self.counters = {'auth': 0, 'token_refreshes': 0, 'open': 0, 'worksheet_hits': 0, 'invalidations': 0}
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import gspread
+                import requests
+                from google.auth.transport.requests import AuthorizedSession, Request
+                from google.oauth2.service_account import Credentials
+
+                self._credentials = Credentials.from_service_account_info(
+                    self.service_account_info,
+                    scopes=self.scopes
+                )
+                session = AuthorizedSession(self._credentials)
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size,
+                                                        pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                self._token_request = Request(requests.Session())
+                self._client = gspread.authorize(self._credentials, session=session)
+                self._client.set_timeout(self.timeout)
+                self.counters['auth'] += 1
+            self._refresh_token_if_due()
+            return self._client
+
+    def _refresh_token_if_due(self):
+        credentials = self._credentials
+        # expiry is a naive UTC datetime in google-auth
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        if credentials.token is None or credentials.expiry is None or credentials.expiry - now < self.refresh_margin:
+            credentials.refresh(self._token_request)
+            self.counters['token_refreshes'] += 1
+
+    def worksheet(self, spreadsheet_id, index=0):
+        key = (spreadsheet_id, index)
+        with self._lock:
+            client = self.client()
+            cached = self._worksheets.get(key)
+            if cached is not None and time.monotonic() - cached[1] < self.worksheet_ttl:
+                self.counters['worksheet_hits'] += 1
+                return cached[0]
+            worksheet = client.open_by_key(spreadsheet_id).get_worksheet(index)
+            self.counters['open'] += 1
+            self._worksheets[key] = (worksheet, time.monotonic())
+            return worksheet
+
+    def invalidate(self, spreadsheet_id=None):
+        with self._lock:
+            for key in list(self._worksheets):
+                if spreadsheet_id is None or key[0] == spreadsheet_id:
+                    del self._worksheets[key]
+                    self.counters['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            expiry = self._credentials.expiry if self._credentials is not None else None
+            return dict(self.counters, cached_worksheets=len(self._worksheets),
+                        token_expiry=expiry.isoformat() if expiry else None)
@@ -0,0 +1,75 @@
+"""Nearest-zip lookups and interpolation over the zip centroids.
+
+Centroids are stored as unit vectors on the sphere in a k-d tree
+(scipy.spatial.cKDTree), so the nearest centroid by straight-line distance is
+also the nearest by great-circle distance. A point resolves to the zip with
+the nearest centroid, which approximates the zip boundaries by the Voronoi
+cells of the centroids. Single lookups take a few microseconds; arrays of
+points are looked up in one vectorized call.
+
+interpolate() blends per-zip values (e.g. the environmental factors) over the
+k nearest zips by inverse distance weighting.
+
+    index = SpatialIndex(store.coords)
+    row, distance_km = index.nearest(42.35, -71.06)
+    rows, distances_km = index.nearest(latitudes, longitudes)
+    factors = index.interpolate(store.matrix, latitudes, longitudes, k=4)
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _unit_vectors(latitudes, longitudes):
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _great_circle_km(chord):
+    # Chord length between unit vectors -> distance along the surface
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2.0, 1.0))
+
+
+class SpatialIndex:
+    def __init__(self, coords):
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        if not len(coords):
+            raise ValueError('SpatialIndex needs at least one centroid')
+        self.size = len(coords)
+        self._tree = cKDTree(_unit_vectors(coords[:, 0], coords[:, 1]))
+
+    def neighbors(self, latitude, longitude, k=4):
+        """Rows and great-circle distances (km) of the k nearest centroids, nearest first.
+
+        Scalar coordinates give arrays of shape (k,); arrays of n points give (n, k).
+        """
+        k = min(k, self.size)
+        chords, rows = self._tree.query(_unit_vectors(latitude, longitude), k=k)
+        chords, rows = np.asarray(chords), np.asarray(rows, dtype=np.intp)
+        if k == 1:
+            chords, rows = chords[..., None], rows[..., None]
+        return rows, _great_circle_km(chords)
+
+    def nearest(self, latitude, longitude):
+        """Row and distance (km) of the nearest centroid, or arrays of them for arrays of points."""
+        chords, rows = self._tree.query(_unit_vectors(latitude, longitude))
+        if np.ndim(rows) == 0:
+            return int(rows), float(_great_circle_km(chords))
+        return np.asarray(rows, dtype=np.intp), _great_circle_km(np.asarray(chords))
+
+    def interpolate(self, values, latitude, longitude, k=4, power=2.0):
+        """Inverse-distance-weighted blend of per-row `values` over the k nearest centroids.
+
+        A point on a centroid gets exactly that row's values. Scalar
+        coordinates give one row; arrays of n points give n rows.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        rows, distances = self.neighbors(latitude, longitude, k)
+        on_centroid = distances[..., :1] < 1e-9
+        with np.errstate(divide='ignore'):
+            weights = np.where(on_centroid, (distances < 1e-9).astype(np.float64), distances ** -power)
+        weights /= weights.sum(axis=-1, keepdims=True)
+        return np.einsum('...k,...kf->...f', weights, values[rows])
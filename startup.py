@@ -0,0 +1,152 @@
+"""Background initialization of the app's heavy services.
+
+The landing page only needs Streamlit. The zip table, the model, the scoring
+service, the weather client and the response storage are each built by their
+own thread as soon as the first session starts, so they load while the user
+reads the landing page and fills in the form. A builder receives the Startup
+and calls `result(name)` for the services it depends on, which blocks until
+that service is ready and re-raises its error if it failed.
+
+    startup = Startup(config)
+    startup.add('model_registry', lambda s: ModelRegistry(backend=s.config.get('model_backend', 'numpy')))
+    startup.start()
+    ...
+    startup.result('model_registry')   # blocks until loaded
+    startup.status()                   # readiness per service
+
+With background=False, start() builds every service in order before
+returning, which is how the app started before (useful for comparisons). In
+the background mode the app calls start() after its first page is rendered:
+on a single CPU, builder threads started earlier slow that page down.
+
+A service that failed stays failed until retry_failed() builds it again.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING, LOADING, READY, FAILED = 'pending', 'loading', 'ready', 'failed'
+
+# The Startup most recently started in this process, for status pages and benchmarks
+_current = None
+
+
+def current():
+    return _current
+
+
+class _Service:
+    def __init__(self, build):
+        self.build = build
+        self.state = PENDING
+        self.value = None
+        self.error = None
+        self.seconds = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+
+class Startup:
+    def __init__(self, config=None, background=True):
+        self.config = config or {}
+        self.background = background
+        self.created = time.perf_counter()
+        self.first_paint_seconds = None
+        self.ready_seconds = None
+        self._services = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def add(self, name, build):
+        self._services[name] = _Service(build)
+        return self
+
+    def start(self):
+        """Build every service; only the first call does anything."""
+        global _current
+        _current = self
+        with self._lock:
+            if self._started:
+                return self
+            self._started = True
+        self._start(list(self._services))
+        return self
+
+    def _start(self, names):
+        for name in names:
+            if self.background:
+                threading.Thread(target=self._build, args=(name,), name=f'startup-{name}', daemon=True).start()
+            else:
+                self._build(name)
+
+    def _build(self, name):
+        service = self._services[name]
+        with self._lock:
+            # Another thread may have started it already, on demand
+            if service.state != PENDING:
+                return
+            service.state = LOADING
+        start = time.perf_counter()
+        try:
+            service.value = service.build(self)
+            service.state = READY
+        except Exception as e:
+            service.error = e
+            service.state = FAILED
+            logger.exception('Failed to initialize %s', name)
+        service.finished_at = time.perf_counter()
+        service.seconds = service.finished_at - start
+        service.done.set()
+        if self.ready_seconds is None and all(s.done.is_set() for s in self._services.values()):
+            self.ready_seconds = time.perf_counter() - self.created
+            logger.info('All services initialized %.2fs after startup', self.ready_seconds)
+
+    def retry_failed(self, min_interval=30.0):
+        """Build again the services that failed at least min_interval seconds ago; returns their names.
+
+        A retried builder that asks for another failed service builds that one
+        again too, so dependents recover along with what they depend on.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            retried = [name for name, s in self._services.items()
+                       if s.state == FAILED and now - s.finished_at >= min_interval]
+            for name in retried:
+                self._services[name] = _Service(self._services[name].build)
+        if retried:
+            logger.info('Retrying %s', ', '.join(retried))
+            self._start(retried)
+        return retried
+
+    def result(self, name, timeout=None):
+        service = self._services[name]
+        if service.state == PENDING:
+            # Not started yet (background=False and still ahead in the order): build it here
+            self._build(name)
+        if not service.done.wait(timeout):
+            raise TimeoutError(f"{name} is still initializing")
+        if service.error is not None:
+            raise service.error
+        return service.value
+
+    def ready(self, *names):
+        return all(self._services[name].state == READY for name in names or self._services)
+
+    def painted(self):
+        """Record the time to the first rendered page (call at the end of the script)."""
+        if self.first_paint_seconds is None:
+            self.first_paint_seconds = time.perf_counter() - self.created
+            logger.info('First page rendered %.3fs after startup', self.first_paint_seconds)
+
+    def status(self):
+        return {
+            'ready': self.ready(),
+            'first_paint_seconds': self.first_paint_seconds,
+            'ready_seconds': self.ready_seconds,
+            'services': {
+                name: {'state': s.state, 'seconds': s.seconds, 'error': None if s.error is None else str(s.error)}
+                for name, s in self._services.items()
+            },
+        }
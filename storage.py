@@ -0,0 +1,158 @@
+"""Storage backends for survey responses.
+
+A response is the dict built by the Calculate Risk Score handler. Backends:
+
+  * 'sheets' - the Google Sheet (GoogleSheetsStore)
+  * 'sqlite' - a local SQLite database indexed on timestamp and pin code
+    (SQLiteStore); each response is kept whole as JSON next to the indexed
+    columns, so new form fields need no schema change
+
+Pick one with create_store(backend, ...); the app reads the backend name from
+the [storage] secrets section.
+"""
+import json
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PATH = 'responses.db'
+
+
+class ResponseStore(ABC):
+    @abstractmethod
+    def append(self, rows):
+        """Persist a list of response dicts, in order."""
+
+    @abstractmethod
+    def records(self, pin_code=None, since=None, until=None):
+        """Stored responses as dicts, optionally filtered by pin code and timestamp range."""
+
+    @abstractmethod
+    def count(self):
+        """Number of stored responses."""
+
+    def close(self):
+        pass
+
+
+class GoogleSheetsStore(ResponseStore):
+    """Either a fixed worksheet, or a SheetsConnection plus spreadsheet id.
+
+    With a connection the worksheet handle comes from the connection's cache
+    on every call and is dropped from it when a call fails.
+    """
+
+    def __init__(self, sheet=None, connection=None, spreadsheet_id=None):
+        if sheet is None and (connection is None or spreadsheet_id is None):
+            raise ValueError('GoogleSheetsStore needs a worksheet or a connection and spreadsheet id')
+        self._sheet = sheet
+        self.connection = connection
+        self.spreadsheet_id = spreadsheet_id
+        self._columns = None
+
+    @property
+    def sheet(self):
+        if self._sheet is not None:
+            return self._sheet
+        return self.connection.worksheet(self.spreadsheet_id)
+
+    def _call(self, func):
+        try:
+            return func(self.sheet)
+        except Exception:
+            if self.connection is not None:
+                self.connection.invalidate(self.spreadsheet_id)
+            raise
+
+    def _header(self, sheet, rows):
+        # Only look at the first row, once per process, instead of downloading the whole sheet
+        if self._columns is None:
+            columns = sheet.row_values(1)
+            if not columns:
+                columns = list(rows[0].keys())
+                sheet.append_row(columns)
+            self._columns = columns
+        return self._columns
+
+    def _append(self, sheet, rows):
+        # Cells follow the sheet's header, whatever the key order of each dict
+        columns = self._header(sheet, rows)
+        unknown = {key for row in rows for key in row} - set(columns)
+        if unknown:
+            logger.warning('Dropping fields missing from the sheet header: %s', ', '.join(sorted(unknown)))
+        sheet.append_rows([[row.get(column, '') for column in columns] for row in rows])
+
+    def append(self, rows):
+        if rows:
+            self._call(lambda sheet: self._append(sheet, rows))
+
+    def records(self, pin_code=None, since=None, until=None):
+        # The sheet has no indexes: this downloads everything and filters locally
+        return [r for r in self._call(lambda sheet: sheet.get_all_records())
+                if (pin_code is None or str(r.get('Pin Code', '')).zfill(5) == pin_code)
+                and (since is None or str(r.get('Timestamp', '')) >= since)
+                and (until is None or str(r.get('Timestamp', '')) < until)]
+
+    def count(self):
+        return max(len(self._call(lambda sheet: sheet.col_values(1))) - 1, 0)
+
+
+class SQLiteStore(ResponseStore):
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' timestamp TEXT,'
+            ' pin_code TEXT,'
+            ' risk_score REAL,'
+            ' data TEXT NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS responses_timestamp ON responses (timestamp);'
+            'CREATE INDEX IF NOT EXISTS responses_pin_code ON responses (pin_code, timestamp);'
+        )
+
+    def append(self, rows):
+        params = [(row.get('Timestamp'), row.get('Pin Code'), row.get('Risk Score'), json.dumps(row))
+                  for row in rows]
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT INTO responses (timestamp, pin_code, risk_score, data) VALUES (?, ?, ?, ?)', params
+            )
+
+    def records(self, pin_code=None, since=None, until=None):
+        clauses, params = [], []
+        if pin_code is not None:
+            clauses.append('pin_code = ?')
+            params.append(pin_code)
+        if since is not None:
+            clauses.append('timestamp >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('timestamp < ?')
+            params.append(until)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            rows = self._db.execute(f'SELECT data FROM responses{where} ORDER BY id', params).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def count(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def create_store(backend='sheets', sheet=None, connection=None, spreadsheet_id=None, **options):
+    if backend == 'sheets':
+        return GoogleSheetsStore(sheet, connection, spreadsheet_id)
+    if backend == 'sqlite':
+        return SQLiteStore(**options)
+    raise ValueError(f"Unknown storage backend {backend!r} (expected 'sheets' or 'sqlite')")
@@ -0,0 +1,280 @@
+"""Local stand-ins for the external services, for benchmarks and load tests.
+
+StubWeatherServer answers OpenWeatherMap-style `/data/2.5/weather` requests
+on localhost, with optional added latency and injected errors:
+
+    with StubWeatherServer(latency=0.05) as server:
+        client = WeatherClient('test-key', api_url=server.url)
+
+FakeSheet implements the part of the gspread Worksheet API the app uses, in
+memory, with the same latency and error knobs. FakeSheetsConnection hands it
+out in place of sheets_client.SheetsConnection.
+
+StubRedisServer speaks enough of the Redis protocol for shared_cache.py
+(PING, GET, MGET, SET with EX/PX, DEL, DBSIZE, FLUSHALL), from memory:
+
+    with StubRedisServer() as redis:
+        backend = RedisBackend(redis.url)
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubWeatherServer:
+    def __init__(self, latency=0.0, error_rate=0.0, temperature=293.15, humidity=60, host='127.0.0.1', port=0,
+                 error_status=503, error_body=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        # Injected errors answer with error_status, and with error_body (e.g. an HTML page) when it is set
+        self.error_status = error_status
+        self.error_body = error_body
+        self.temperature = temperature
+        self.humidity = humidity
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/data/2.5/weather"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; without this, Nagle's algorithm
+            # and delayed ACKs add ~40 ms to every keep-alive response
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                query = parse_qs(urlparse(self.path).query)
+                content_type = 'application/json'
+                if random.random() < stub.error_rate:
+                    status, body = stub.error_status, {'cod': stub.error_status, 'message': 'injected error'}
+                    if stub.error_body is not None:
+                        body, content_type = stub.error_body, 'text/html'
+                elif 'appid' not in query:
+                    status, body = 401, {'cod': 401, 'message': 'Invalid API key'}
+                else:
+                    status, body = 200, {
+                        'coord': {'lat': float(query['lat'][0]), 'lon': float(query['lon'][0])},
+                        'main': {'temp': stub.temperature, 'humidity': stub.humidity},
+                        'cod': 200,
+                    }
+                payload = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stub-weather', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeSheet:
+    def __init__(self, rows=None, latency=0.0, error_rate=0.0):
+        self.rows = [list(r) for r in rows or []]
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def _call(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            raise ConnectionError(f'injected error in {name}')
+
+    def row_values(self, row):
+        self._call('row_values')
+        with self._lock:
+            return list(self.rows[row - 1]) if len(self.rows) >= row else []
+
+    def col_values(self, col):
+        self._call('col_values')
+        with self._lock:
+            return [r[col - 1] for r in self.rows if len(r) >= col]
+
+    def get_all_values(self):
+        self._call('get_all_values')
+        with self._lock:
+            return [list(r) for r in self.rows]
+
+    def get_all_records(self):
+        self._call('get_all_records')
+        with self._lock:
+            if not self.rows:
+                return []
+            header = self.rows[0]
+            return [dict(zip(header, r)) for r in self.rows[1:]]
+
+    def append_row(self, values, **kwargs):
+        self._call('append_row')
+        with self._lock:
+            self.rows.append(list(values))
+
+    def append_rows(self, values, **kwargs):
+        self._call('append_rows')
+        with self._lock:
+            self.rows.extend(list(r) for r in values)
+
+
+class FakeSheetsConnection:
+    """Stands in for SheetsConnection; every spreadsheet id maps to the same FakeSheet."""
+
+    def __init__(self, sheet=None):
+        self.sheet = sheet if sheet is not None else FakeSheet()
+        self.counters = {'invalidations': 0}
+
+    def worksheet(self, spreadsheet_id, index=0):
+        return self.sheet
+
+    def invalidate(self, spreadsheet_id=None):
+        self.counters['invalidations'] += 1
+
+    def stats(self):
+        return dict(self.counters, calls=dict(self.sheet.calls))
+
+
+class StubRedisServer:
+    def __init__(self, latency=0.0, error_rate=0.0, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.data = {}  # key -> (value, expires_at or None)
+        self.commands = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingTCPServer((host, port), self._handler(), bind_and_activate=False)
+        self._server.allow_reuse_address = True
+        self._server.daemon_threads = True
+        self._server.server_bind()
+        self._server.server_activate()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def _lookup(self, key):
+        # Caller holds the lock
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            entry = None
+        return entry
+
+    def execute(self, args):
+        """Reply bytes for one command (a list of bytes arguments)."""
+        name = args[0].decode().upper()
+        with self._lock:
+            self.commands[name] = self.commands.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            return b'-ERR injected error\r\n'
+        with self._lock:
+            if name == 'PING':
+                return b'+PONG\r\n'
+            if name in ('SELECT', 'AUTH'):
+                return b'+OK\r\n'
+            if name == 'GET' and len(args) == 2:
+                entry = self._lookup(args[1])
+                return b'$-1\r\n' if entry is None else b'$%d\r\n%s\r\n' % (len(entry[0]), entry[0])
+            if name == 'MGET' and len(args) > 1:
+                entries = [self._lookup(key) for key in args[1:]]
+                return b'*%d\r\n' % len(entries) + b''.join(
+                    b'$-1\r\n' if e is None else b'$%d\r\n%s\r\n' % (len(e[0]), e[0]) for e in entries)
+            if name == 'SET' and len(args) in (3, 5):
+                expires_at = None
+                if len(args) == 5:
+                    unit = args[3].upper()
+                    if unit not in (b'EX', b'PX'):
+                        return b'-ERR syntax error\r\n'
+                    expires_at = time.monotonic() + int(args[4]) / (1000.0 if unit == b'PX' else 1.0)
+                self.data[args[1]] = (args[2], expires_at)
+                return b'+OK\r\n'
+            if name == 'DEL':
+                removed = sum(self.data.pop(key, None) is not None for key in args[1:])
+                return b':%d\r\n' % removed
+            if name == 'DBSIZE':
+                return b':%d\r\n' % sum(self._lookup(key) is not None for key in list(self.data))
+            if name == 'FLUSHALL':
+                self.data.clear()
+                return b'+OK\r\n'
+        return b"-ERR unknown command '%s'\r\n" % args[0]
+
+    def _handler(self):
+        stub = self
+
+        class Handler(StreamRequestHandler):
+            disable_nagle_algorithm = True
+
+            def _read_command(self):
+                line = self.rfile.readline()
+                if not line.startswith(b'*'):
+                    return None
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int(self.rfile.readline()[1:])
+                    args.append(self.rfile.read(length + 2)[:-2])
+                return args
+
+            def handle(self):
+                while True:
+                    try:
+                        args = self._read_command()
+                    except (OSError, ValueError):
+                        return
+                    if not args:
+                        return
+                    self.wfile.write(stub.execute(args))
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stub-redis', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
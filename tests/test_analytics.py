@@ -0,0 +1,22 @@
+import analytics
+from analytics import Rollups
+
+
+def test_backfill_skips_blank_answer_cells(tmp_path):
+    export = tmp_path / 'responses.csv'
+    export.write_text(
+        'Timestamp,Pin Code,Risk Score,Respiratory Illnesses,Air Quality,Gender\n'
+        '2024-01-01 10:00:00,2108,40.0,"Asthma, Allergies",Good,Female\n'
+        '2024-01-02 10:00:00,02108,60.0,,,Male\n'
+    )
+    db = str(tmp_path / 'analytics.db')
+    assert analytics.main(['--db', db, 'backfill', str(export)]) == 0
+
+    rollups = Rollups(db)
+    answers = rollups.answers()
+    assert {a['value'] for a in answers['Respiratory Illnesses']} == {'Asthma', 'Allergies'}
+    assert answers['Air Quality'] == [{'value': 'Good', 'count': 1, 'mean': 40.0}]
+    assert {a['value'] for a in answers['Gender']} == {'Female', 'Male'}
+    assert not any(a['value'] == 'nan' for values in answers.values() for a in values)
+    assert rollups.total() == 2
+    rollups.close()
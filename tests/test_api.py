@@ -0,0 +1,185 @@
+import asyncio
+
+import numpy as np
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import api
+from feature_store import FeatureStore
+from model_registry import ModelRegistry
+from risk_pipeline import RiskPipeline
+from scenarios import ScenarioEngine
+from stubs import StubWeatherServer
+from weather import WeatherClient
+
+ANSWERS = {'Age': 42, 'Gender': 'Female', 'Respiratory Illnesses': ['Asthma']}
+
+
+@pytest.fixture(scope='module')
+def feature_store():
+    return FeatureStore.load()
+
+
+@pytest.fixture(scope='module')
+def registry():
+    return ModelRegistry()
+
+
+@pytest.fixture
+def weather_server():
+    with StubWeatherServer() as server:
+        yield server
+
+
+def post(pipeline, path, body, components=None):
+    """(status, JSON body) of one request to a fresh app."""
+    async def run():
+        async with TestClient(TestServer(api.create_app(pipeline, components, workers=2))) as client:
+            response = await client.post(path, json=body)
+            return response.status, await response.json()
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def weather_client(weather_server):
+    client = WeatherClient('test-key', api_url=weather_server.url)
+    yield client
+    client.close()
+
+
+def make_pipeline(feature_store, registry, client):
+    return RiskPipeline(feature_store, registry.get, lambda pin, lat, lon: client.get(lat, lon), persist=[].append)
+
+
+def test_score(feature_store, registry, weather_client):
+    pipeline = make_pipeline(feature_store, registry, weather_client)
+    status, body = post(pipeline, '/score', {'pin_code': '02108', 'answers': ANSWERS})
+    assert status == 200
+    assert body['pin_code'] == '02108'
+    assert body['humidity'] == 60
+
+
+@pytest.mark.parametrize('answers, message', [
+    ({'Age': 'abc'}, 'Age must be a whole number'),
+    ({'Age': True}, 'Age must be a whole number'),
+    ({'Respiratory Illnesses': [1, 2]}, 'Respiratory Illnesses must be a list of strings'),
+    ({'Gender': {'a': 1}}, 'Gender must be a string'),
+    ({'Shoe Size': 9}, "Unknown answer field 'Shoe Size'"),
+])
+def test_invalid_answers_are_rejected(feature_store, registry, weather_server, weather_client, answers, message):
+    pipeline = make_pipeline(feature_store, registry, weather_client)
+    status, body = post(pipeline, '/score', {'pin_code': '02108', 'answers': answers})
+    assert status == 400
+    assert message in body['error']
+    status, _ = post(pipeline, '/score/batch', {'requests': [{'pin_code': '02108', 'answers': answers}]})
+    assert status == 400
+    assert weather_server.requests == 0
+
+
+def test_numeric_strings_are_coerced(feature_store, registry, weather_client):
+    pipeline = make_pipeline(feature_store, registry, weather_client)
+    stored = []
+    pipeline.persist = stored.append
+    status, _ = post(pipeline, '/score', {'pin_code': '02108', 'answers': {'Age': '42', 'Years Residence': 6.0}})
+    assert status == 200
+    assert stored[0]['Age'] == 42
+    assert stored[0]['Years Residence'] == 6
+
+
+def test_weather_error_is_a_bad_gateway(feature_store, registry, weather_server, weather_client):
+    weather_server.error_rate = 1.0
+    pipeline = make_pipeline(feature_store, registry, weather_client)
+    status, body = post(pipeline, '/score', {'pin_code': '02108', 'answers': ANSWERS})
+    assert status == 502
+    assert 'weather service error' in body['error']
+
+
+def test_unreachable_weather_service_is_unavailable(feature_store, registry):
+    client = WeatherClient('test-key', api_url='http://127.0.0.1:1/data/2.5/weather')
+    try:
+        status, body = post(make_pipeline(feature_store, registry, client), '/score',
+                            {'pin_code': '02108', 'answers': ANSWERS})
+    finally:
+        client.close()
+    assert status == 503
+    assert 'weather service unavailable' in body['error']
+
+
+def test_unknown_pin_code_is_unprocessable(feature_store, registry, weather_client):
+    pipeline = make_pipeline(feature_store, registry, weather_client)
+    status, body = post(pipeline, '/score', {'pin_code': '99999', 'answers': ANSWERS})
+    assert status == 422
+
+
+@pytest.mark.parametrize('latitude, longitude, message', [
+    (float('nan'), -71.06, 'latitude must be between -90 and 90'),
+    (91, -71.06, 'latitude must be between -90 and 90'),
+    (42.36, float('inf'), 'longitude must be between -180 and 180'),
+    (42.36, -180.5, 'longitude must be between -180 and 180'),
+])
+def test_invalid_coordinates_are_rejected(feature_store, registry, weather_client, latitude, longitude, message):
+    pipeline = make_pipeline(feature_store, registry, weather_client)
+    resolved = []
+    pipeline.resolve_location = lambda *args: resolved.append(args)
+    status, body = post(pipeline, '/score', {'latitude': latitude, 'longitude': longitude, 'answers': ANSWERS})
+    assert status == 400
+    assert body['error'] == message
+    assert resolved == []
+
+
+def test_coordinates_resolve_to_the_nearest_pin_code(feature_store, registry, weather_client):
+    pipeline = make_pipeline(feature_store, registry, weather_client)
+    status, body = post(pipeline, '/score', {'latitude': 42.357, 'longitude': -71.064, 'answers': ANSWERS})
+    assert status == 200
+    assert body['pin_code'] == feature_store.nearest_zip(42.357, -71.064)[0]
+
+
+class RecordingEngine(ScenarioEngine):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+
+    def surface(self, *args):
+        self.calls.append(args)
+        return super().surface(*args)
+
+
+@pytest.fixture
+def scenario_engine(feature_store, registry):
+    return RecordingEngine(feature_store, registry.get)
+
+
+def test_scenarios_score_every_combination(feature_store, registry, weather_server, weather_client, scenario_engine):
+    pipeline = make_pipeline(feature_store, registry, weather_client)
+    status, scored = post(pipeline, '/score', {'pin_code': '02108', 'answers': ANSWERS})
+    assert status == 200
+
+    axes = {'Traffic Density': [-0.2, 0.0, 0.2], 'Humidity': [50, 60]}
+    status, body = post(pipeline, '/scenarios', {'pin_code': '02108', 'axes': axes, 'relative': False,
+                                                  'temperature': weather_server.temperature, 'humidity': 60},
+                        {'scenario_engine': scenario_engine})
+    assert status == 200
+    assert scenario_engine.calls[0][-1] is False
+    scores = np.array(body['scores'])
+    assert scores.shape == (1, 3, 2)
+    # Traffic Density unchanged and the live humidity: the /score result
+    assert scores[0, 1, 1] == pytest.approx(scored['risk_score'])
+    assert body['baseline'] == [pytest.approx(scored['risk_score'])]
+    assert len(np.unique(scores)) == 6
+
+
+@pytest.mark.parametrize('body, message', [
+    # 1 x 1 x 1 by list length, 300,000 scores once flattened
+    ({'axes': {'Traffic Density': [[[0.0] * 300] * 1000]}}, 'expected {"pin_codes"'),
+    ({'axes': {'Traffic Density': ['0.2']}}, 'expected {"pin_codes"'),
+    ({'axes': {'Traffic Density': [True]}}, 'expected {"pin_codes"'),
+    ({'axes': {'Traffic Density': [float('nan')]}}, 'expected {"pin_codes"'),
+    ({'axes': {'Traffic Density': [0.2]}, 'relative': 'false'}, 'relative must be true or false'),
+])
+def test_invalid_scenarios_are_rejected(feature_store, registry, weather_client, scenario_engine, body, message):
+    pipeline = make_pipeline(feature_store, registry, weather_client)
+    status, response = post(pipeline, '/scenarios', {'pin_code': '02108', **body},
+                            {'scenario_engine': scenario_engine})
+    assert status == 400
+    assert response['error'].startswith(message)
+    assert scenario_engine.calls == []
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from persistence_queue import PersistenceQueue
+from storage import GoogleSheetsStore
+from stubs import FakeSheet
+
+HEADER = ['Timestamp', 'Pin Code', 'Risk Score']
+
+
+def response(i):
+    return {'Timestamp': f'2024-01-01 00:00:{i:02d}', 'Pin Code': '02108', 'Risk Score': float(i)}
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / 'queue.db')
+
+
+def test_flush_writes_pending_rows_in_batches(queue_path):
+    sheet = FakeSheet()
+    queue = PersistenceQueue(GoogleSheetsStore(sheet=sheet), path=queue_path, batch_size=2)
+    for i in range(5):
+        queue.put(response(i))
+    assert queue.pending() == 5
+    assert sheet.rows == []
+
+    assert queue.flush() == 5
+    assert queue.pending() == 0
+    assert sheet.calls['append_rows'] == 3
+    assert sheet.rows[0] == HEADER
+    assert [row[2] for row in sheet.rows[1:]] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert queue.stats()['batches'] == 3
+
+
+def test_failed_flush_keeps_rows_for_retry(queue_path):
+    sheet = FakeSheet(error_rate=1.0)
+    queue = PersistenceQueue(GoogleSheetsStore(sheet=sheet), path=queue_path)
+    queue.put(response(0))
+    with pytest.raises(ConnectionError):
+        queue.flush()
+    assert queue.pending() == 1
+
+    sheet.error_rate = 0.0
+    assert queue.flush() == 1
+    assert queue.pending() == 0
+    assert sheet.rows[1:] == [list(response(0).values())]
+
+
+def test_background_flusher_retries_after_injected_error(queue_path):
+    sheet = FakeSheet(error_rate=1.0)
+    queue = PersistenceQueue(GoogleSheetsStore(sheet=sheet), path=queue_path, flush_interval=0.05,
+                             max_backoff=0.1).start()
+    try:
+        queue.put(response(0))
+        deadline = time.monotonic() + 5
+        while queue.stats()['errors'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert queue.stats()['errors'] >= 2
+        assert queue.pending() == 1
+
+        sheet.error_rate = 0.0
+        while queue.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert queue.pending() == 0
+    finally:
+        queue.stop()
+    assert queue.stats()['last_error'] == 'injected error in row_values'
+    assert len(sheet.rows) == 2
+
+
+def test_unflushed_rows_survive_a_restart(queue_path):
+    sheet = FakeSheet()
+    # The first process queues rows and dies without flushing
+    crashed = PersistenceQueue(GoogleSheetsStore(sheet=sheet), path=queue_path)
+    for i in range(3):
+        crashed.put(response(i))
+    crashed._db.close()
+
+    restarted = PersistenceQueue(GoogleSheetsStore(sheet=sheet), path=queue_path)
+    assert restarted.pending() == 3
+    assert restarted.flush() == 3
+    assert [row[2] for row in sheet.rows[1:]] == [0.0, 1.0, 2.0]
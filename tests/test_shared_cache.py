@@ -0,0 +1,145 @@
+import time
+
+import numpy as np
+import pytest
+
+from shared_cache import MmapBackend, RedisBackend, ScoreCache, TieredCache
+from stubs import StubRedisServer
+
+
+@pytest.fixture
+def redis():
+    with StubRedisServer() as server:
+        yield server
+
+
+def make_cache(server, **kw):
+    return TieredCache(RedisBackend(server.url), **kw)
+
+
+class SumModel:
+    n_features = 12
+
+    def predict(self, rows):
+        return np.asarray(rows).sum(axis=1)
+
+
+def test_replicas_share_values(redis):
+    first, second = make_cache(redis), make_cache(redis)
+    first.set('weather:02108', {'humidity': 60}, ttl=60)
+    assert second.get('weather:02108') == {'humidity': 60}
+    assert second.counters['shared_hits'] == 1
+    # Now held locally as well
+    assert second.get('weather:02108') == {'humidity': 60}
+    assert second.counters['hits'] == 1
+    assert redis.commands['GET'] == 1
+
+
+def test_values_expire_in_both_tiers(redis):
+    first, second = make_cache(redis), make_cache(redis)
+    first.set('k', 1, ttl=0.1)
+    assert second.get('k') == 1
+    time.sleep(0.15)
+    assert first.get('k') is None
+    assert second.get('k') is None
+    assert first.counters['expired'] == 1
+    assert make_cache(redis).get('k') is None
+
+
+def test_local_tier_is_bounded_by_entries_and_bytes():
+    cache = TieredCache(max_entries=2)
+    for key in 'abc':
+        cache.set(key, key, ttl=60)
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 2
+    assert cache.counters['evicted'] == 1
+
+    cache = TieredCache(max_bytes=100)
+    cache.set('a', 'x' * 40, ttl=60)
+    cache.set('b', 'x' * 40, ttl=60)
+    assert cache.get('a') is None
+    assert cache.get('b') == 'x' * 40
+    assert cache.stats()['bytes'] <= 100
+    assert cache.counters['evicted'] == 1
+    # Larger than the whole tier: not kept at all
+    cache.set('c', 'x' * 200, ttl=60)
+    assert cache.get('c') is None
+    assert cache.counters['evicted'] == 1
+
+
+def test_backend_errors_fall_back_to_the_local_tier(redis):
+    cache = make_cache(redis, retry_after=0.1)
+    redis.error_rate = 1.0
+    cache.set('k', 1, ttl=60)
+    assert cache.get('k') == 1
+    assert cache.counters['backend_errors'] == 1
+    assert cache.counters['last_backend_error'] == 'SET failed: ERR injected error'
+    assert not cache.stats()['backend_available']
+
+    # Skipped while backing off
+    assert cache.get('missing') is None
+    assert redis.commands.get('GET', 0) == 0
+
+    redis.error_rate = 0.0
+    time.sleep(0.15)
+    cache.set('k', 2, ttl=60)
+    assert make_cache(redis).get('k') == 2
+    assert cache.counters['backend_errors'] == 1
+
+
+def test_get_many_reads_misses_in_one_round_trip(redis):
+    first, second = make_cache(redis), make_cache(redis)
+    for key in 'abc':
+        first.set(key, key.upper(), ttl=60)
+    second.set('d', 'D', ttl=60)
+    redis.commands.clear()
+    assert second.get_many(['a', 'b', 'c', 'd', 'e']) == ['A', 'B', 'C', 'D', None]
+    assert redis.commands == {'MGET': 1}
+    assert second.counters['shared_hits'] == 3
+    assert second.counters['misses'] == 1
+
+
+def test_score_many_fetches_cached_scores_with_one_mget(redis):
+    model = SumModel()
+    computed = []
+
+    def compute(pin_codes, temperatures, humidities):
+        computed.append(len(pin_codes))
+        return temperatures + humidities
+
+    pin_codes = ['02108', '02139', '02115', '02116']
+    temperatures, humidities = np.array([290.0, 291.0, 292.0, 293.0]), np.array([50.0, 60.0, 70.0, 80.0])
+    expected = [340.0, 351.0, 362.0, 373.0]
+    assert ScoreCache(make_cache(redis)).score_many(model, pin_codes, temperatures, humidities, compute) == expected
+
+    redis.commands.clear()
+    replica = ScoreCache(make_cache(redis))
+    assert replica.score_many(model, pin_codes, temperatures, humidities, compute) == expected
+    assert computed == [4]
+    assert redis.commands == {'MGET': 1}
+    assert replica.stats() == {'hits': 4, 'misses': 0}
+
+
+def test_mmap_backend_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'cache.mmap')
+    first, second = MmapBackend(path, slots=64, slot_size=128), MmapBackend(path)
+    first.set('k', b'value', ttl=60)
+    assert second.get('k') == b'value'
+    assert second.mget(['k', 'missing']) == [b'value', None]
+    second.set('k', b'newer', ttl=60)
+    assert first.get('k') == b'newer'
+    first.set('big', b'x' * 200, ttl=60)
+    assert first.get('big') is None
+    assert first.counters['too_large'] == 1
+    first.close()
+    second.close()
+
+
+def test_mmap_backend_overwrites_the_slot_expiring_first(tmp_path):
+    backend = MmapBackend(str(tmp_path / 'cache.mmap'), slots=1, slot_size=128)
+    backend.set('a', b'1', ttl=60)
+    backend.set('b', b'2', ttl=60)
+    assert backend.get('a') is None
+    assert backend.get('b') == b'2'
+    assert backend.counters['overwritten'] == 1
+    backend.close()
@@ -0,0 +1,33 @@
+import pytest
+
+from startup import FAILED, READY, Startup
+
+
+def test_start_builds_each_service_once():
+    calls = []
+    startup = Startup(background=False).add('model', lambda s: calls.append('model') or 'm')
+    startup.start()
+    startup.start()
+    assert startup.result('model') == 'm'
+    assert calls == ['model']
+
+
+def test_failed_service_is_retried_after_min_interval():
+    attempts = []
+
+    def build(startup):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError('sheet unreachable')
+        return 'sheet'
+
+    startup = Startup(background=False).add('storage', build).start()
+    with pytest.raises(ConnectionError):
+        startup.result('storage')
+    assert startup.retry_failed(min_interval=60) == []
+    assert startup._services['storage'].state == FAILED
+
+    assert startup.retry_failed(min_interval=0) == ['storage']
+    assert startup.result('storage') == 'sheet'
+    assert startup._services['storage'].state == READY
+    assert startup.retry_failed(min_interval=0) == []
@@ -0,0 +1,47 @@
+import pytest
+
+from storage import GoogleSheetsStore, ResponseStore, SQLiteStore
+from stubs import FakeSheet
+
+
+def test_sheet_rows_follow_the_existing_header():
+    sheet = FakeSheet([['Timestamp', 'Pin Code', 'Risk Score']])
+    store = GoogleSheetsStore(sheet=sheet)
+    store.append([
+        {'Risk Score': 41.5, 'Timestamp': '2024-01-01 00:00:00', 'Pin Code': '02108'},
+        {'Pin Code': '02139', 'Timestamp': '2024-01-01 00:00:01'},
+    ])
+    assert sheet.rows == [
+        ['Timestamp', 'Pin Code', 'Risk Score'],
+        ['2024-01-01 00:00:00', '02108', 41.5],
+        ['2024-01-01 00:00:01', '02139', ''],
+    ]
+
+
+def test_sheet_header_is_written_once_from_the_first_row():
+    sheet = FakeSheet()
+    store = GoogleSheetsStore(sheet=sheet)
+    store.append([{'Timestamp': 't0', 'Pin Code': '02108'}])
+    store.append([{'Pin Code': '02139', 'Timestamp': 't1'}])
+    assert sheet.rows == [['Timestamp', 'Pin Code'], ['t0', '02108'], ['t1', '02139']]
+    assert sheet.calls['row_values'] == 1
+
+
+def test_sqlite_store_filters_by_pin_code(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'responses.db'))
+    store.append([
+        {'Timestamp': '2024-01-01 00:00:00', 'Pin Code': '02108', 'Risk Score': 40.0},
+        {'Timestamp': '2024-01-02 00:00:00', 'Pin Code': '02139', 'Risk Score': 50.0},
+    ])
+    assert store.count() == 2
+    assert [r['Risk Score'] for r in store.records(pin_code='02139')] == [50.0]
+    store.close()
+
+
+def test_incomplete_store_fails_when_constructed():
+    class AppendOnlyStore(ResponseStore):
+        def append(self, rows):
+            pass
+
+    with pytest.raises(TypeError, match='records'):
+        AppendOnlyStore()
@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+from stubs import StubWeatherServer
+from weather import WeatherClient, WeatherError
+
+
+@pytest.fixture
+def server():
+    with StubWeatherServer() as server:
+        yield server
+
+
+def make_client(server, **kwargs):
+    return WeatherClient('test-key', api_url=server.url, **kwargs)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not met in time')
+        time.sleep(0.01)
+
+
+def test_fetch_returns_weather(server):
+    client = make_client(server)
+    try:
+        data = client.fetch(42.36, -71.06)
+    finally:
+        client.close()
+    assert data['main'] == {'temp': 293.15, 'humidity': 60}
+    assert server.requests == 1
+
+
+def test_get_within_ttl_hits_cache(server):
+    client = make_client(server, ttl=60)
+    try:
+        first = client.get(42.36, -71.06)
+        # Rounds to the same key at the default precision
+        second = client.get(42.361, -71.059)
+        stats = client.stats()
+    finally:
+        client.close()
+    assert first == second
+    assert server.requests == 1
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+
+
+def test_concurrent_misses_share_one_request(server):
+    server.latency = 0.2
+    client = make_client(server)
+    results = []
+    start = threading.Barrier(8)
+
+    def lookup():
+        start.wait()
+        results.append(client.get(42.36, -71.06))
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = client.stats()
+    finally:
+        client.close()
+    assert len(results) == 8
+    assert server.requests == 1
+    assert stats['misses'] == 1
+    assert stats['coalesced'] == 7
+
+
+def test_stale_entry_is_served_while_refreshing(server):
+    client = make_client(server, ttl=0.05, stale_ttl=60)
+    try:
+        client.get(42.36, -71.06)
+        time.sleep(0.1)
+        server.latency = 0.2
+        started = time.perf_counter()
+        stale = client.get(42.36, -71.06)
+        elapsed = time.perf_counter() - started
+        assert stale['main']['temp'] == 293.15
+        # The stale value comes back without waiting for the upstream request
+        assert elapsed < 0.1
+        assert client.stats()['stale_hits'] == 1
+        wait_for(lambda: server.requests == 2 and not client.stats()['inflight'])
+        server.temperature = 300.0
+        assert client.get(42.36, -71.06)['main']['temp'] == 293.15
+        assert client.stats()['refreshes'] == 1
+    finally:
+        client.close()
+
+
+def test_expired_entry_is_fetched_again(server):
+    client = make_client(server, ttl=0.05, stale_ttl=0.05)
+    try:
+        client.get(42.36, -71.06)
+        time.sleep(0.1)
+        server.temperature = 300.0
+        assert client.get(42.36, -71.06)['main']['temp'] == 300.0
+    finally:
+        client.close()
+    assert server.requests == 2
+
+
+def test_upstream_error_raises_and_is_not_cached(server):
+    server.error_rate = 1.0
+    client = make_client(server)
+    try:
+        with pytest.raises(WeatherError, match='injected error'):
+            client.get(42.36, -71.06)
+        assert client.stats()['errors'] == 1
+        server.error_rate = 0.0
+        assert client.get(42.36, -71.06)['main']['humidity'] == 60
+    finally:
+        client.close()
+    assert server.requests == 2
+
+
+def test_html_error_page_raises_weather_error(server):
+    server.error_rate = 1.0
+    server.error_status = 502
+    server.error_body = '<html><body>502 Bad Gateway</body></html>'
+    client = make_client(server)
+    try:
+        with pytest.raises(WeatherError, match='HTTP 502'):
+            client.fetch(42.36, -71.06)
+    finally:
+        client.close()
+
+
+def test_invalid_api_key_raises(server):
+    # requests drops a None parameter, so the request goes out without appid
+    client = WeatherClient(None, api_url=server.url)
+    try:
+        with pytest.raises(WeatherError, match='Invalid API key'):
+            client.fetch(42.36, -71.06)
+    finally:
+        client.close()
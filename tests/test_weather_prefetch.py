@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from stubs import StubWeatherServer
+from weather import WeatherClient
+from weather_prefetch import WeatherPrefetcher
+
+LOCATIONS = {'02108': (42.36, -71.06), '02139': (42.36, -71.10)}
+
+
+@pytest.fixture
+def prefetcher():
+    with StubWeatherServer() as server:
+        client = WeatherClient('test-key', api_url=server.url)
+        # Not started: the tests drive refresh() themselves
+        prefetcher = WeatherPrefetcher(client, LOCATIONS, interval=300, retry_delay=10, max_backoff=35)
+        yield server, prefetcher
+        prefetcher._pool.shutdown(wait=True)
+        client.close()
+
+
+def delay(prefetcher, key):
+    return prefetcher._next_due[key] - time.monotonic()
+
+
+def test_refresh_publishes_and_schedules_next_round(prefetcher):
+    server, prefetcher = prefetcher
+    published = prefetcher.refresh(list(LOCATIONS))
+    assert set(published) == set(LOCATIONS)
+    assert prefetcher.lookup('02108', *LOCATIONS['02108'])['main']['humidity'] == 60
+    assert delay(prefetcher, '02108') == pytest.approx(300, abs=1)
+
+
+def test_failures_retry_sooner_then_back_off(prefetcher):
+    server, prefetcher = prefetcher
+    prefetcher.refresh(['02108'])
+    server.error_rate = 1.0
+    delays = []
+    for _ in range(4):
+        assert prefetcher.refresh(['02108']) == {}
+        delays.append(delay(prefetcher, '02108'))
+    # retry_delay, doubling, capped at max_backoff
+    assert delays == pytest.approx([10, 20, 35, 35], abs=1)
+    # The last good snapshot is still served
+    assert prefetcher.get('02108') is not None
+    assert prefetcher.stats()['backing_off'] == 1
+
+    server.error_rate = 0.0
+    prefetcher.refresh(['02108'])
+    assert delay(prefetcher, '02108') == pytest.approx(300, abs=1)
+    assert prefetcher.stats()['backing_off'] == 0
@@ -0,0 +1,181 @@
+"""Per-stage latency histograms for the Calculate Risk Score pipeline.
+
+Disabled by default; set NECX_TRACING=1 (or `[tracing] enabled = true` in the
+app secrets) to record. While disabled, `tracer.span(...)` hands out one
+shared no-op context manager, so instrumented code pays a single attribute
+check.
+
+    with tracer.span('inference'):
+        scores = model.predict(rows)
+
+Stages: calculate (the whole Calculate handler), weather (lookup incl. cache),
+weather_fetch (upstream request), feature_assembly, scaling (folded into the
+first layer for the NumPy model), inference, explain (per-factor
+contributions), persistence (enqueue) and persistence_flush (the bulk write to
+the response store).
+
+Stages are aggregated into fixed-bucket histograms (2x steps from 1 us to
+~67 s) with p50/p95/p99 estimates, and exported in the Prometheus text format
+by `prometheus()` or by a small HTTP endpoint from `serve(port)`.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from itertools import accumulate
+
+BUCKETS = tuple(1e-6 * 2 ** i for i in range(27))
+METRIC_NAME = 'risk_pipeline_stage_seconds'
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect_left(self.bounds, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+            self.count += 1
+            if seconds > self.max:
+                self.max = seconds
+
+    def quantile(self, q):
+        """Estimate by linear interpolation inside the bucket holding the q-th observation."""
+        with self._lock:
+            counts, largest = list(self.counts), self.max
+        cumulative = list(accumulate(counts))
+        if not cumulative[-1]:
+            return None
+        rank = q * cumulative[-1]
+        i = bisect_left(cumulative, rank)
+        if i >= len(self.bounds):
+            return largest
+        lower = self.bounds[i - 1] if i else 0.0
+        below = cumulative[i - 1] if i else 0
+        estimate = lower + (self.bounds[i] - lower) * (rank - below) / counts[i]
+        return min(estimate, largest)
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'start')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.observe(self.name, time.perf_counter() - self.start)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Tracer:
+    def __init__(self, enabled=False, buckets=BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else _NOOP
+
+    def observe(self, name, seconds):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram(self.buckets))
+        histogram.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+    def snapshot(self):
+        """{stage: {count, mean_ms, p50_ms, p95_ms, p99_ms}}"""
+        summary = {}
+        for name, histogram in sorted(self._histograms.items()):
+            if not histogram.count:
+                continue
+            summary[name] = {
+                'count': histogram.count,
+                'mean_ms': histogram.sum / histogram.count * 1000.0,
+                **{f'p{p}_ms': histogram.quantile(p / 100) * 1000.0 for p in (50, 95, 99)},
+            }
+        return summary
+
+    def prometheus(self):
+        lines = [
+            f'# HELP {METRIC_NAME} Time spent per Calculate Risk Score pipeline stage.',
+            f'# TYPE {METRIC_NAME} histogram',
+        ]
+        for name, histogram in sorted(self._histograms.items()):
+            with histogram._lock:
+                counts = list(histogram.counts)
+                total, count = histogram.sum, histogram.count
+            cumulative = list(accumulate(counts))
+            for bound, n in zip(histogram.bounds, cumulative):
+                lines.append(f'{METRIC_NAME}_bucket{{stage="{name}",le="{bound:.6g}"}} {n}')
+            lines.append(f'{METRIC_NAME}_bucket{{stage="{name}",le="+Inf"}} {cumulative[-1]}')
+            lines.append(f'{METRIC_NAME}_sum{{stage="{name}"}} {total:.9f}')
+            lines.append(f'{METRIC_NAME}_count{{stage="{name}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        """Expose prometheus() at http://host:port/metrics from a daemon thread."""
+        # Imported here: http.server costs ~30 ms, and the app imports this module before its first page
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        if self._server is not None:
+            return self._server
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                payload = tracer.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name='tracing-metrics', daemon=True).start()
+        return self._server
+
+
+tracer = Tracer(enabled=os.environ.get('NECX_TRACING', '') == '1')
@@ -0,0 +1,304 @@
+"""Train the risk score model and write versioned artifacts.
+
+Streams dataset.xlsx (or a larger .csv / .parquet with the same columns) in
+chunks: one pass fits the StandardScaler, then every epoch streams the rows
+again through tf.data, so the source never has to fit in memory. Every
+`--validation-fraction` of the rows, picked by a hash of the row number, is
+held out for early stopping and the reported metrics.
+
+Each trained network is written to models/<version>/ as the .h5 model, the
+scaler pickle and the NumPy .npz artifact, plus metadata.json with the
+feature order, architecture, validation metrics, NumPy inference latency and
+SHA-256 hashes of the source and artifacts. Serve a version with
+`model_version = "<version>"` (or "latest") in the app secrets. models/ is
+not tracked by git; ship a version by copying its directory.
+
+    python train.py fit dataset.xlsx
+    python train.py fit dataset.xlsx --hidden 64,32,16 --hidden 32,16 --hidden 16,8 --hidden 8
+    python train.py list
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from batch_score import read_chunks
+from features import FEATURE_NAMES
+from model_registry import MODEL_PATH, MODELS_DIR, METADATA_FILE, SCALER_PATH, list_versions
+from numpy_model import ARTIFACT_PATH, NumpyRiskModel, export_artifact
+
+TARGET_COLUMN = 'Risk Score'
+DEFAULT_HIDDEN = (64, 32, 16)
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _validation_mask(start, n, fraction):
+    # Multiplicative hash of the row number, so the split does not depend on the chunk size
+    index = np.arange(start, start + n, dtype=np.uint64)
+    return ((index * np.uint64(2654435761)) % np.uint64(2**32)) < np.uint64(fraction * 2**32)
+
+
+def stream_rows(path, chunk_size=50000, validation_fraction=0.2, split='train'):
+    """(features, target) chunks of one split of the training source."""
+    start = 0
+    for frame in read_chunks(path, chunk_size):
+        missing = [c for c in FEATURE_NAMES + [TARGET_COLUMN] if c not in frame.columns]
+        if missing:
+            raise ValueError(f"{path} is missing the columns {missing}")
+        frame = frame.dropna(subset=FEATURE_NAMES + [TARGET_COLUMN])
+        features = frame[FEATURE_NAMES].to_numpy(dtype=np.float64)
+        target = frame[TARGET_COLUMN].to_numpy(dtype=np.float64)
+        validation = _validation_mask(start, len(frame), validation_fraction)
+        start += len(frame)
+        keep = validation if split == 'validation' else ~validation
+        yield features[keep], target[keep]
+
+
+def fit_scaler(path, chunk_size=50000, validation_fraction=0.2):
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    rows = 0
+    for features, _ in stream_rows(path, chunk_size, validation_fraction):
+        if len(features):
+            scaler.partial_fit(features)
+            rows += len(features)
+    if not rows:
+        raise ValueError(f"No training rows in {path}")
+    return scaler, rows
+
+
+def _dataset(path, scaler, split, batch_size, chunk_size, validation_fraction, shuffle_buffer=None, cache=False):
+    import tensorflow as tf
+
+    def rows():
+        for features, target in stream_rows(path, chunk_size, validation_fraction, split):
+            yield from zip(scaler.transform(features).astype(np.float32), target.astype(np.float32))
+
+    dataset = tf.data.Dataset.from_generator(rows, output_signature=(
+        tf.TensorSpec((len(FEATURE_NAMES),), tf.float32), tf.TensorSpec((), tf.float32)))
+    if cache:
+        dataset = dataset.cache()
+    if shuffle_buffer:
+        dataset = dataset.shuffle(shuffle_buffer, seed=0, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def build_model(hidden, learning_rate=1e-3):
+    from tensorflow import keras
+
+    model = keras.Sequential([keras.Input((len(FEATURE_NAMES),))]
+                             + [keras.layers.Dense(units, activation='relu') for units in hidden]
+                             + [keras.layers.Dense(1)])
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate), loss='mse')
+    return model
+
+
+def evaluate(predictor, path, chunk_size=50000, validation_fraction=0.2, split='validation'):
+    """MAE, RMSE and R^2 of a NumPy predictor on one split, accumulated chunk by chunk."""
+    n = abs_error = squared_error = target_sum = target_squares = 0.0
+    for features, target in stream_rows(path, chunk_size, validation_fraction, split):
+        if not len(target):
+            continue
+        error = predictor.predict(features) - target
+        n += len(target)
+        abs_error += np.abs(error).sum()
+        squared_error += (error ** 2).sum()
+        target_sum += target.sum()
+        target_squares += (target ** 2).sum()
+    if not n:
+        return {'rows': 0}
+    variance = target_squares - target_sum ** 2 / n
+    return {
+        'rows': int(n),
+        'mae': abs_error / n,
+        'rmse': (squared_error / n) ** 0.5,
+        'r2': 1 - squared_error / variance if variance else None,
+    }
+
+
+def measure_latency(predictor, batch_size=1024, repeat=200):
+    """Median NumPy inference time for one row and per row of a batch, in microseconds."""
+    rng = np.random.default_rng(0)
+
+    def median_seconds(rows, runs):
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            predictor.predict(rows)
+            samples.append(time.perf_counter() - start)
+        return float(np.median(samples))
+
+    single = rng.uniform(0, 100, (1, predictor.n_features))
+    batch = rng.uniform(0, 100, (batch_size, predictor.n_features))
+    median_seconds(single, 10)
+    return {
+        'single_row_us': median_seconds(single, repeat) * 1e6,
+        'batch_per_row_us': median_seconds(batch, max(repeat // 10, 5)) * 1e6 / batch_size,
+        'batch_size': batch_size,
+    }
+
+
+def save_version(model, scaler, metadata, models_dir=MODELS_DIR):
+    """Write the artifacts to models/<version>/; returns the version name and its metadata."""
+    os.makedirs(models_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=models_dir)
+    try:
+        model_path = os.path.join(staging, os.path.basename(MODEL_PATH))
+        scaler_path = os.path.join(staging, os.path.basename(SCALER_PATH))
+        artifact_path = os.path.join(staging, os.path.basename(ARTIFACT_PATH))
+        model.save(model_path)
+        with open(scaler_path, 'wb') as f:
+            pickle.dump(scaler, f)
+        export_artifact(model_path, scaler_path, artifact_path)
+
+        hashes = {os.path.basename(p): _file_hash(p) for p in (model_path, scaler_path, artifact_path)}
+        created_at = datetime.now(timezone.utc)
+        # The .npz holds every served weight, so its hash identifies the model
+        version = f"{created_at:%Y%m%d-%H%M%S}-{hashes[os.path.basename(ARTIFACT_PATH)][:8]}"
+        metadata = dict(metadata, version=version, created_at=created_at.isoformat(timespec='seconds'),
+                        artifact_hashes=hashes)
+        with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=2)
+        # Readers only ever see complete version directories
+        os.rename(staging, os.path.join(models_dir, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return version, metadata
+
+
+def train(path, hidden=DEFAULT_HIDDEN, epochs=200, batch_size=32, learning_rate=1e-3, patience=20,
+          chunk_size=50000, validation_fraction=0.2, cache=False, seed=0, models_dir=MODELS_DIR,
+          scaler=None, source_hash=None):
+    """Fit one network and save it as a new version; returns its metadata."""
+    from tensorflow import keras
+
+    keras.utils.set_random_seed(seed)
+    if scaler is None:
+        scaler, _ = fit_scaler(path, chunk_size, validation_fraction)
+    settings = dict(batch_size=batch_size, chunk_size=chunk_size, validation_fraction=validation_fraction,
+                    cache=cache)
+    train_data = _dataset(path, scaler, 'train', shuffle_buffer=10000, **settings)
+    validation_data = _dataset(path, scaler, 'validation', **settings)
+
+    model = build_model(hidden, learning_rate)
+    start = time.perf_counter()
+    history = model.fit(train_data, validation_data=validation_data, epochs=epochs, verbose=0, callbacks=[
+        keras.callbacks.EarlyStopping(patience=patience, restore_best_weights=True)])
+    train_seconds = time.perf_counter() - start
+
+    # Metrics and latency are measured on the NumPy predictor that serves the version
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path, scaler_path = os.path.join(tmp, 'model.h5'), os.path.join(tmp, 'scaler.pkl')
+        model.save(model_path)
+        with open(scaler_path, 'wb') as f:
+            pickle.dump(scaler, f)
+        predictor = NumpyRiskModel.load(export_artifact(model_path, scaler_path, os.path.join(tmp, 'model.npz')))
+
+    metadata = {
+        'feature_names': FEATURE_NAMES,
+        'target': TARGET_COLUMN,
+        'architecture': {'hidden': list(hidden), 'activation': 'relu',
+                         'parameters': int(model.count_params())},
+        'training': {
+            'source': os.path.abspath(path),
+            'source_sha256': source_hash or _file_hash(path),
+            'epochs_run': len(history.history['loss']),
+            'batch_size': batch_size,
+            'learning_rate': learning_rate,
+            'validation_fraction': validation_fraction,
+            'seed': seed,
+            'seconds': train_seconds,
+        },
+        'metrics': {
+            'train': evaluate(predictor, path, chunk_size, validation_fraction, 'train'),
+            'validation': evaluate(predictor, path, chunk_size, validation_fraction, 'validation'),
+        },
+        'latency': measure_latency(predictor),
+    }
+    _, metadata = save_version(model, scaler, metadata, models_dir)
+    return metadata
+
+
+def _parse_hidden(value):
+    return tuple(int(units) for units in value.split(',') if units.strip())
+
+
+def _summary(metadata):
+    validation = {k: float('nan') if v is None else v for k, v in metadata['metrics']['validation'].items()}
+    latency = metadata['latency']
+    return (f"{metadata['version']:<26} {','.join(map(str, metadata['architecture']['hidden'])):<12} "
+            f"{metadata['architecture']['parameters']:>7} {validation.get('mae', float('nan')):>8.3f} "
+            f"{validation.get('rmse', float('nan')):>8.3f} {validation.get('r2', float('nan')):>7.4f} "
+            f"{latency['single_row_us']:>10.1f} {latency['batch_per_row_us']:>10.3f}")
+
+
+SUMMARY_HEADER = (f"{'version':<26} {'hidden':<12} {'params':>7} {'val MAE':>8} {'val RMSE':>8} {'val R2':>7} "
+                  f"{'1-row us':>10} {'us/row':>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    fit = sub.add_parser('fit', help='Train one or more architectures and save each as a version')
+    fit.add_argument('data', help='.xlsx, .csv or .parquet with the FEATURE_NAMES columns and Risk Score')
+    fit.add_argument('--hidden', type=_parse_hidden, action='append',
+                     help='Comma-separated hidden layer widths; repeat to compare architectures (default 64,32,16)')
+    fit.add_argument('--epochs', type=int, default=200)
+    fit.add_argument('--batch-size', type=int, default=32)
+    fit.add_argument('--learning-rate', type=float, default=1e-3)
+    fit.add_argument('--patience', type=int, default=20, help='Epochs without validation improvement before stopping')
+    fit.add_argument('--chunk-size', type=int, default=50000)
+    fit.add_argument('--validation-fraction', type=float, default=0.2)
+    fit.add_argument('--cache', action='store_true', help='Keep the scaled rows in memory after the first epoch')
+    fit.add_argument('--seed', type=int, default=0)
+    fit.add_argument('--models-dir', default=MODELS_DIR)
+    fit.add_argument('--report', help='Also write the metadata of every trained version to this JSON file')
+
+    listing = sub.add_parser('list', help='Show the trained versions')
+    listing.add_argument('--models-dir', default=MODELS_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == 'list':
+        print(SUMMARY_HEADER)
+        for metadata in list_versions(args.models_dir):
+            print(_summary(metadata))
+        return 0
+
+    # The scaler and source hash are shared by every architecture in the comparison
+    scaler, rows = fit_scaler(args.data, args.chunk_size, args.validation_fraction)
+    source_hash = _file_hash(args.data)
+    print(f"Fitted scaler on {rows} training rows of {args.data}", file=sys.stderr)
+    trained = []
+    print(SUMMARY_HEADER)
+    for hidden in args.hidden or [DEFAULT_HIDDEN]:
+        metadata = train(args.data, hidden, args.epochs, args.batch_size, args.learning_rate, args.patience,
+                         args.chunk_size, args.validation_fraction, args.cache, args.seed, args.models_dir,
+                         scaler=scaler, source_hash=source_hash)
+        trained.append(metadata)
+        print(_summary(metadata), flush=True)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(trained, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""OpenWeatherMap client with a TTL cache shared by all sessions.
+
+Lookups are keyed by coordinates rounded to `precision` decimals (0.01° is
+about 1 km), or by an explicit key such as the zip code. Concurrent misses
+on the same key share one upstream request, and entries past their TTL are
+still served while a background refresh fetches the new value.
+
+With a shared_cache (shared_cache.TieredCache), upstream fetches go through
+it, so replicas sharing its backend fetch each location once per `shared_ttl`
+between them.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+WEATHER_API_URL = "https://api.openweathermap.org/data/2.5/weather"
+
+
+class WeatherError(Exception):
+    """OpenWeatherMap answered with an error status."""
+
+
+class WeatherClient:
+    def __init__(self, api_key, api_url=WEATHER_API_URL, ttl=600, stale_ttl=3600, precision=2,
+                 connect_timeout=3.05, read_timeout=10, pool_size=10, max_entries=10000, refresh_workers=4,
+                 shared_cache=None, shared_ttl=300):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.precision = precision
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_entries = max_entries
+        self.shared_cache = shared_cache
+        self.shared_ttl = shared_ttl
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (data, fetched_at)
+        self._inflight = {}  # key -> Future of the upstream request
+        self._refresh_pool = ThreadPoolExecutor(refresh_workers, thread_name_prefix='weather-refresh')
+        self.counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0,
+                         'refreshes': 0, 'requests': 0, 'errors': 0}
+
+    def key_for(self, lat, lon):
+        return (round(float(lat), self.precision), round(float(lon), self.precision))
+
+    def fetch(self, lat, lon):
+        """Fresh weather: from the shared cache when another replica fetched it recently, else the API."""
+        if self.shared_cache is None:
+            return self._request(lat, lon)
+        key = 'weather:%s:%s' % self.key_for(lat, lon)
+        return self.shared_cache.get_or_compute(key, lambda: self._request(lat, lon), self.shared_ttl)
+
+    def _request(self, lat, lon):
+        # One uncached request to the API
+        params = {
+            'lat': lat,
+            'lon': lon,
+            'appid': self.api_key
+        }
+        with self._lock:
+            self.counters['requests'] += 1
+        with tracer.span('weather_fetch'):
+            response = self.session.get(self.api_url, params=params, timeout=self.timeout)
+        # Gateways in front of the API answer errors with HTML, so check the status before parsing
+        if response.status_code != 200:
+            try:
+                message = response.json().get('message', 'Unknown error')
+            except ValueError:
+                message = f'HTTP {response.status_code}'
+            raise WeatherError(message)
+        try:
+            return response.json()
+        except ValueError:
+            raise WeatherError('Invalid JSON in weather response') from None
+
+    def get(self, lat, lon, key=None):
+        key = key if key is not None else self.key_for(lat, lon)
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.monotonic() - entry[1] if entry else None
+            if entry and age < self.ttl:
+                self.counters['hits'] += 1
+                return entry[0]
+            if entry and age < self.stale_ttl:
+                self.counters['stale_hits'] += 1
+                if key not in self._inflight:
+                    self.counters['refreshes'] += 1
+                    future = self._inflight[key] = Future()
+                    self._refresh_pool.submit(self._fetch_into, key, lat, lon, future)
+                return entry[0]
+
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                self.counters['misses'] += 1
+                future = self._inflight[key] = Future()
+            else:
+                self.counters['coalesced'] += 1
+        if leader:
+            self._fetch_into(key, lat, lon, future)
+        return future.result()
+
+    def _fetch_into(self, key, lat, lon, future):
+        try:
+            data = self.fetch(lat, lon)
+        except Exception as e:
+            logger.warning('Weather fetch for %s failed: %s', key, e)
+            with self._lock:
+                self.counters['errors'] += 1
+                del self._inflight[key]
+            future.set_exception(e)
+            return
+        self.put(key, data)
+        with self._lock:
+            del self._inflight[key]
+        future.set_result(data)
+
+    def put(self, key, data, fetched_at=None):
+        with self._lock:
+            self._entries[key] = (data, time.monotonic() if fetched_at is None else fetched_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries), inflight=len(self._inflight))
+
+    def close(self):
+        self._refresh_pool.shutdown(wait=True)
+        self.session.close()
@@ -0,0 +1,111 @@
+"""Background refresh of the weather for every configured zip code.
+
+A scheduler thread re-fetches each location every `interval` seconds through a
+thread pool and publishes the results as a new snapshot dict. Readers only do
+a dict lookup on the current snapshot, so the request path never waits on the
+network. A failing location is retried after `retry_delay` seconds, doubling
+with each further failure up to `max_backoff`, without holding up the others;
+its last good snapshot stays published meanwhile.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+WeatherSnapshot = namedtuple('WeatherSnapshot', ['data', 'fetched_at'])
+
+
+class WeatherPrefetcher:
+    def __init__(self, client, locations, interval=300, max_workers=8, retry_delay=15,
+                 max_backoff=1800):
+        # locations: zip code -> (lat, lon)
+        self.client = client
+        self.locations = dict(locations)
+        self.interval = interval
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self._snapshot = {}
+        self._failures = {}
+        self._next_due = {key: 0.0 for key in self.locations}
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix='weather-prefetch')
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='weather-prefetcher', daemon=True)
+        self.counters = {'rounds': 0, 'fetched': 0, 'errors': 0}
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self._pool.shutdown(wait=True)
+
+    def get(self, key, max_age=None):
+        snapshot = self._snapshot.get(key)
+        if snapshot is None or (max_age is not None and time.time() - snapshot.fetched_at > max_age):
+            return None
+        return snapshot
+
+    def lookup(self, key, lat, lon):
+        """The prefetched weather for `key`, or the client's cached lookup when it is missing or too old."""
+        snapshot = self.get(key, max_age=self.client.stale_ttl)
+        if snapshot is not None:
+            return snapshot.data
+        return self.client.get(lat, lon)
+
+    def age(self, key):
+        snapshot = self._snapshot.get(key)
+        return None if snapshot is None else time.time() - snapshot.fetched_at
+
+    def _fetch(self, key):
+        lat, lon = self.locations[key]
+        data = self.client.fetch(lat, lon)
+        # Prime the shared cache too, so coordinate lookups for this zip hit as well
+        self.client.put(self.client.key_for(lat, lon), data)
+        return data
+
+    def refresh(self, keys):
+        futures = {key: self._pool.submit(self._fetch, key) for key in keys}
+        published = {}
+        now = time.monotonic()
+        for key, future in futures.items():
+            try:
+                published[key] = WeatherSnapshot(future.result(), time.time())
+            except Exception as e:
+                failures = self._failures.get(key, 0) + 1
+                self._failures[key] = failures
+                self._next_due[key] = now + min(self.retry_delay * 2 ** (failures - 1), self.max_backoff)
+                self.counters['errors'] += 1
+                logger.warning('Prefetch for %s failed (%d in a row): %s', key, failures, e)
+                continue
+            self._failures.pop(key, None)
+            self._next_due[key] = now + self.interval
+        if published:
+            # Swap in a new dict so readers never see a half-updated snapshot
+            snapshot = dict(self._snapshot)
+            snapshot.update(published)
+            self._snapshot = snapshot
+        self.counters['rounds'] += 1
+        self.counters['fetched'] += len(published)
+        return published
+
+    def _run(self):
+        while not self._stopped.is_set():
+            now = time.monotonic()
+            due = [key for key, at in self._next_due.items() if at <= now]
+            if due:
+                try:
+                    self.refresh(due)
+                except Exception:
+                    logger.exception('Weather prefetch round failed')
+            wait = min(self._next_due.values(), default=now + self.interval) - time.monotonic()
+            self._stopped.wait(max(wait, 1.0))
+
+    def stats(self):
+        ages = [time.time() - s.fetched_at for s in self._snapshot.values()]
+        return dict(self.counters, locations=len(self.locations), published=len(ages),
+                    backing_off=len(self._failures), max_age=max(ages, default=None))